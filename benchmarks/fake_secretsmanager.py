@@ -0,0 +1,338 @@
+"""
+An in-process fake of the Secrets Manager JSON API.
+
+The fake hooks into botocore's `before-send` event, so requests go through the
+real serializer, signer, retry handler and parser and only the HTTP round trip is
+replaced. Per-call latency and a throttling rate can be injected, and every call is
+counted by operation.
+"""
+
+import re
+import json
+import time
+import uuid
+import random
+import string
+import threading
+from collections import Counter
+
+from botocore.awsrequest import AWSResponse
+
+ACCOUNT = "123456789012"
+WORD_SEPARATORS = re.compile(r"[/_+=.@\-\s]+")
+
+
+class FakeError(Exception):
+    def __init__(self, code, message="", status=400):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+
+class _Raw:
+    def __init__(self, body):
+        self._body = body
+
+    def stream(self, **kwargs):
+        yield self._body
+
+
+def _matches(field, value):
+    if field is None:
+        return False
+    value = value.lower()
+    field = field.lower()
+    return field.startswith(value) or any(word.startswith(value) for word in WORD_SEPARATORS.split(field))
+
+
+class FakeSecretsManager:
+    def __init__(self, latency=0.0, throttle_rate=0.0, region="us-west-1", seed=0):
+        """
+        :param latency: Seconds each call sleeps before answering.
+        :param throttle_rate: The fraction of calls answered with a ThrottlingException.
+        :param region: The region used in ARNs.
+        :param seed: Seed for the throttling decisions, so runs are repeatable.
+        """
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.region = region
+        self.calls = Counter()
+        self.throttled = 0
+        self.bytes_out = 0
+        self._secrets = {}
+        self._arns = {}
+        self._sorted = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # -- setup ------------------------------------------------------------------
+
+    def attach(self, client):
+        client.meta.events.register("before-send.secrets-manager", self._handle)
+        return client
+
+    def seed(self, count, prefix="projects/dev/", keys=8):
+        """Creates `count` secrets holding a JSON object with `keys` keys each."""
+        now = time.time()
+        for i in range(count):
+            name = f"{prefix}project-{i:06d}"
+            value = json.dumps({f"KEY_{k}": f"value-{i}-{k}" for k in range(keys)})
+            self._create(name, value, None, f"seeded secret {i}", [{"Key": "team", "Value": f"team-{i % 10}"}], now)
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+            self.throttled = 0
+            self.bytes_out = 0
+
+    # -- transport --------------------------------------------------------------
+
+    def _handle(self, request, **kwargs):
+        target = request.headers["X-Amz-Target"]
+        target = target.decode() if isinstance(target, bytes) else target
+        operation = target.split(".")[-1]
+        body = json.loads(request.body or b"{}")
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[operation] += 1
+            throttle = self.throttle_rate and self._random.random() < self.throttle_rate
+            if throttle:
+                self.throttled += 1
+        handler = getattr(self, f"op_{operation}", None)
+        try:
+            if throttle:
+                raise FakeError("ThrottlingException", "Rate exceeded")
+            if handler is None:
+                raise FakeError("UnknownOperationException", operation)
+            with self._lock:
+                status, payload = 200, handler(body)
+        except FakeError as e:
+            status, payload = e.status, {"__type": e.code, "message": e.message}
+        raw = json.dumps(payload).encode("utf8")
+        with self._lock:
+            self.bytes_out += len(raw)
+        headers = {"x-amzn-requestid": str(uuid.uuid4()), "content-type": "application/x-amz-json-1.1"}
+        return AWSResponse(request.url, status, headers, _Raw(raw))
+
+    # -- state helpers ----------------------------------------------------------
+
+    def _create(self, name, secret_string, secret_binary, description, tags, now):
+        if name in self._secrets:
+            raise FakeError("ResourceExistsException", f"secret {name} already exists")
+        suffix = "".join(self._random.choice(string.ascii_letters) for _ in range(6))
+        arn = f"arn:aws:secretsmanager:{self.region}:{ACCOUNT}:secret:{name}-{suffix}"
+        secret = {
+            "ARN": arn,
+            "Name": name,
+            "Description": description,
+            "Tags": tags or [],
+            "CreatedDate": now,
+            "LastChangedDate": now,
+            "versions": {},
+        }
+        self._secrets[name] = secret
+        self._arns[arn] = name
+        self._sorted.clear()
+        if secret_string is not None or secret_binary is not None:
+            self._put(secret, secret_string, secret_binary, ["AWSCURRENT"], now)
+        return secret
+
+    def _put(self, secret, secret_string, secret_binary, stages, now):
+        version_id = str(uuid.uuid4())
+        for stage in stages:
+            self._move_stage(secret, stage, version_id)
+        secret["versions"][version_id] = {
+            "SecretString": secret_string,
+            "SecretBinary": secret_binary,
+            "stages": list(stages),
+            "CreatedDate": now,
+        }
+        secret["LastChangedDate"] = now
+        self._sorted.clear()
+        return version_id
+
+    def _move_stage(self, secret, stage, version_id):
+        for other_id, version in secret["versions"].items():
+            if stage in version["stages"] and other_id != version_id:
+                version["stages"].remove(stage)
+                if stage == "AWSCURRENT":
+                    for previous in secret["versions"].values():
+                        if "AWSPREVIOUS" in previous["stages"]:
+                            previous["stages"].remove("AWSPREVIOUS")
+                    version["stages"].append("AWSPREVIOUS")
+        version = secret["versions"].get(version_id)
+        if version is not None and stage not in version["stages"]:
+            version["stages"].append(stage)
+        # drop versions that no longer carry any label, like Secrets Manager does
+        for other_id in [v for v, version in secret["versions"].items() if not version["stages"] and v != version_id]:
+            del secret["versions"][other_id]
+
+    def _find(self, secret_id, include_deleted=False):
+        name = self._arns.get(secret_id, secret_id)
+        secret = self._secrets.get(name)
+        if secret is None:
+            raise FakeError("ResourceNotFoundException", "Secrets Manager can't find the specified secret.")
+        if secret.get("DeletedDate") and not include_deleted:
+            raise FakeError(
+                "InvalidRequestException",
+                "You can't perform this operation on the secret because it was marked for deletion.",
+            )
+        return secret
+
+    def _version(self, secret, body):
+        if body.get("VersionId"):
+            version = secret["versions"].get(body["VersionId"])
+            if version is None:
+                raise FakeError("ResourceNotFoundException", "version not found")
+            return body["VersionId"], version
+        stage = body.get("VersionStage", "AWSCURRENT")
+        for version_id, version in secret["versions"].items():
+            if stage in version["stages"]:
+                return version_id, version
+        raise FakeError("ResourceNotFoundException", f"no version with stage {stage}")
+
+    def _value(self, secret, version_id, version):
+        value = {
+            "ARN": secret["ARN"],
+            "Name": secret["Name"],
+            "VersionId": version_id,
+            "VersionStages": list(version["stages"]),
+            "CreatedDate": version["CreatedDate"],
+        }
+        if version["SecretString"] is not None:
+            value["SecretString"] = version["SecretString"]
+        else:
+            value["SecretBinary"] = version["SecretBinary"]
+        return value
+
+    def _metadata(self, secret):
+        record = {k: v for k, v in secret.items() if k != "versions" and v is not None}
+        record["SecretVersionsToStages"] = {v: list(version["stages"]) for v, version in secret["versions"].items()}
+        return record
+
+    # -- operations -------------------------------------------------------------
+
+    def op_CreateSecret(self, body):
+        secret = self._create(
+            body["Name"],
+            body.get("SecretString"),
+            body.get("SecretBinary"),
+            body.get("Description"),
+            body.get("Tags"),
+            time.time(),
+        )
+        current = [v for v, version in secret["versions"].items() if "AWSCURRENT" in version["stages"]]
+        return {"ARN": secret["ARN"], "Name": secret["Name"], **({"VersionId": current[0]} if current else {})}
+
+    def op_DescribeSecret(self, body):
+        secret = self._find(body["SecretId"], include_deleted=True)
+        record = self._metadata(secret)
+        record["VersionIdsToStages"] = record.pop("SecretVersionsToStages")
+        return record
+
+    def op_GetSecretValue(self, body):
+        secret = self._find(body["SecretId"])
+        return self._value(secret, *self._version(secret, body))
+
+    def op_BatchGetSecretValue(self, body):
+        values, errors = [], []
+        for secret_id in body.get("SecretIdList", []):
+            try:
+                secret = self._find(secret_id)
+                values.append(self._value(secret, *self._version(secret, {})))
+            except FakeError as e:
+                errors.append({"SecretId": secret_id, "ErrorCode": e.code, "Message": e.message})
+        return {"SecretValues": values, "Errors": errors}
+
+    def op_PutSecretValue(self, body):
+        secret = self._find(body["SecretId"])
+        stages = body.get("VersionStages") or ["AWSCURRENT"]
+        version_id = self._put(secret, body.get("SecretString"), body.get("SecretBinary"), stages, time.time())
+        return {"ARN": secret["ARN"], "Name": secret["Name"], "VersionId": version_id, "VersionStages": stages}
+
+    def op_UpdateSecretVersionStage(self, body):
+        secret = self._find(body["SecretId"])
+        stage = body["VersionStage"]
+        if body.get("RemoveFromVersionId"):
+            version = secret["versions"].get(body["RemoveFromVersionId"])
+            if version is None or stage not in version["stages"]:
+                raise FakeError("InvalidParameterException", "stage is not on RemoveFromVersionId")
+        if body.get("MoveToVersionId"):
+            if body["MoveToVersionId"] not in secret["versions"]:
+                raise FakeError("ResourceNotFoundException", "version not found")
+            self._move_stage(secret, stage, body["MoveToVersionId"])
+        elif body.get("RemoveFromVersionId"):
+            secret["versions"][body["RemoveFromVersionId"]]["stages"].remove(stage)
+        secret["LastChangedDate"] = time.time()
+        self._sorted.clear()
+        return {"ARN": secret["ARN"], "Name": secret["Name"]}
+
+    def op_DeleteSecret(self, body):
+        secret = self._find(body["SecretId"])
+        now = time.time()
+        if body.get("ForceDeleteWithoutRecovery"):
+            del self._secrets[secret["Name"]]
+            del self._arns[secret["ARN"]]
+        else:
+            secret["DeletedDate"] = now
+            secret["LastChangedDate"] = now
+        self._sorted.clear()
+        return {"ARN": secret["ARN"], "Name": secret["Name"], "DeletionDate": now}
+
+    def op_RestoreSecret(self, body):
+        secret = self._find(body["SecretId"], include_deleted=True)
+        secret.pop("DeletedDate", None)
+        self._sorted.clear()
+        return {"ARN": secret["ARN"], "Name": secret["Name"]}
+
+    def op_GetRandomPassword(self, body):
+        length = body.get("PasswordLength", 32)
+        return {"RandomPassword": "".join(self._random.choice(string.ascii_letters) for _ in range(length))}
+
+    def op_ListSecrets(self, body):
+        key = json.dumps(
+            [body.get("Filters"), body.get("SortBy"), body.get("SortOrder"), body.get("IncludePlannedDeletion")]
+        )
+        if key not in self._sorted:
+            secrets = [
+                s
+                for s in self._secrets.values()
+                if (body.get("IncludePlannedDeletion") or not s.get("DeletedDate"))
+                and all(self._filter(s, f) for f in body.get("Filters", []))
+            ]
+            sort_field = {"name": "Name", "last-changed-date": "LastChangedDate"}.get(
+                body.get("SortBy"), "CreatedDate"
+            )
+            secrets.sort(key=lambda s: (s[sort_field], s["Name"]), reverse=body.get("SortOrder") == "desc")
+            self._sorted[key] = secrets
+        secrets = self._sorted[key]
+        start = int(body.get("NextToken") or 0)
+        end = start + body.get("MaxResults", 100)
+        response = {"SecretList": [self._metadata(s) for s in secrets[start:end]]}
+        if end < len(secrets):
+            response["NextToken"] = str(end)
+        return response
+
+    def _filter(self, secret, fltr):
+        fields = {
+            "name": [secret["Name"]],
+            "description": [secret.get("Description")],
+            "tag-key": [t["Key"] for t in secret["Tags"]],
+            "tag-value": [t["Value"] for t in secret["Tags"]],
+        }
+        candidates = fields.get(fltr["Key"]) or [f for values in fields.values() for f in values]
+        return any(_matches(field, value) for value in fltr["Values"] for field in candidates)
+
+
+def make_client(fake, region="us-west-1", **config):
+    """Builds a real boto3 Secrets Manager client whose requests are answered by `fake`."""
+    import boto3
+    from botocore.config import Config
+
+    session = boto3.session.Session(
+        aws_access_key_id="testing", aws_secret_access_key="testing", region_name=region
+    )
+    client = session.client("secretsmanager", config=Config(**config) if config else None)
+    return fake.attach(client)
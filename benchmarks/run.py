@@ -0,0 +1,219 @@
+"""
+Benchmarks for the CLI commands and AwsSecretMgmt methods against the in-process
+fake Secrets Manager.
+
+Each scenario runs in a fresh interpreter so that its peak RSS and import costs are
+its own. Results are written as JSON, and can be compared against an earlier run:
+
+    python -m benchmarks.run --secrets 10000 --latency-ms 20 --output new.json
+    python -m benchmarks.run --secrets 10000 --latency-ms 20 --compare old.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+
+SAMPLE = 200
+
+
+def _names(fake):
+    return sorted(fake._secrets)
+
+
+def api_list(aws, fake):
+    return sum(1 for _ in aws.list())
+
+
+def api_search(aws, fake):
+    return sum(1 for _ in aws.search(tag_value=["team-1"], pattern=r"1$"))
+
+
+def api_get_many(aws, fake):
+    values, errors = aws.get_many(_names(fake))
+    return len(values)
+
+
+def api_get_secret(aws, fake):
+    names = _names(fake)[:SAMPLE]
+    for name in names:
+        aws.get_secret(name)
+    return len(names)
+
+
+def _invoke(args, input=None):
+    from click.testing import CliRunner
+
+    from secrets_mgmt_cli.cli import cli
+
+    result = CliRunner().invoke(cli, args, input=input)
+    if result.exit_code != 0:
+        raise RuntimeError(f"smgmt {' '.join(args)} failed: {result.output[-500:]}")
+    return result.output
+
+
+def cli_ls(aws, fake):
+    return len(_invoke(["ls", "--format", "ndjson"]).splitlines())
+
+
+def cli_search(aws, fake):
+    return len(_invoke(["search", "--tag-value", "team-1", "--format", "ndjson"]).splitlines())
+
+
+def cli_read(aws, fake):
+    names = _names(fake)[:SAMPLE]
+    for name in names:
+        _invoke(["read", "-n", name], input="y\n")
+    return len(names)
+
+
+def cli_get(aws, fake):
+    return len(json.loads(_invoke(["get", "--prefix", "projects/dev/"])))
+
+
+def cli_transfer(aws, fake):
+    with tempfile.TemporaryDirectory() as home:
+        os.environ["HOME"] = home
+        _invoke(["transfer", "--all"])
+        _invoke(["transfer", "--all"])
+    return 2 * len(fake._secrets)
+
+
+SCENARIOS = {
+    "api.list": api_list,
+    "api.search": api_search,
+    "api.get_many": api_get_many,
+    "api.get_secret": api_get_secret,
+    "cli.ls": cli_ls,
+    "cli.search": cli_search,
+    "cli.read": cli_read,
+    "cli.get": cli_get,
+    "cli.transfer": cli_transfer,
+}
+
+
+def _max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_scenario(name, secrets, latency, throttle_rate, queue):
+    from secrets_mgmt_cli import aws as aws_module
+    from secrets_mgmt_cli.aws import AwsSecretMgmt
+
+    from .fake_secretsmanager import FakeSecretsManager, make_client
+
+    fake = FakeSecretsManager(latency=latency, throttle_rate=throttle_rate)
+    fake.seed(secrets)
+    aws = AwsSecretMgmt(client=make_client(fake, max_pool_connections=50))
+    aws_module._aws = aws
+    rss_before = _max_rss_mb()
+    fake.reset_calls()
+
+    started = time.perf_counter()
+    items = SCENARIOS[name](aws, fake)
+    wall = time.perf_counter() - started
+
+    queue.put(
+        {
+            "wall_s": round(wall, 4),
+            "items": items,
+            "throughput_per_s": round(items / wall, 1) if wall else None,
+            "api_calls": sum(fake.calls.values()),
+            "calls_by_operation": dict(fake.calls),
+            "throttled": fake.throttled,
+            "bytes_received": fake.bytes_out,
+            "peak_rss_mb": round(_max_rss_mb(), 1),
+            "rss_growth_mb": round(_max_rss_mb() - rss_before, 1),
+            "limiter": aws.limiter.stats(),
+        }
+    )
+
+
+def run(scenarios, secrets, latency, throttle_rate):
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for name in scenarios:
+        queue = ctx.Queue()
+        process = ctx.Process(target=run_scenario, args=(name, secrets, latency, throttle_rate, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        results[name] = result
+        print(
+            f"{name:<16} {result['wall_s']:>9.3f}s {result['api_calls']:>7} calls "
+            f"{result['throughput_per_s'] or 0:>10.1f}/s {result['peak_rss_mb']:>8.1f} MB",
+            file=sys.stderr,
+        )
+    return results
+
+
+def compare(results, baseline, max_regression):
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get("results", {}).get(name)
+        if old is None:
+            continue
+        for metric in ("wall_s", "api_calls", "peak_rss_mb"):
+            if old[metric] and result[metric] / old[metric] > max_regression:
+                regressions.append(f"{name} {metric}: {old[metric]} -> {result[metric]}")
+    return regressions
+
+
+def _version():
+    try:
+        from importlib.metadata import version
+
+        return version("secrets-mgmt-cli")
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--secrets", type=int, default=1000, help="number of secrets to seed")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latency added to every API call")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of calls that are throttled")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="default: all")
+    parser.add_argument("--output", default=None, help="write results to this JSON file instead of stdout")
+    parser.add_argument("--compare", default=None, help="JSON results of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=1.25, help="allowed ratio against --compare")
+    args = parser.parse_args(argv)
+
+    results = run(args.scenario or list(SCENARIOS), args.secrets, args.latency_ms / 1000, args.throttle_rate)
+    report = {
+        "meta": {
+            "version": _version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "secrets": args.secrets,
+            "latency_ms": args.latency_ms,
+            "throttle_rate": args.throttle_rate,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"regression {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
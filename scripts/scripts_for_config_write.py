@@ -14,11 +14,8 @@ https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3.ht
 ## write aws secrets to local
 """
 
-from .aws import AwsSecretMgmt
-from .config import ConfigHandler
-
-
-aws = AwsSecretMgmt()
+from secrets_mgmt_cli.aws import aws
+from secrets_mgmt_cli.config import ConfigHandler
 
 
 def write_secret_to_local_config(project_name):
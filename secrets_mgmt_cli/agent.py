@@ -0,0 +1,286 @@
+"""
+A long-lived local process that keeps a warm Secrets Manager client and an
+in-memory cache behind a Unix domain socket.
+
+The protocol is one JSON object per line in each direction. A request is
+`{"op": "get", "args": {"name": "projects/dev/app"}}` and the response is either
+`{"result": ...}` or `{"error": {"Code": ..., "Message": ...}, "operation": ...}`.
+Bytes and datetimes are encoded as in the disk cache.
+"""
+
+import os
+import json
+import stat
+import socket
+import logging
+import pathlib
+import threading
+import socketserver
+
+from .cache import SecretCache, _decode, _encode, get_cache_dir
+from .clients import get_client_factory
+
+logger = logging.getLogger(__name__)
+
+# operations whose identical concurrent requests share one call to Secrets Manager
+COALESCED_OPS = ("get", "get_many", "list_page", "describe")
+
+
+def get_socket_path() -> pathlib.Path:
+    path = os.environ.get("SMGMT_AGENT_SOCKET")
+    return pathlib.Path(path) if path else get_cache_dir() / "agent" / "agent.sock"
+
+
+def _dumps(obj) -> bytes:
+    return json.dumps(obj, default=_encode).encode("utf8") + b"\n"
+
+
+def _loads(line: bytes):
+    return json.loads(line, object_hook=_decode)
+
+
+class Coalescer:
+    """Runs one call for each distinct key at a time, handing its outcome to every caller waiting on that key."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event()}
+            else:
+                self.coalesced += 1
+        if not leader:
+            call["done"].wait()
+        else:
+            try:
+                call["result"] = fn()
+            except Exception as e:
+                call["error"] = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call["done"].set()
+        if "error" in call:
+            raise call["error"]
+        return call["result"]
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        if not self.server.agent.peer_allowed(self.request):
+            logger.warning("Refused agent connection from another user.")
+            return
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = _loads(line)
+                response = {"result": self.server.agent.handle(request.get("op"), request.get("args") or {})}
+            except Exception as e:
+                response = self.server.agent.error_response(e)
+            self.wfile.write(_dumps(response))
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Agent:
+    def __init__(self, aws=None, path=None, ttl=300, max_entries=1024):
+        """
+        :param aws: The `AwsSecretMgmt` that serves requests. By default one is built
+                    for the default profile and region, with an in-memory cache.
+        :param path: The socket path, `get_socket_path()` by default.
+        :param ttl: Seconds a cached value is served before its version is checked.
+        :param max_entries: The size of the in-memory cache.
+        """
+        if aws is None:
+            from .aws import AwsSecretMgmt
+
+            aws = AwsSecretMgmt()
+        if aws.cache is None:
+            aws.cache = SecretCache(ttl=ttl, max_entries=max_entries)
+        self.aws = aws
+        self.path = pathlib.Path(path) if path is not None else get_socket_path()
+        self.coalescer = Coalescer()
+        self.requests = 0
+        self._server = None
+
+    def peer_allowed(self, sock):
+        # the socket is 0600, this also guards against a directory with looser permissions
+        if not hasattr(socket, "SO_PEERCRED"):
+            return True
+        import struct
+
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        uid = struct.unpack("3i", creds)[1]
+        return uid == os.getuid()
+
+    def handle(self, op, args):
+        self.requests += 1
+        fn = getattr(self, f"op_{op}", None)
+        if fn is None:
+            raise ValueError(f"unknown agent operation {op!r}")
+        if op not in COALESCED_OPS:
+            return fn(**args)
+        return self.coalescer.do((op, json.dumps(args, sort_keys=True)), lambda: fn(**args))
+
+    def error_response(self, e):
+        from botocore.exceptions import ClientError
+
+        if isinstance(e, ClientError):
+            return {"error": e.response["Error"], "operation": e.operation_name}
+        return {"error": {"Code": type(e).__name__, "Message": str(e)}, "operation": None}
+
+    # -- operations -------------------------------------------------------------
+
+    def op_ping(self):
+        return {"pid": os.getpid(), "profile": self.aws.profile, "region": self.aws.region}
+
+    def op_stats(self):
+        stats = {"requests": self.requests, "coalesced": self.coalescer.coalesced, "cache": self.aws.cache.stats()}
+        credential_cache = get_client_factory().credential_cache
+        if credential_cache is not None:
+            stats["credentials"] = credential_cache.stats()
+        return stats
+
+    def op_get(self, name, stage=None):
+        return self.aws._get_secret_value(name, stage)
+
+    def op_get_many(self, names):
+        values, errors = self.aws.get_many(names)
+        return {"values": values, "errors": {name: e.response["Error"] for name, e in errors.items()}}
+
+    def op_list_page(self, **kwargs):
+        # one ListSecrets page per request, the client asks for the next one when it needs it
+        page = self.aws.client.list_secrets(**kwargs)
+        return {"SecretList": page["SecretList"], "NextToken": page.get("NextToken")}
+
+    def op_describe(self, name):
+        return self.aws.client.describe_secret(SecretId=name)
+
+    def op_invalidate(self, name):
+        self.aws.cache.invalidate(name, self.aws.cache_scope())
+
+    def op_shutdown(self):
+        threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+    # -- lifecycle --------------------------------------------------------------
+
+    def bind(self):
+        """
+        Creates the socket, readable and writable by the current user only.
+
+        The directory of the socket is made private when this creates it; a directory
+        that already exists is left as it is, and refused unless it is already owned
+        by the current user and closed to everyone else.
+        """
+        parent = self.path.parent
+        try:
+            parent.mkdir(parents=True, mode=0o700)
+            # mkdir applies the umask, the agent needs exactly 0700
+            os.chmod(parent, 0o700)
+        except FileExistsError:
+            info = os.stat(parent)
+            if info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o077:
+                raise RuntimeError(f"{parent} must belong to you and be closed to other users, e.g. mode 0700")
+        if self.path.exists():
+            if AgentClient(self.path).connect() is not None:
+                raise RuntimeError(f"an agent is already listening on {self.path}")
+            self.path.unlink()
+        umask = os.umask(0o177)
+        try:
+            self._server = _Server(str(self.path), _Handler)
+        finally:
+            os.umask(umask)
+        self._server.agent = self
+        # resolve credentials and open a connection now, so the first request is served warm
+        self.aws.client
+        return self
+
+    def serve_forever(self):
+        logger.info("smgmt agent listening on %s.", self.path)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if self.path.exists():
+                self.path.unlink()
+
+
+class AgentClient:
+    """A connection to a running agent, safe to share between threads."""
+
+    def __init__(self, path=None, timeout=30):
+        self.path = pathlib.Path(path) if path is not None else get_socket_path()
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+        self.info = None
+
+    def connect(self):
+        """Returns self when an agent answers on the socket, None otherwise."""
+        if not self.path.exists():
+            return None
+        try:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(self.timeout)
+            self._sock.connect(str(self.path))
+            self._file = self._sock.makefile("rb")
+            self.info = self.call("ping")
+        except OSError:
+            self.close()
+            return None
+        return self
+
+    def call(self, op, **args):
+        """
+        Sends one request and waits for its response.
+
+        :raises ClientError: When Secrets Manager answered the agent with an error.
+        :raises OSError: When the agent can't be reached.
+        """
+        with self._lock:
+            if self._sock is None:
+                raise ConnectionError("not connected to the smgmt agent")
+            self._sock.sendall(_dumps({"op": op, "args": args}))
+            line = self._file.readline()
+        if not line:
+            self.close()
+            raise ConnectionError("the smgmt agent closed the connection")
+        response = _loads(line)
+        if "error" in response:
+            from botocore.exceptions import ClientError
+
+            raise ClientError({"Error": response["error"]}, response.get("operation") or op)
+        return response["result"]
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = None
+        self._file = None
+
+
+def connect_agent(profile=None, region=None, path=None):
+    """
+    Connects to the running agent when it serves the given profile and region.
+
+    :return: An `AgentClient`, or None when no suitable agent is running.
+    """
+    client = AgentClient(path).connect()
+    if client is None:
+        return None
+    if (client.info.get("profile"), client.info.get("region")) != (profile, region):
+        logger.info("Not using the smgmt agent, it serves a different profile or region.")
+        client.close()
+        return None
+    return client
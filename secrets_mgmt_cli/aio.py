@@ -0,0 +1,185 @@
+"""
+An asyncio interface to Secrets Manager for services that embed this package.
+
+boto3 has no async transport, so requests run on an executor dedicated to this
+client, leaving the default executor and the event loop free. Every method names
+its secret explicitly and keeps no per-call state, so one instance can be shared by
+any number of tasks. Identical reads that are in flight at the same time share one
+request.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from .aws import AwsSecretMgmt
+
+MAX_WORKERS = 32
+
+
+class AsyncCoalescer:
+    """
+    Runs one coroutine for each distinct key at a time, handing its outcome to every
+    task waiting on that key. The shared call runs as its own task, so cancelling
+    one waiter does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        """
+        :param key: A hashable key of the call.
+        :param fn: A coroutine function called with no arguments.
+        :return: What the coroutine returned, shared with the other waiters.
+        """
+        loop = asyncio.get_running_loop()
+        task_key = (loop, key)
+        task = self._tasks.get(task_key)
+        if task is None:
+            task = self._tasks[task_key] = loop.create_task(fn())
+            task.add_done_callback(functools.partial(self._done, task_key))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _done(self, task_key, task):
+        self._tasks.pop(task_key, None)
+        if not task.cancelled():
+            # mark the exception as retrieved when every waiter was cancelled
+            task.exception()
+
+
+class AsyncSecretMgmt:
+    """
+    Async, stateless counterpart of `AwsSecretMgmt`.
+
+    Use it as an async context manager, or call `close` when done:
+
+        async with AsyncSecretMgmt(region="eu-west-1") as secrets:
+            response = await secrets.get("projects/dev/app")
+
+    Responses may be shared between the tasks whose reads were coalesced, treat them
+    as read-only.
+    """
+
+    def __init__(
+        self, client=None, cache=None, profile=None, region=None, deadline=None, hedge=False, max_workers=MAX_WORKERS
+    ):
+        """
+        :param client: A Boto3 Secrets Manager client. When None, the shared client
+                       for `profile` and `region` is taken from the client factory,
+                       on the executor, the first time it is needed.
+        :param cache: An optional `SecretCache` consulted before `GetSecretValue`.
+        :param profile: The AWS profile used when no client is given.
+        :param region: The region used when no client is given.
+        :param deadline: The default budget, in seconds, of `get` and `get_many`.
+        :param hedge: Hedge `get` after the p95 latency, see `AwsSecretMgmt`.
+        :param max_workers: The number of requests run at the same time.
+        """
+        self._aws = AwsSecretMgmt(
+            client=client, cache=cache, profile=profile, region=region, deadline=deadline, hedge=hedge
+        )
+        self._aws.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="smgmt-async")
+        self.coalescer = AsyncCoalescer()
+        self._client_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Stops the executor once the requests already started have finished."""
+        self._executor.shutdown(wait=False)
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        if self._aws._client is None:
+            # build the client once, instead of in every thread of the first burst
+            if self._client_lock is None:
+                self._client_lock = asyncio.Lock()
+            async with self._client_lock:
+                if self._aws._client is None:
+                    await loop.run_in_executor(self._executor, lambda: self._aws.client)
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def get(self, name, stage=None, deadline=None):
+        """
+        Gets the value of a secret.
+
+        :param name: The name or ARN of the secret.
+        :param stage: The stage to read, AWSCURRENT by default.
+        :param deadline: Seconds the read may take, retries included.
+        :return: The `GetSecretValue` response.
+        """
+        return await self.coalescer.do(
+            ("get", name, stage), lambda: self._run(self._aws._get_secret_value, name, stage, deadline)
+        )
+
+    async def get_many(self, names, deadline=None):
+        """
+        Gets the current values of many secrets, with `BatchGetSecretValue` when it
+        is available, see `AwsSecretMgmt.get_many`.
+
+        :return: A tuple of two dicts, the `GetSecretValue`-shaped responses and the
+                 `ClientError` for each secret that could not be fetched.
+        """
+        names = list(names)
+        return await self.coalescer.do(
+            ("get_many", tuple(names)), lambda: self._run(self._aws.get_many, names, deadline)
+        )
+
+    async def describe(self, name):
+        """
+        Gets metadata about a secret.
+
+        :return: The `DescribeSecret` response.
+        """
+        return await self.coalescer.do(
+            ("describe", name), lambda: self._run(self._aws._call, "describe_secret", SecretId=name)
+        )
+
+    async def list(self, filters=None, **kwargs):
+        """
+        Lists secrets, reading one page at a time on the executor, each page through
+        the rate controller.
+
+        :param filters: `ListSecrets` filters, for example
+                        `[{"Key": "name", "Values": ["projects/dev/"]}]`.
+        :param kwargs: Other `ListSecrets` parameters, such as `SortBy`.
+        :return: An async iterator of secrets.
+        """
+        if filters:
+            kwargs["Filters"] = filters
+        while True:
+            page = await self._run(self._aws._call, "list_secrets", **kwargs)
+            for secret in page["SecretList"]:
+                yield secret
+            if not page.get("NextToken"):
+                return
+            kwargs["NextToken"] = page["NextToken"]
+
+    async def put(self, name, secret_value, stages=None):
+        """
+        Puts a new value into a secret.
+
+        :param name: The name or ARN of the secret.
+        :param secret_value: A string or bytes.
+        :param stages: The staging labels of the new version, AWSCURRENT by default.
+        :return: The `PutSecretValue` response.
+        """
+        kwargs = {"SecretId": name}
+        if isinstance(secret_value, str):
+            kwargs["SecretString"] = secret_value
+        elif isinstance(secret_value, bytes):
+            kwargs["SecretBinary"] = secret_value
+        if stages is not None:
+            kwargs["VersionStages"] = stages
+        response = await self._run(self._aws._call, "put_secret_value", **kwargs)
+        # the disk cache and the agent are blocking I/O too
+        await self._run(self._aws._invalidate, name)
+        return response
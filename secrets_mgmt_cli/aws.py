@@ -1,42 +1,195 @@
-import os
+import re
 import json
 import time
-import base64
-import pathlib
+import hashlib
 import logging
-import configparser
+from concurrent.futures import ThreadPoolExecutor
 
-import boto3
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
+
+from .cache import CURRENT_STAGE, version_for_stage
+from .clients import get_client_factory, get_default_region  # noqa: F401
+from .deadline import DeadlineExceededError, Hedger
+from .instrumentation import recorder
+from .ratelimit import RateController
 
 logger = logging.getLogger(__name__)
 
+# BatchGetSecretValue accepts at most 20 secret IDs per request
+BATCH_SIZE = 20
+MAX_WORKERS = 8
+# errors that mean BatchGetSecretValue itself is unavailable, rather than a secret failing
+BATCH_UNSUPPORTED_ERRORS = ("AccessDeniedException", "UnknownOperationException")
+_NO_AGENT = object()
+# the most secrets ListSecrets returns in one page
+LIST_PAGE_SIZE = 100
+# staging label for versions written by `update_value` before they are promoted to AWSCURRENT
+UPDATE_STAGE = "SMGMT_UPDATE"
+
+
+class ConcurrentModificationError(RuntimeError):
+    """Raised when a secret gained a new current version while it was being updated."""
 
-def get_default_region() -> str:
-    config_file_path = pathlib.Path.home() / ".aws" / "config"
-    if os.path.isfile(config_file_path):
-        config = configparser.ConfigParser()
-        config.read(config_file_path)
-        return config["default"]["region"]
-    else:
-        region = "us-west-1"
-        return region
+
+def canonical_hash(value) -> str:
+    # JSON objects hash the same whatever their key order or whitespace
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return hashlib.sha256(value.encode("utf8")).hexdigest()
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf8")).hexdigest()
+
+
+def as_client_error(error, operation):
+    """
+    Wraps a `BotoCoreError`, such as a connection failure, in a `ClientError`, so that
+    it can be reported per secret next to the errors returned by the service.
+    """
+    return ClientError({"Error": {"Code": type(error).__name__, "Message": str(error)}}, operation)
+
+
+def parse_secret_value(response):
+    """
+    Extracts the value from a `GetSecretValue`-shaped response.
+
+    :return: The decoded JSON when `SecretString` holds JSON, the plain string when
+             it does not, or the bytes of `SecretBinary`.
+    """
+    if "SecretString" in response:
+        try:
+            return json.loads(response["SecretString"])
+        except ValueError:
+            return response["SecretString"]
+    return response.get("SecretBinary")
 
 
 class AwsSecretMgmt:
     """Encapsulates Secrets Manager functions."""
 
-    def __init__(self):
+    def __init__(
+        self, client=None, cache=None, limiter=None, profile=None, region=None, agent=None, deadline=None, hedge=False
+    ):
         """
-        :param client: A Boto3 Secrets Manager client.
+        :param client: A Boto3 Secrets Manager client. When None, the shared client
+                       for `profile` and `region` is taken from the client factory
+                       the first time it is needed.
+        :param cache: An optional `SecretCache` consulted before `GetSecretValue`.
+        :param limiter: The `RateController` that paces calls made for many secrets
+                        at once. Pass one instance to share it between clients.
+        :param profile: The AWS profile used when no client is given.
+        :param region: The region used when no client is given, by default the one
+                       configured for the profile.
+        :param agent: An `AgentClient` that serves reads from a running `smgmt agent`.
+                      Writes still go to Secrets Manager directly, and reads fall back
+                      to it when the agent goes away.
+        :param deadline: The default budget, in seconds, of reads that take a `deadline`.
+        :param hedge: Send a second `GetSecretValue` when the first has not answered
+                      within the p95 latency, for reads made with a deadline.
         """
-        session = boto3.session.Session()
-        self.client = session.client(service_name="secretsmanager", region_name=get_default_region())
+        self._client = None
+        self.agent = agent
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedger = Hedger()
+        self.profile = profile
+        self.region = region
+        self.cache = cache
+        self.limiter = limiter if limiter is not None else RateController(concurrency=MAX_WORKERS)
+        if client is not None:
+            self._set_client(client)
+        self.max_workers = MAX_WORKERS
+        self._batch_supported = True
         self.name = None
 
+    @property
+    def client(self):
+        if self._client is None:
+            self._set_client(get_client_factory().get(self.profile, self.region))
+        return self._client
+
+    def _set_client(self, client):
+        self._client = client
+        self.limiter.observe(client)
+        recorder.attach(client)
+
+    def _call(self, operation, **kwargs):
+        # requests made on behalf of bulk operations go through the shared rate controller
+        return self.limiter.call(operation, getattr(self.client, operation), **kwargs)
+
+    def cache_scope(self):
+        """The profile and region cached values are filed under, such as `prod@eu-west-1`."""
+        return f"{self.profile or 'default'}@{self.client.meta.region_name}"
+
+    def can_sort_list(self):
+        """Whether the botocore in use knows the `SortBy` parameter of `ListSecrets`."""
+        return "SortBy" in self.client.meta.service_model.operation_model("ListSecrets").input_shape.members
+
     def _clear(self):
         self.name = None
 
+    def _agent_call(self, op, **args):
+        # returns _NO_AGENT when there is no agent, or it stopped answering
+        if self.agent is None:
+            return _NO_AGENT
+        try:
+            return self.agent.call(op, **args)
+        except OSError as e:
+            logger.warning("The smgmt agent is unavailable, calling Secrets Manager directly: %s", e)
+            self.agent = None
+            return _NO_AGENT
+
+    def _get_secret_value(self, name, stage=None, deadline=None):
+        deadline = deadline if deadline is not None else self.deadline
+        if deadline is None:
+            return self._fetch_secret_value(name, stage)
+        try:
+            return self.hedger.call(lambda: self._fetch_secret_value(name, stage), deadline, hedge=self.hedge)
+        except DeadlineExceededError:
+            stale = self.cache.get_stale(name, stage, self.cache_scope()) if self.cache is not None else None
+            if stale is None:
+                raise DeadlineExceededError(f"no answer for secret {name} within {deadline:g} seconds") from None
+            logger.warning("No answer for secret %s within %g seconds, using a stale cached value.", name, deadline)
+            return stale
+
+    def _timed_get_secret_value(self, **kwargs):
+        def timed(**kwargs):
+            # only the request is timed, not the wait for the rate controller
+            started = time.monotonic()
+            response = self.client.get_secret_value(**kwargs)
+            self.hedger.tracker.record(time.monotonic() - started)
+            return response
+
+        return self.limiter.call("get_secret_value", timed, **kwargs)
+
+    def _fetch_secret_value(self, name, stage=None):
+        response = self._agent_call("get", name=name, stage=stage)
+        if response is not _NO_AGENT:
+            return response
+        kwargs = {"SecretId": name}
+        if stage is not None:
+            kwargs["VersionStage"] = stage
+        if self.cache is None:
+            return self._timed_get_secret_value(**kwargs)
+
+        def current_version():
+            response = self._call("describe_secret", SecretId=name)
+            return version_for_stage(response.get("VersionIdsToStages"), stage or CURRENT_STAGE)
+
+        return self.cache.get(
+            name,
+            stage,
+            fetch=lambda: self._timed_get_secret_value(**kwargs),
+            current_version=current_version,
+            scope=self.cache_scope(),
+        )
+
+    def _invalidate(self, name):
+        if self.cache is not None:
+            self.cache.invalidate(name, self.cache_scope())
+        self._agent_call("invalidate", name=name)
+
     def create(self, name, secret_value):
         """
         Creates a new secret. The secret value can be a string or bytes.
@@ -75,7 +228,9 @@ class AwsSecretMgmt:
             name = self.name
         self._clear()
         try:
-            response = self.client.describe_secret(SecretId=name)
+            response = self._agent_call("describe", name=name)
+            if response is _NO_AGENT:
+                response = self.client.describe_secret(SecretId=name)
             self.name = name
             logger.info("Got secret metadata for %s.", name)
         except ClientError:
@@ -84,12 +239,15 @@ class AwsSecretMgmt:
         else:
             return response
 
-    def get_value(self, stage=None):
+    def get_value(self, stage=None, deadline=None):
         """
         Gets the value of a secret.
 
         :param stage: The stage of the secret to retrieve. If this is None, the
                       current stage is retrieved.
+        :param deadline: Seconds the whole read may take, retries included, by
+                         default `self.deadline`. When it passes, a stale cached
+                         value is returned if there is one.
         :return: The value of the secret. When the secret is a string, the value is
                  contained in the `SecretString` field. When the secret is bytes,
                  it is contained in the `SecretBinary` field.
@@ -98,10 +256,7 @@ class AwsSecretMgmt:
             raise ValueError
 
         try:
-            kwargs = {"SecretId": self.name}
-            if stage is not None:
-                kwargs["VersionStage"] = stage
-            response = self.client.get_secret_value(**kwargs)
+            response = self._get_secret_value(self.name, stage, deadline)
             logger.info("Got value for secret %s.", self.name)
         except ClientError:
             logger.exception("Couldn't get value for secret %s.", self.name)
@@ -135,9 +290,12 @@ class AwsSecretMgmt:
         value.
 
         :param secret_value: The value to add to the secret.
+        :param name: The name of the secret. If `name` is None, the current secret is used.
         :param stages: The stages to associate with the secret.
         :return: Metadata about the secret.
         """
+        if name is not None:
+            self.name = name
         if self.name is None:
             raise ValueError
 
@@ -150,6 +308,7 @@ class AwsSecretMgmt:
             if stages is not None:
                 kwargs["VersionStages"] = stages
             response = self.client.put_secret_value(**kwargs)
+            self._invalidate(self.name)
             logger.info("Value put in secret %s.", self.name)
         except ClientError:
             logger.exception("Couldn't put value in secret %s.", self.name)
@@ -157,6 +316,102 @@ class AwsSecretMgmt:
         else:
             return response
 
+    def upsert(self, name, secret_value, create=False, **kwargs):
+        """
+        Creates a secret, or puts a new current value into an existing one. Unlike
+        `create` and `put_value`, this does not use or change `self.name`, so one
+        instance can be shared by many threads.
+
+        :param name: The name of the secret.
+        :param secret_value: The value of the secret, a string or bytes.
+        :param create: Create the secret instead of putting a new value.
+        :param kwargs: Other `CreateSecret` parameters, such as `Description` or `Tags`,
+                       only used when creating.
+        :return: Metadata about the secret.
+        """
+        kwargs = kwargs if create else {}
+        kwargs["Name" if create else "SecretId"] = name
+        if isinstance(secret_value, str):
+            kwargs["SecretString"] = secret_value
+        elif isinstance(secret_value, bytes):
+            kwargs["SecretBinary"] = secret_value
+        try:
+            if create:
+                response = self._call("create_secret", **kwargs)
+                logger.info("Created secret %s.", name)
+            else:
+                response = self._call("put_secret_value", **kwargs)
+                logger.info("Value put in secret %s.", name)
+            self._invalidate(name)
+        except ClientError:
+            logger.exception("Couldn't %s secret %s.", "create" if create else "put value in", name)
+            raise
+        else:
+            return response
+
+    def update_value(self, name, secret_string=None, set_keys=None, unset_keys=()):
+        """
+        Replaces a secret's value, or changes some keys of its JSON object, without
+        creating a new version when the result equals the current value.
+
+        The new version is written with the `SMGMT_UPDATE` label and then moved to
+        AWSCURRENT with `UpdateSecretVersionStage`, naming the version read at the
+        start as the one to take the label from. Secrets Manager refuses that move
+        when another writer changed AWSCURRENT in between, so no update is lost.
+
+        :param name: The name of the secret.
+        :param secret_string: The complete new value. When None, the current value
+                              is changed with `set_keys` and `unset_keys`.
+        :param set_keys: A dict of keys to add or replace in the JSON object.
+        :param unset_keys: Keys to remove from the JSON object.
+        :return: Metadata about the new version, or None when nothing changed.
+        :raises ConcurrentModificationError: When the secret changed during the update.
+        """
+        try:
+            current = self.client.get_secret_value(SecretId=name)
+        except ClientError:
+            logger.exception("Couldn't get value for secret %s.", name)
+            raise
+        if secret_string is None:
+            value = parse_secret_value(current)
+            if not isinstance(value, dict):
+                raise ValueError(f"secret {name} is not a json object")
+            merged = dict(value)
+            merged.update(set_keys or {})
+            for key in unset_keys:
+                merged.pop(key, None)
+            secret_string = json.dumps(merged)
+        if "SecretString" in current and canonical_hash(secret_string) == canonical_hash(current["SecretString"]):
+            logger.info("Secret %s is unchanged.", name)
+            return None
+
+        try:
+            response = self.client.put_secret_value(
+                SecretId=name, SecretString=secret_string, VersionStages=[UPDATE_STAGE]
+            )
+        except ClientError:
+            logger.exception("Couldn't put value in secret %s.", name)
+            raise
+        try:
+            self.client.update_secret_version_stage(
+                SecretId=name,
+                VersionStage=CURRENT_STAGE,
+                RemoveFromVersionId=current["VersionId"],
+                MoveToVersionId=response["VersionId"],
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "InvalidParameterException":
+                raise ConcurrentModificationError(
+                    f"secret {name} changed since version {current['VersionId']} was read, "
+                    f"the new value is left in version {response['VersionId']} labelled {UPDATE_STAGE}"
+                ) from e
+            logger.exception("Couldn't update version stage %s for secret %s.", CURRENT_STAGE, name)
+            raise
+        finally:
+            self._invalidate(name)
+        logger.info("Value put in secret %s.", name)
+        return response
+
     def update_version_stage(self, stage, remove_from, move_to):
         """
         Updates the stage associated with a version of the secret.
@@ -173,6 +428,7 @@ class AwsSecretMgmt:
             response = self.client.update_secret_version_stage(
                 SecretId=self.name, VersionStage=stage, RemoveFromVersionId=remove_from, MoveToVersionId=move_to
             )
+            self._invalidate(self.name)
             logger.info("Updated version stage %s for secret %s.", stage, self.name)
         except ClientError:
             logger.exception("Couldn't update version stage %s for secret %s.", stage, self.name)
@@ -198,35 +454,86 @@ class AwsSecretMgmt:
 
         try:
             self.client.delete_secret(SecretId=self.name, ForceDeleteWithoutRecovery=without_recovery)
+            self._invalidate(self.name)
             logger.info("Deleted secret %s.", self.name)
             self._clear()
         except ClientError:
             logger.exception("Deleted secret %s.", self.name)
             raise
 
-    def list(self, max_results):
+    def list(self, max_results=None, filters=None, **kwargs):
         """
         Lists secrets for the current account.
 
-        :param max_results: The maximum number of results to return.
+        :param max_results: The maximum number of results to return. When None, every
+                            page is read.
+        :param filters: `ListSecrets` filters, for example
+                        `[{"Key": "name", "Values": ["projects/dev/"]}]`.
+        :param kwargs: Other `ListSecrets` parameters, such as `SortBy`.
         :return: Yields secrets one at a time.
         """
+        if filters:
+            kwargs["Filters"] = filters
+        token, remaining = None, max_results
+        # through the agent one page per request, so that callers can stop early
+        while self.agent is not None and remaining != 0:
+            page_kwargs = dict(kwargs, NextToken=token) if token else dict(kwargs)
+            if remaining is not None:
+                page_kwargs["MaxResults"] = min(LIST_PAGE_SIZE, remaining)
+            page = self._agent_call("list_page", **page_kwargs)
+            if page is _NO_AGENT:
+                # carry on from the same page without the agent
+                break
+            yield from page["SecretList"]
+            if remaining is not None:
+                remaining -= len(page["SecretList"])
+            token = page.get("NextToken")
+            if token is None:
+                return
+        if remaining == 0:
+            return
         try:
             paginator = self.client.get_paginator("list_secrets")
-            for page in paginator.paginate(PaginationConfig={"MaxItems": max_results}):
+            kwargs["PaginationConfig"] = {"MaxItems": remaining, "StartingToken": token}
+            for page in paginator.paginate(**kwargs):
                 for secret in page["SecretList"]:
                     yield secret
         except ClientError:
             logger.exception("Couldn't list secrets.")
             raise
 
+    def search(self, name=(), tag_key=(), tag_value=(), description=(), pattern=None, max_results=None):
+        """
+        Searches secrets with `ListSecrets` filters, reading every page.
+
+        Each argument holds the values for one `ListSecrets` filter key; a secret
+        must match every key that is given and any one of its values, using the
+        word-prefix matching of Secrets Manager. `pattern` is a regular expression
+        applied to the names of the filtered secrets as they stream in.
+
+        :param name: Values for the `name` filter.
+        :param tag_key: Values for the `tag-key` filter.
+        :param tag_value: Values for the `tag-value` filter.
+        :param description: Values for the `description` filter.
+        :param pattern: An optional regular expression searched for in each name.
+        :param max_results: The maximum number of secrets read from the service.
+        :return: Yields matching secrets one at a time.
+        """
+        by_key = {"name": name, "tag-key": tag_key, "tag-value": tag_value, "description": description}
+        filters = [{"Key": key, "Values": list(values)} for key, values in by_key.items() if values]
+        regex = re.compile(pattern) if pattern is not None else None
+        for secret in self.list(max_results=max_results, filters=filters):
+            if regex is None or regex.search(secret["Name"]):
+                yield secret
+
     def get_secrets_list(self):
         return self.client.list_secrets()
 
-    def get_secret(self, secret_name):
+    def get_secret(self, secret_name, deadline=None):
         # See https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
+        # `deadline` bounds the whole read as in `get_value`, raising DeadlineExceededError
         try:
-            get_secret_value_response = self.client.get_secret_value(SecretId=secret_name)
+            get_secret_value_response = self._get_secret_value(secret_name, deadline=deadline)
         except ClientError as e:
             if e.response["Error"]["Code"] == "DecryptionFailureException":
                 # Secrets Manager can't decrypt the protected secret text using the provided KMS key.
@@ -255,7 +562,148 @@ class AwsSecretMgmt:
                 secret = get_secret_value_response["SecretString"]
                 return json.loads(secret)
             else:
-                decoded_binary_secret = base64.b64decode(get_secret_value_response["SecretBinary"])
+                # boto3 has already decoded the base64 of the response
+                return get_secret_value_response["SecretBinary"]
+
+    def list_names(self, prefix):
+        """
+        Lists the names of secrets that start with a prefix.
 
+        :param prefix: The name prefix, matched by Secrets Manager and then again
+                       case-sensitively here.
+        :return: Yields secret names one at a time.
+        """
+        for secret in self.list(filters=[{"Key": "name", "Values": [prefix]}]):
+            if secret["Name"].startswith(prefix):
+                yield secret["Name"]
+
+    def _batch_get(self, names):
+        values, errors = {}, {}
+        response = self._call("batch_get_secret_value", SecretIdList=names)
+        requested = set(names)
+        for value in response.get("SecretValues", []):
+            secret_id = value["Name"] if value["Name"] in requested else value["ARN"]
+            values[secret_id] = value
+        for error in response.get("Errors", []):
+            error_response = {"Error": {"Code": error.get("ErrorCode"), "Message": error.get("Message")}}
+            errors[error["SecretId"]] = ClientError(error_response, "BatchGetSecretValue")
+        return values, errors
+
+    def _single_get(self, name):
+        try:
+            return self._call("get_secret_value", SecretId=name), None
+        except ClientError as e:
+            return None, e
+        except BotoCoreError as e:
+            return None, as_client_error(e, "GetSecretValue")
 
-aws = AwsSecretMgmt()
+    def get_many(self, names, deadline=None):
+        """
+        Gets the current values of many secrets.
+
+        Names are fetched with `BatchGetSecretValue` in chunks of 20, with the chunks
+        sent concurrently. When the batch API is not available to the caller, each
+        secret is fetched with `GetSecretValue` on a bounded thread pool instead. A
+        failure for one secret does not stop the others. Fresh entries in the cache,
+        when there is one, are served without a request.
+
+        :param names: The names or ARNs of the secrets.
+        :param deadline: Seconds the whole fetch may take, by default `self.deadline`.
+                         When it passes, secrets with a stale cached value get that
+                         value and the others a `DeadlineExceeded` error.
+        :return: A tuple of two dicts, the `GetSecretValue`-shaped responses and the
+                 `ClientError` for each secret that could not be fetched.
+        """
+        deadline = deadline if deadline is not None else self.deadline
+        if deadline is None:
+            return self._get_many(names)
+        names = list(names)
+        try:
+            return self.hedger.call(lambda: self._get_many(names), deadline)
+        except DeadlineExceededError as e:
+            values, errors = {}, {}
+            error_response = {"Error": {"Code": "DeadlineExceeded", "Message": str(e)}}
+            scope = self.cache_scope() if self.cache is not None else None
+            for name in dict.fromkeys(names):
+                stale = self.cache.get_stale(name, scope=scope) if self.cache is not None else None
+                if stale is not None:
+                    values[name] = stale
+                else:
+                    errors[name] = ClientError(error_response, "GetSecretValue")
+            logger.warning("No answer within %g seconds, using %d stale cached values.", deadline, len(values))
+            return values, errors
+
+    def _get_many(self, names):
+        response = self._agent_call("get_many", names=list(names))
+        if response is not _NO_AGENT:
+            errors = {
+                name: ClientError({"Error": error}, "BatchGetSecretValue") for name, error in response["errors"].items()
+            }
+            return response["values"], errors
+
+        values, errors = {}, {}
+        pending = []
+        scope = self.cache_scope() if self.cache is not None else None
+        for name in dict.fromkeys(names):
+            cached = self.cache.peek(name, scope=scope) if self.cache is not None else None
+            if cached is not None:
+                values[name] = cached
+            else:
+                pending.append(name)
+
+        if not hasattr(self.client, "batch_get_secret_value"):
+            # botocore releases before the batch API was added
+            self._batch_supported = False
+        chunks = [pending[i : i + BATCH_SIZE] for i in range(0, len(pending), BATCH_SIZE)]
+        fallback = []
+        if self._batch_supported and chunks:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as pool:
+                futures = [(pool.submit(self._batch_get, chunk), chunk) for chunk in chunks]
+                for future, chunk in futures:
+                    try:
+                        chunk_values, chunk_errors = future.result()
+                    except ClientError as e:
+                        if e.response["Error"]["Code"] in BATCH_UNSUPPORTED_ERRORS:
+                            logger.info("BatchGetSecretValue unavailable, using GetSecretValue: %s", e)
+                            self._batch_supported = False
+                            fallback.extend(chunk)
+                            continue
+                        logger.exception("Couldn't get values for %d secrets.", len(chunk))
+                        chunk_values, chunk_errors = {}, {name: e for name in chunk}
+                    except BotoCoreError as e:
+                        # the other chunks may still have succeeded, keep their values
+                        logger.exception("Couldn't get values for %d secrets.", len(chunk))
+                        error = as_client_error(e, "BatchGetSecretValue")
+                        chunk_values, chunk_errors = {}, {name: error for name in chunk}
+                    values.update(chunk_values)
+                    errors.update(chunk_errors)
+        elif chunks:
+            fallback = pending
+
+        if fallback:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(fallback))) as pool:
+                for name, (value, error) in zip(fallback, pool.map(self._single_get, fallback)):
+                    if error is None:
+                        values[name] = value
+                    else:
+                        errors[name] = error
+
+        if self.cache is not None:
+            for name in pending:
+                if name in values:
+                    self.cache.put(name, None, values[name], scope)
+        logger.info("Got values for %d secrets, %d failed.", len(values), len(errors))
+        return values, errors
+
+
+_aws = None
+
+
+def __getattr__(name):
+    # `aws` is built on first access so that importing this module stays cheap
+    global _aws
+    if name == "aws":
+        if _aws is None:
+            _aws = AwsSecretMgmt()
+        return _aws
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
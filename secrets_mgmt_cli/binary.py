@@ -0,0 +1,127 @@
+"""
+Packing of files into binary secrets.
+
+A packed value starts with a header naming the codec, so that it can be read back
+whatever the writer's defaults were:
+
+    b"SMGMTF" | version (1 byte) | codec (1 byte) | payload
+
+Values without the header are returned unchanged, so binary secrets written by
+other tools can be pulled too.
+"""
+
+import zlib
+
+MAGIC = b"SMGMTF"
+VERSION = 1
+# SecretBinary holds at most 64 KB
+MAX_SECRET_BYTES = 65536
+CHUNK_SIZE = 64 * 1024
+
+CODECS = {"none": 0, "zlib": 1, "zstd": 2}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODECS.items()}
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def available_codecs():
+    return [name for name in CODECS if name != "zstd" or _zstd() is not None]
+
+
+def default_codec():
+    return "zstd" if _zstd() is not None else "zlib"
+
+
+def _compressor(codec):
+    if codec == "zlib":
+        return zlib.compressobj(9)
+    if codec == "zstd":
+        zstandard = _zstd()
+        if zstandard is None:
+            raise RuntimeError("the zstd codec needs the zstandard package, install it with `pip install zstandard`")
+        return zstandard.ZstdCompressor(level=19).compressobj()
+    return None
+
+
+def _decompressor(codec):
+    if codec == "zlib":
+        return zlib.decompressobj()
+    if codec == "zstd":
+        zstandard = _zstd()
+        if zstandard is None:
+            raise RuntimeError("this secret is zstd compressed, install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompressobj()
+    return None
+
+
+def pack(stream, codec=None, limit=MAX_SECRET_BYTES) -> bytes:
+    """
+    Reads a binary stream in chunks and compresses it as it is read.
+
+    :param stream: A file object opened in binary mode.
+    :param codec: One of `CODECS`, by default zstd when it is installed and zlib
+                  otherwise. When compression does not make the value smaller,
+                  it is stored with the `none` codec instead.
+    :param limit: The largest packed value allowed.
+    :return: The header followed by the payload.
+    :raises ValueError: When the packed value is larger than `limit`.
+    """
+    codec = codec or default_codec()
+    compressor = _compressor(codec)
+    raw = bytearray()
+    parts = []
+    compressed = 0
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+        raw += chunk
+        if compressor is not None:
+            parts.append(compressor.compress(chunk))
+            compressed += len(parts[-1])
+        if (compressed if compressor is not None else len(raw)) > limit:
+            # stop reading large files as soon as they can't fit
+            raise ValueError(f"{len(raw)} bytes read and already over the {limit} byte limit with {codec}")
+    if compressor is not None:
+        parts.append(compressor.flush())
+        payload = b"".join(parts)
+        if len(payload) >= len(raw):
+            codec, payload = "none", bytes(raw)
+    else:
+        payload = bytes(raw)
+    packed = MAGIC + bytes([VERSION, CODECS[codec]]) + payload
+    if len(packed) > limit:
+        raise ValueError(f"{len(raw)} bytes compress to {len(packed)} with {codec}, over the {limit} byte limit")
+    return packed
+
+
+def unpack_to(blob: bytes, out) -> int:
+    """
+    Writes the contents of a packed value to a binary stream, decompressing in
+    chunks so that the whole file is never held twice.
+
+    :param blob: A value made by `pack`, or any other bytes, which are written as they are.
+    :param out: A file object opened in binary mode.
+    :return: The number of bytes written.
+    """
+    view = memoryview(blob)
+    header = len(MAGIC) + 2
+    if bytes(view[: len(MAGIC)]) != MAGIC or len(view) < header:
+        return out.write(view)
+    version, codec_id = view[len(MAGIC)], view[len(MAGIC) + 1]
+    if version != VERSION or codec_id not in CODEC_NAMES:
+        raise ValueError(f"unsupported packed secret, version {version} codec {codec_id}")
+    payload = view[header:]
+    decompressor = _decompressor(CODEC_NAMES[codec_id])
+    if decompressor is None:
+        # no copy, the payload is written straight from the response buffer
+        return out.write(payload)
+    written = 0
+    for start in range(0, len(payload), CHUNK_SIZE):
+        written += out.write(decompressor.decompress(payload[start : start + CHUNK_SIZE]))
+    if hasattr(decompressor, "flush"):
+        written += out.write(decompressor.flush())
+    return written
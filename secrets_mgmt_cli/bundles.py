@@ -0,0 +1,303 @@
+"""
+Bundles pack many small project dicts into one secret.
+
+A bundle is a `SecretString` of three parts, one header line, one index line and
+the body:
+
+    SMGMT-BUNDLE 1
+    {"app": [0, 27], "worker": [27, 31]}
+    {"DB_HOST":"db","PORT":"5432"}{"QUEUE":"jobs","CONCURRENCY":"4"}
+
+The index maps each project to the offset and length of its compact JSON object in
+the body, so that one project can be read without parsing any of the others. Bundles
+are stored next to the projects they replace, as `<prefix>/.bundle-0000` and so on.
+"""
+
+import json
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from .aws import parse_secret_value
+
+logger = logging.getLogger(__name__)
+
+MARKER = "SMGMT-BUNDLE 1"
+NAME_PREFIX = ".bundle-"
+# SecretString holds at most 64 KB, leave room for the header
+MAX_BUNDLE_BYTES = 60000
+
+
+def is_bundle_name(name) -> bool:
+    return posixpath.basename(name).startswith(NAME_PREFIX)
+
+
+def is_missing(error) -> bool:
+    """
+    Whether a `ClientError` means the secret can't be read because it is gone: it
+    does not exist, or it is scheduled for deletion, as sources are after
+    `pack --delete-sources`.
+    """
+    code, message = error.response["Error"]["Code"], error.response["Error"].get("Message", "")
+    return code == "ResourceNotFoundException" or (code == "InvalidRequestException" and "deletion" in message)
+
+
+def bundle_name(prefix, number) -> str:
+    return f"{prefix.rstrip('/')}/{NAME_PREFIX}{number:04d}"
+
+
+def encode_bundle(projects: dict) -> str:
+    """
+    :param projects: A dict of project name to its dict of keys and values.
+    :return: The bundle text.
+    """
+    index, body, offset = {}, [], 0
+    for project, values in projects.items():
+        # ensure_ascii keeps character offsets equal to byte offsets
+        encoded = json.dumps(values, separators=(",", ":"), ensure_ascii=True)
+        index[project] = [offset, len(encoded)]
+        body.append(encoded)
+        offset += len(encoded)
+    return "\n".join([MARKER, json.dumps(index, separators=(",", ":")), "".join(body)])
+
+
+def plan_bundles(projects: dict, max_bytes=MAX_BUNDLE_BYTES):
+    """
+    Splits projects, in name order, into groups that each encode to at most `max_bytes`.
+
+    :return: A list of dicts of project name to values.
+    :raises ValueError: When one project alone is too large for a bundle.
+    """
+    groups, current, size = [], {}, len(MARKER) + 4
+    for project in sorted(projects):
+        # the body entry, plus its index entry `"name":[offset,length],`
+        entry = len(json.dumps(projects[project], separators=(",", ":"))) + len(json.dumps(project)) + 16
+        if len(MARKER) + 4 + entry > max_bytes:
+            raise ValueError(f"project {project} is too large for a bundle")
+        if current and size + entry > max_bytes:
+            groups.append(current)
+            current, size = {}, len(MARKER) + 4
+        current[project] = projects[project]
+        size += entry
+    if current:
+        groups.append(current)
+    return groups
+
+
+class Bundle:
+    """A decoded bundle header; project bodies are only parsed when they are read."""
+
+    def __init__(self, text, response=None):
+        """
+        :param text: The bundle's `SecretString`.
+        :param response: The `GetSecretValue` response it came from, if any.
+        """
+        marker, sep, rest = text.partition("\n")
+        if marker != MARKER or not sep:
+            raise ValueError("not a secret bundle")
+        index, _, self._body = rest.partition("\n")
+        self.index = json.loads(index)
+        self.response = response or {}
+
+    @classmethod
+    def from_response(cls, response):
+        return cls(response.get("SecretString") or "", response)
+
+    def names(self):
+        return list(self.index)
+
+    def raw(self, project):
+        offset, length = self.index[project]
+        return self._body[offset : offset + length]
+
+    def get(self, project) -> dict:
+        return json.loads(self.raw(project))
+
+    def project_response(self, name, project):
+        """A `GetSecretValue`-shaped response for one project, its JSON still unparsed."""
+        return {
+            "Name": name,
+            "ARN": self.response.get("ARN"),
+            "VersionId": self.response.get("VersionId"),
+            "SecretString": self.raw(project),
+        }
+
+
+def load_bundles(aws, prefix):
+    """
+    Reads every bundle stored under a prefix.
+
+    :return: A list of `Bundle`s, in name order.
+    """
+    names = sorted(aws.list_names(f"{prefix.rstrip('/')}/{NAME_PREFIX}"))
+    values, errors = aws.get_many(names)
+    for name, error in errors.items():
+        logger.warning("Couldn't read bundle %s: %s", name, error)
+    return [Bundle.from_response(values[name]) for name in names if name in values]
+
+
+def get_many(aws, names):
+    """
+    Like `AwsSecretMgmt.get_many`, but also finds projects packed in bundles.
+
+    Bundles among `names`, as returned when listing a prefix, are replaced by the
+    projects they hold. Names that don't exist as secrets of their own are looked
+    up in the bundles of their parent prefix, and only their own entry is parsed.
+    A project that is both its own secret and in a bundle is read from its secret.
+
+    :return: A tuple of two dicts, `GetSecretValue`-shaped responses in the order of
+             `names`, and the `ClientError` for each name that could not be found.
+    """
+    names = list(dict.fromkeys(names))
+    values, errors = aws.get_many(names)
+    expanded = {}
+    for name in names:
+        if name in values and is_bundle_name(name):
+            try:
+                bundle = Bundle.from_response(values[name])
+            except ValueError:
+                continue
+            parent = posixpath.dirname(name)
+            expanded[name] = {f"{parent}/{project}": (bundle, project) for project in bundle.names()}
+
+    missing = [
+        name
+        for name, error in errors.items()
+        if is_missing(error) and not is_bundle_name(name)
+    ]
+    found = {}
+    for parent in dict.fromkeys(posixpath.dirname(name) for name in missing):
+        bundles = load_bundles(aws, parent)
+        for name in missing:
+            if posixpath.dirname(name) != parent:
+                continue
+            project = posixpath.basename(name)
+            bundle = next((b for b in bundles if project in b.index), None)
+            if bundle is not None:
+                found[name] = bundle.project_response(name, project)
+                del errors[name]
+
+    ordered = {}
+    for name in names:
+        if name in expanded:
+            for full, (bundle, project) in expanded[name].items():
+                if full not in ordered and full not in values:
+                    ordered[full] = bundle.project_response(full, project)
+        elif name in values:
+            ordered[name] = values[name]
+        elif name in found:
+            ordered[name] = found[name]
+    return ordered, errors
+
+
+def _each(aws, fn, items):
+    with ThreadPoolExecutor(max_workers=aws.max_workers) as pool:
+        return list(pool.map(fn, items))
+
+
+def _delete(aws, name):
+    try:
+        aws._call("delete_secret", SecretId=name)
+        aws._invalidate(name)
+    except ClientError as e:
+        logger.error("Couldn't delete secret %s: %s", name, e)
+        return e
+    return None
+
+
+def pack(aws, prefix, delete_sources=False):
+    """
+    Packs every JSON object secret under a prefix into bundles.
+
+    Bundles left over from an earlier, larger packing are deleted, and bundle names
+    that are scheduled for deletion are restored before they are written again. The
+    source secrets are kept unless `delete_sources` is set, in which case the ones
+    whose bundle was written are scheduled for deletion with the default recovery
+    window.
+
+    :return: A dict with the `bundles` written, the `projects` packed, and the
+             `skipped` secrets and bundles, by name, with the reason.
+    """
+    prefix = prefix.rstrip("/")
+    listed = [
+        secret
+        for secret in aws.list(filters=[{"Key": "name", "Values": [prefix + "/"]}], IncludePlannedDeletion=True)
+        if secret["Name"].startswith(prefix + "/")
+    ]
+    existing_bundles = {s["Name"] for s in listed if is_bundle_name(s["Name"]) and not s.get("DeletedDate")}
+    deleted_bundles = {s["Name"] for s in listed if is_bundle_name(s["Name"]) and s.get("DeletedDate")}
+    sources = [
+        s["Name"]
+        for s in listed
+        if not is_bundle_name(s["Name"]) and not s.get("DeletedDate") and posixpath.dirname(s["Name"]) == prefix
+    ]
+    values, errors = aws.get_many(sources)
+    skipped = {name: str(error) for name, error in errors.items()}
+    projects = {}
+    for name, response in values.items():
+        value = parse_secret_value(response)
+        if isinstance(value, dict):
+            projects[posixpath.basename(name)] = value
+        else:
+            skipped[name] = "secret value is not a json object"
+
+    def write(item):
+        number, group = item
+        name = bundle_name(prefix, number)
+        try:
+            # a deleted secret keeps its name until its recovery window ends
+            if name in deleted_bundles:
+                aws._call("restore_secret", SecretId=name)
+            aws.upsert(name, encode_bundle(group), create=name not in existing_bundles | deleted_bundles)
+        except ClientError as e:
+            logger.error("Couldn't write bundle %s: %s", name, e)
+            return e
+        return None
+
+    groups = plan_bundles(projects)
+    names = [bundle_name(prefix, number) for number in range(len(groups))]
+    written, packed = [], []
+    for name, group, error in zip(names, groups, _each(aws, write, list(enumerate(groups)))):
+        if error is not None:
+            skipped[name] = f"not written: {error}"
+            continue
+        written.append(name)
+        packed.extend(group)
+    _each(aws, lambda name: _delete(aws, name), sorted(existing_bundles - set(names)))
+    if delete_sources:
+        sources = [f"{prefix}/{project}" for project in packed]
+        for name, error in zip(sources, _each(aws, lambda name: _delete(aws, name), sources)):
+            if error is not None:
+                skipped[name] = f"packed, but not deleted: {error}"
+    logger.info("Packed %d projects into %d bundles.", len(packed), len(written))
+    return {"bundles": written, "projects": sorted(packed), "skipped": skipped}
+
+
+def unpack(aws, prefix, delete_bundles=False):
+    """
+    Writes each project held in the bundles under a prefix back to its own secret,
+    creating or updating only the ones that differ.
+
+    :return: The plan of `envfiles.plan_import`, after it was applied.
+    """
+    from .envfiles import apply_import, plan_import
+
+    prefix = prefix.rstrip("/")
+    bundles = load_bundles(aws, prefix)
+    secrets = {}
+    for bundle in bundles:
+        for project in bundle.names():
+            secrets.setdefault(f"{prefix}/{project}", bundle.get(project))
+    # secrets removed by `pack --delete-sources` can't be created again until they are restored
+    listed = aws.list(filters=[{"Key": "name", "Values": [prefix + "/"]}], IncludePlannedDeletion=True)
+    deleted = [secret["Name"] for secret in listed if secret.get("DeletedDate") and secret["Name"] in secrets]
+    _each(aws, lambda name: aws._call("restore_secret", SecretId=name), deleted)
+    if deleted:
+        logger.info("Restored %d secrets scheduled for deletion.", len(deleted))
+    plan = apply_import(aws, secrets, plan_import(aws, secrets))
+    if delete_bundles and not any(action == "failed" for _, action, _ in plan):
+        for bundle in bundles:
+            _delete(aws, bundle.response["Name"])
+    return plan
@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import pathlib
+import logging
+import datetime
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CURRENT_STAGE = "AWSCURRENT"
+
+
+def get_cache_dir() -> pathlib.Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(cache_home) / "smgmt"
+
+
+def version_for_stage(versions_to_stages: dict, stage: str = CURRENT_STAGE):
+    """
+    Finds the version ID that currently carries a staging label.
+
+    :param versions_to_stages: The `VersionIdsToStages` map from `DescribeSecret`, or
+                               the `SecretVersionsToStages` map from `ListSecrets`.
+    :param stage: The staging label to look for.
+    :return: The version ID, or None when no version has the label.
+    """
+    for version_id, stages in (versions_to_stages or {}).items():
+        if stage in stages:
+            return version_id
+    return None
+
+
+def _encode(obj):
+    if isinstance(obj, bytes):
+        return {"__bytes__": base64.b64encode(obj).decode("ascii")}
+    if isinstance(obj, datetime.datetime):
+        return {"__datetime__": obj.isoformat()}
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _decode(obj):
+    if "__bytes__" in obj:
+        return base64.b64decode(obj["__bytes__"])
+    if "__datetime__" in obj:
+        return datetime.datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+class DiskStore:
+    """
+    Stores cache entries on disk, encrypted with Fernet, one file per secret and stage.
+
+    File names are hashes of the secret name so that the directory listing does not
+    reveal which secrets were read. The key comes from the `SMGMT_CACHE_KEY`
+    environment variable, or from a key file created next to the entries with 0600
+    permissions.
+    """
+
+    def __init__(self, path=None, key=None):
+        try:
+            from cryptography.fernet import Fernet
+        except ImportError as e:
+            raise RuntimeError(
+                "the on-disk secret cache needs the cryptography package, "
+                "install it with `pip install 'secrets-mgmt-cli[cache]'`"
+            ) from e
+
+        self.path = pathlib.Path(path) if path is not None else get_cache_dir() / "secrets"
+        self.path.mkdir(parents=True, exist_ok=True, mode=0o700)
+        if key is None:
+            key = os.environ.get("SMGMT_CACHE_KEY") or self._load_or_create_key()
+        self.fernet = Fernet(key)
+
+    def _load_or_create_key(self):
+        from cryptography.fernet import Fernet
+
+        key_path = self.path / "key"
+        try:
+            return key_path.read_bytes()
+        except FileNotFoundError:
+            pass
+        # the key is written in full before it gets its name, so readers never see a
+        # partial key, and link fails instead of replacing a key another process made
+        key = Fernet.generate_key()
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=".key.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(key)
+            os.link(tmp_path, key_path)
+        except FileExistsError:
+            return key_path.read_bytes()
+        finally:
+            os.unlink(tmp_path)
+        return key
+
+    def _file(self, key):
+        digest = hashlib.sha256("\0".join(key).encode("utf8")).hexdigest()
+        return self.path / f"{digest}.bin"
+
+    def get(self, key):
+        from cryptography.fernet import InvalidToken
+
+        try:
+            token = self._file(key).read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            return json.loads(self.fernet.decrypt(token), object_hook=_decode)
+        except (InvalidToken, ValueError):
+            logger.warning("Ignoring unreadable cache entry for %s.", key[0])
+            return None
+
+    def put(self, key, entry):
+        token = self.fernet.encrypt(json.dumps(entry, default=_encode).encode("utf8"))
+        # a temp file of its own for every write, threads of one process included
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=".entry.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(token)
+            os.replace(tmp_path, self._file(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def delete(self, key):
+        try:
+            self._file(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for file_path in self.path.glob("*.bin"):
+            file_path.unlink()
+
+
+class SecretCache:
+    """
+    Read-through cache for `GetSecretValue` responses.
+
+    Entries are keyed by secret name, stage and scope, the profile and region the
+    value was read from, so that the same name in another account or region is never
+    served from the cache. They are kept in an in-memory LRU, with an optional
+    encrypted `DiskStore` behind it so that values survive across invocations. Once
+    an entry is older than `ttl`, a `DescribeSecret` call checks whether the version
+    holding the stage has changed, and the value is only fetched again when it has.
+    """
+
+    def __init__(self, ttl=300, max_entries=256, disk=None):
+        """
+        :param ttl: Seconds an entry is served without checking its version.
+        :param max_entries: The number of entries kept in memory.
+        :param disk: An optional `DiskStore` used as a second tier.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.stale = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _count(self, *counters):
+        with self._lock:
+            for counter in counters:
+                setattr(self, counter, getattr(self, counter) + 1)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self._store(key, entry, persist=False)
+        return entry
+
+    def _store(self, key, entry, persist=True):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if persist and self.disk is not None:
+            self.disk.put(key, entry)
+
+    def get(self, name, stage, fetch, current_version, scope=""):
+        """
+        Returns a cached `GetSecretValue` response, fetching it when needed.
+
+        :param name: The name of the secret.
+        :param stage: The stage of the secret, None means AWSCURRENT.
+        :param fetch: Called with no arguments to get a fresh `GetSecretValue` response.
+        :param current_version: Called with no arguments to get the version ID that
+                                currently holds the stage.
+        :param scope: Where the secret lives, such as `profile@region`.
+        :return: The `GetSecretValue` response.
+        """
+        key = (name, stage or CURRENT_STAGE, scope)
+        entry = self._lookup(key)
+        if entry is not None:
+            if time.time() - entry["fetched_at"] < self.ttl:
+                self._count("hits")
+                return entry["response"]
+            if current_version() == entry["response"].get("VersionId"):
+                self._count("hits", "revalidations")
+                self._store(key, dict(entry, fetched_at=time.time()))
+                return entry["response"]
+
+        return self.put(name, stage, fetch(), scope)
+
+    def peek(self, name, stage=None, scope=""):
+        """
+        Returns a cached response only when it is within the TTL, without any request.
+
+        :return: The `GetSecretValue` response, or None.
+        """
+        entry = self._lookup((name, stage or CURRENT_STAGE, scope))
+        if entry is not None and time.time() - entry["fetched_at"] < self.ttl:
+            self._count("hits")
+            return entry["response"]
+        return None
+
+    def get_stale(self, name, stage=None, scope=""):
+        """
+        Returns a cached response whatever its age, for when a fresh one could not be
+        had in time.
+
+        :return: The `GetSecretValue` response, or None.
+        """
+        entry = self._lookup((name, stage or CURRENT_STAGE, scope))
+        if entry is None:
+            return None
+        self._count("stale")
+        return entry["response"]
+
+    def put(self, name, stage, response, scope=""):
+        """
+        Stores a response that was fetched because the cache could not serve it, so
+        it is counted as a miss.
+
+        :return: The stored response.
+        """
+        response = {k: v for k, v in response.items() if k != "ResponseMetadata"}
+        self._store((name, stage or CURRENT_STAGE, scope), {"fetched_at": time.time(), "response": response})
+        self._count("misses")
+        return response
+
+    def invalidate(self, name, scope=""):
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == name and key[2] == scope]
+            for key in keys:
+                del self._entries[key]
+        if self.disk is not None:
+            for key in set(keys) | {(name, CURRENT_STAGE, scope)}:
+                self.disk.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "stale": self.stale,
+            "entries": len(self._entries),
+        }
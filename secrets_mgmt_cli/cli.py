@@ -1,19 +1,173 @@
 import os
+import sys
 import json
-import datetime
+import base64
+import tempfile
 
 import click
 
-from .aws import aws
-from .config import ConfigHandler, config_handler
+from .binary import CODECS
+from .cache import DiskStore, SecretCache
+from .clients import RETRY_MODES, ClientFactory, get_client_factory, get_default_region, set_client_factory
+from .credentials import CredentialCache
+from .instrumentation import recorder
+from .config import ConfigHandler
+from .output import FORMATS, write_records
 
 
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, z):
-        if isinstance(z, datetime.datetime):
-            return str(z)
-        else:
-            return super().default(z)
+def get_aws(snapshot_ok=False):
+    """return the shared AwsSecretMgmt, importing boto3 only when a command needs it
+
+    With --snapshot, commands that pass snapshot_ok get the snapshot reader instead."""
+    ctx = click.get_current_context(silent=True)
+    if ctx is not None and (ctx.find_root().obj or {}).get("snapshot_path"):
+        if not snapshot_ok:
+            raise click.UsageError("--snapshot only serves get, exec and transfer")
+        return open_snapshot(ctx.find_root().obj)
+    from .aws import aws
+
+    if ctx is not None and ctx.find_root().obj:
+        options = ctx.find_root().obj
+        aws.cache = options.get("cache")
+        if aws._client is None:
+            aws.profile = options.get("profile")
+            aws.region = options.get("region")
+        aws.deadline = options.get("deadline")
+        aws.hedge = options.get("hedge", False)
+        if not options.get("agent_checked"):
+            options["agent_checked"] = True
+            aws.agent = None
+            if options.get("use_agent"):
+                from .agent import connect_agent
+
+                aws.agent = connect_agent(aws.profile, aws.region)
+    return aws
+
+
+def open_snapshot(options):
+    "open the --snapshot file once per invocation, decrypting only its index"
+    if options.get("snapshot") is None:
+        from .snapshot import Snapshot, load_key
+
+        try:
+            options["snapshot"] = Snapshot(options["snapshot_path"], load_key(options["snapshot_key_file"]))
+        except (OSError, RuntimeError, ValueError) as e:
+            raise click.UsageError(f"can't open snapshot: {e}")
+    return options["snapshot"]
+
+
+def index_options(f):
+    "add the options that answer a command from the local metadata index"
+    f = click.option(
+        "--max-staleness",
+        "max_staleness",
+        type=int,
+        default=None,
+        help="answer from the local index, syncing it first when older than this many seconds",
+    )(f)
+    f = click.option("--offline", is_flag=True, help="answer from the local index without contacting AWS")(f)
+    return f
+
+
+def output_options(f):
+    "add the options that select how a command writes secret records"
+    f = click.option(
+        "--fields",
+        "fields",
+        default=None,
+        help="comma separated keys to keep from each record, e.g. Name,ARN",
+    )(f)
+    f = click.option("--format", "fmt", type=click.Choice(FORMATS), default="table", show_default=True)(f)
+    return f
+
+
+def target_options(f):
+    "add the options that fan a command out over several profiles and regions"
+    f = click.option(
+        "--regions",
+        "regions",
+        multiple=True,
+        help="comma separated regions to query at the same time, or `all`",
+    )(f)
+    f = click.option(
+        "--profiles",
+        "profiles",
+        multiple=True,
+        help="comma separated profiles to query at the same time, or `all`",
+    )(f)
+    return f
+
+
+def resolve_targets(profiles, regions, offline=False, max_staleness=None):
+    "return the targets to fan out to, or None when the command talks to one region"
+    if not profiles and not regions:
+        return None
+    if offline or max_staleness is not None:
+        raise click.UsageError("--profiles and --regions can't be combined with the local index")
+    from .fanout import resolve_targets
+
+    options = click.get_current_context().find_root().obj or {}
+    return resolve_targets(profiles, regions, options.get("profile"), options.get("region"))
+
+
+def fan_out_records(targets, fn, errors):
+    "stream the records fn yields for every target, tagged with region and account"
+    from .fanout import fan_out, tag
+
+    for target, aws, record in fan_out(targets, fn, errors):
+        yield tag(record, target, aws)
+
+
+def echo_target_errors(errors):
+    for target, error in errors.items():
+        click.echo(f"failed {target.profile or 'default'} {target.region or ''}: {error}".rstrip(), err=True)
+    if errors:
+        sys.exit(1)
+
+
+def index_scope():
+    "the profile and region the local index is kept for, as in AwsSecretMgmt.cache_scope"
+    options = click.get_current_context().find_root().obj or {}
+    profile = options.get("profile")
+    return f"{profile or 'default'}@{options.get('region') or get_default_region(profile)}"
+
+
+def open_index(offline, max_staleness):
+    "return the local SecretIndex when the index options ask for it, synced as needed"
+    if not offline and max_staleness is None:
+        return None
+    from .index import SecretIndex
+
+    index = SecretIndex(scope=index_scope())
+    if offline:
+        if index.last_sync is None:
+            raise click.UsageError("the local index is empty, run `smgmt sync` first")
+    elif index.last_sync is None or index.age() > max_staleness:
+        index.sync(get_aws())
+    return index
+
+
+def report(ctx, command_span, stats, cache_stats, trace_file):
+    "close the command span, then print --stats or --cache-stats and write the --trace file"
+    if command_span is not None:
+        command_span.__exit__(None, None, None)
+    if stats:
+        click.echo(recorder.summary(), err=True)
+    if stats or cache_stats:
+        options = ctx.obj or {}
+        if options.get("cache") is not None:
+            click.echo(f"cache: {options['cache'].stats()}", err=True)
+        credential_cache = get_client_factory().credential_cache
+        if credential_cache is not None:
+            click.echo(f"credentials: {credential_cache.stats()}", err=True)
+    if stats:
+        aws_module = sys.modules.get("secrets_mgmt_cli.aws")
+        if aws_module is not None and aws_module._aws is not None:
+            click.echo(f"limiter: {aws_module._aws.limiter.stats()}", err=True)
+            if aws_module._aws.deadline is not None:
+                click.echo(f"reads: {aws_module._aws.hedger.stats()}", err=True)
+    if trace_file:
+        recorder.write_trace(trace_file)
 
 
 def echo_dict(input_dict: dict):
@@ -21,24 +175,193 @@ def echo_dict(input_dict: dict):
         click.echo(f"{key[:18]+'..' if len(key)>17 else key}{(20-int(len(key)))*'.'}{val}")
 
 
-@click.group()
+class Group(click.Group):
+    "reports errors that any command can raise in one line, as for other Click errors"
+
+    def invoke(self, ctx):
+        from .deadline import DeadlineExceededError
+
+        try:
+            return super().invoke(ctx)
+        except DeadlineExceededError as e:
+            raise click.ClickException(str(e))
+
+
+@click.group(cls=Group)
 @click.version_option()
-def cli():
+@click.option(
+    "--cache-ttl",
+    "cache_ttl",
+    type=int,
+    default=None,
+    envvar="SMGMT_CACHE_TTL",
+    help="cache secret values, checking for a new version after this many seconds",
+)
+@click.option(
+    "--disk-cache",
+    "disk_cache",
+    is_flag=True,
+    envvar="SMGMT_DISK_CACHE",
+    help="keep cached values encrypted under ~/.cache/smgmt between invocations",
+)
+@click.option("--cache-stats", "cache_stats", is_flag=True, help="print only the cache lines of --stats on exit")
+@click.option("--profile", "profile", default=None, envvar="SMGMT_PROFILE", help="AWS profile to use")
+@click.option("--region", "region", default=None, envvar="SMGMT_REGION", help="AWS region to use")
+@click.option(
+    "--max-pool-connections",
+    "max_pool_connections",
+    type=int,
+    default=50,
+    show_default=True,
+    envvar="SMGMT_MAX_POOL_CONNECTIONS",
+    help="HTTP connections kept open per client",
+)
+@click.option("--connect-timeout", "connect_timeout", type=float, default=5, envvar="SMGMT_CONNECT_TIMEOUT")
+@click.option("--read-timeout", "read_timeout", type=float, default=30, envvar="SMGMT_READ_TIMEOUT")
+@click.option("--tcp-keepalive/--no-tcp-keepalive", "tcp_keepalive", default=True, envvar="SMGMT_TCP_KEEPALIVE")
+@click.option(
+    "--retry-mode",
+    "retry_mode",
+    type=click.Choice(RETRY_MODES),
+    default="standard",
+    show_default=True,
+    envvar="SMGMT_RETRY_MODE",
+)
+@click.option("--max-attempts", "max_attempts", type=int, default=3, envvar="SMGMT_MAX_ATTEMPTS")
+@click.option(
+    "--deadline",
+    "deadline",
+    type=float,
+    default=None,
+    envvar="SMGMT_DEADLINE",
+    help="seconds each read may take, retries included, before falling back to a stale cached value",
+)
+@click.option(
+    "--hedge",
+    "hedge",
+    is_flag=True,
+    envvar="SMGMT_HEDGE",
+    help="with --deadline, send a second read when the first is slower than the p95 latency",
+)
+@click.option(
+    "--no-credential-cache",
+    "no_credential_cache",
+    is_flag=True,
+    envvar="SMGMT_NO_CREDENTIAL_CACHE",
+    help="don't keep assumed-role and SSO credentials under ~/.cache/smgmt between invocations",
+)
+@click.option(
+    "--no-agent",
+    "no_agent",
+    is_flag=True,
+    envvar="SMGMT_NO_AGENT",
+    help="call Secrets Manager directly even when `smgmt agent` is running",
+)
+@click.option(
+    "--snapshot",
+    "snapshot_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    envvar="SMGMT_SNAPSHOT",
+    help="serve get, exec and transfer from this file written by `smgmt snapshot export`",
+)
+@click.option(
+    "--snapshot-key-file",
+    "snapshot_key_file",
+    type=click.Path(dir_okay=False),
+    default=None,
+    envvar="SMGMT_SNAPSHOT_KEY_FILE",
+    help="the key of the snapshot, when SMGMT_SNAPSHOT_KEY is not set",
+)
+@click.option("--stats", "stats", is_flag=True, help="print API latency, retries, bytes and local timings on exit")
+@click.option(
+    "--trace",
+    "trace_file",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="write a Chrome trace timeline of this invocation to a JSON file",
+)
+@click.pass_context
+def cli(
+    ctx,
+    cache_ttl,
+    disk_cache,
+    cache_stats,
+    profile,
+    region,
+    max_pool_connections,
+    connect_timeout,
+    read_timeout,
+    tcp_keepalive,
+    retry_mode,
+    max_attempts,
+    deadline,
+    hedge,
+    no_credential_cache,
+    no_agent,
+    snapshot_path,
+    snapshot_key_file,
+    stats,
+    trace_file,
+):
     "A simple CLI for managing secrets in AWS Secrets Manager"
-    pass
+    command_span = None
+    if stats or trace_file:
+        recorder.enable()
+        command_span = recorder.span(ctx.invoked_subcommand or "smgmt", cat="command")
+        command_span.__enter__()
+    if stats or cache_stats or trace_file:
+        ctx.call_on_close(lambda: report(ctx, command_span, stats, cache_stats, trace_file))
+    set_client_factory(
+        ClientFactory(
+            max_pool_connections=max_pool_connections,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            tcp_keepalive=tcp_keepalive,
+            retry_mode=retry_mode,
+            max_attempts=max_attempts,
+            credential_cache=None if no_credential_cache else CredentialCache(),
+        )
+    )
+    cache = None
+    if cache_ttl is not None:
+        try:
+            cache = SecretCache(ttl=cache_ttl, disk=DiskStore() if disk_cache else None)
+        except RuntimeError as e:
+            raise click.UsageError(str(e))
+    ctx.obj = {
+        "cache": cache,
+        "profile": profile,
+        "region": region,
+        "use_agent": not no_agent,
+        "deadline": deadline,
+        "hedge": hedge,
+        "snapshot_path": snapshot_path,
+        "snapshot_key_file": snapshot_key_file,
+        "snapshot": None,
+    }
 
 
 @cli.command()
-@click.option("--config", is_flag=True)
-def ls(config):
+@click.option("--config", is_flag=True, help="list project configs under ~/.config instead")
+@click.option("--transferred", is_flag=True, help="with --config, only dirs written by `transfer`")
+@index_options
+@target_options
+@output_options
+def ls(config, transferred, offline, max_staleness, profiles, regions, fmt, fields):
     "list secrets in AWS Secrets Manager"
     if config:
-        config_handler.list_config_dirs()
-    else:
-        resp = aws.get_secrets_list()
-        for secret in resp.get("SecretList"):
-            click.echo(f"\n-- {secret.get('Name')} --")
-            echo_dict(secret)
+        ConfigHandler(verbose=False).list_config_dirs(transferred_only=transferred)
+        return
+    targets = resolve_targets(profiles, regions, offline, max_staleness)
+    if targets is not None:
+        errors = {}
+        secrets = fan_out_records(targets, lambda target, aws: aws.list(), errors)
+        write_records(secrets, fmt, fields.split(",") if fields else None)
+        return echo_target_errors(errors)
+    index = open_index(offline, max_staleness)
+    secrets = index.search() if index is not None else get_aws().list()
+    write_records(secrets, fmt, fields.split(",") if fields else None)
 
 
 @cli.command()
@@ -46,13 +369,14 @@ def ls(config):
 @click.option("-n", "--secret-name", "secret_name", required=True)
 def create(secret_string, secret_name):
     "create new secret"
-    aws.create(name=secret_name, secret_value=secret_string)
+    get_aws().create(name=secret_name, secret_value=secret_string)
 
 
 @cli.command()
 @click.option("-n", "--secret-name", "secret_name", required=True)
 def read(secret_name):
     "read contents of secret, metadata and secret_string"
+    aws = get_aws()
     resp = aws.describe(name=secret_name)
     echo_dict(resp)
     value = click.prompt("display secret string? [Y/n]", type=str)
@@ -60,51 +384,588 @@ def read(secret_name):
         click.echo(aws.get_value())
 
 
+def parse_assignment(ctx, param, values):
+    "turn KEY=VAL options into a dict"
+    assignments = {}
+    for value in values:
+        key, sep, val = value.partition("=")
+        if not sep or not key:
+            raise click.BadParameter(f"expected KEY=VAL, got {value!r}", ctx=ctx, param=param)
+        assignments[key] = val
+    return assignments
+
+
 @cli.command()
-@click.option("-s", "--secret-string", "secret_string", help="serialized json", required=True)
+@click.option("-s", "--secret-string", "secret_string", help="serialized json, replaces the whole value")
 @click.option("-n", "--secret-name", "secret_name", required=True)
-def update(secret_string, secret_name):  # , description):
-    "change or add the contents of an existing secert"
-    resp = aws.put_value(secret_value=secret_string, name=secret_name)
-    click.echo(resp)
+@click.option("--set", "set_keys", multiple=True, callback=parse_assignment, help="KEY=VAL, may be given many times")
+@click.option("--unset", "unset_keys", multiple=True, help="KEY to remove, may be given many times")
+def update(secret_string, secret_name, set_keys, unset_keys):  # , description):
+    """change or add the contents of an existing secert
+
+    No version is created when the new value equals the current one, and the update
+    fails instead of overwriting a version another writer created meanwhile."""
+    from .aws import ConcurrentModificationError
+
+    if (secret_string is None) == (not set_keys and not unset_keys):
+        raise click.UsageError("pass either --secret-string, or --set and --unset")
+    try:
+        resp = get_aws().update_value(
+            secret_name, secret_string=secret_string, set_keys=set_keys, unset_keys=unset_keys
+        )
+    except (ConcurrentModificationError, ValueError) as e:
+        raise click.ClickException(str(e))
+    click.echo(resp if resp is not None else f"unchanged: {secret_name}")
 
 
 @cli.command()
 @click.option("-n", "--secret-name", "secret_name", required=True)
 def delete(secret_name):
     "remove or archive a secret from AWS Secret Manager"
-    resp = aws.delete(name=secret_name, without_recovery=False)
+    resp = get_aws().delete(name=secret_name, without_recovery=False)
     click.echo(resp)
 
 
 @cli.command()
-@click.option("-k", "--key-word", "key_word", required=True)
-def search(key_word):
-    "list secrets in AWS Secrets Manager with regex match"
-    resp = aws.get_secrets_list()
-    for secret in resp.get("SecretList"):
-        if key_word in secret.get("Name"):
-            click.echo(f"\n-- {secret.get('Name')} --")
-            echo_dict(secret)
+@click.option("-k", "--key-word", "key_words", multiple=True, help="match secret names, filtered by AWS")
+@click.option("--tag-key", "tag_keys", multiple=True, help="match tag keys, filtered by AWS")
+@click.option("--tag-value", "tag_values", multiple=True, help="match tag values, filtered by AWS")
+@click.option("--description", "descriptions", multiple=True, help="match descriptions, filtered by AWS")
+@click.option("-r", "--regex", "regex", default=None, help="regex searched for in the names AWS returns")
+@index_options
+@target_options
+@output_options
+def search(
+    key_words, tag_keys, tag_values, descriptions, regex, offline, max_staleness, profiles, regions, fmt, fields
+):
+    """list secrets in AWS Secrets Manager with regex match
+
+    With --offline or --max-staleness the local index is searched instead: the
+    filters match substrings and --regex also matches tag keys and values."""
+    if not (key_words or tag_keys or tag_values or descriptions or regex):
+        raise click.UsageError("pass at least one of --key-word, --tag-key, --tag-value, --description or --regex")
+    criteria = dict(name=key_words, tag_key=tag_keys, tag_value=tag_values, description=descriptions, pattern=regex)
+    targets = resolve_targets(profiles, regions, offline, max_staleness)
+    if targets is not None:
+        errors = {}
+        secrets = fan_out_records(targets, lambda target, aws: aws.search(**criteria), errors)
+        write_records(secrets, fmt, fields.split(",") if fields else None)
+        return echo_target_errors(errors)
+    source = open_index(offline, max_staleness) or get_aws()
+    secrets = source.search(**criteria)
+    write_records(secrets, fmt, fields.split(",") if fields else None)
+
+
+@cli.command()
+@click.option("--full", is_flag=True, help="re-read every secret instead of only recent changes")
+def sync(full):
+    "update the local index of secret metadata used by --offline and --max-staleness"
+    from .index import SecretIndex
+
+    count = SecretIndex(scope=index_scope()).sync(get_aws(), full=full)
+    click.echo(f"synced {count} secrets")
+
+
+@cli.command()
+@click.option("-n", "--secret-name", "secret_names", multiple=True, help="may be given many times")
+@click.option("--prefix", "prefix", default=None, help="get every secret whose name starts with this")
+@target_options
+def get(secret_names, prefix, profiles, regions):
+    """print the values of one or more secrets as json
+
+    With --profiles or --regions, prints a list of records tagged with the region
+    and account each value came from."""
+    if not secret_names and prefix is None:
+        raise click.UsageError("pass at least one --secret-name or a --prefix")
+    from .aws import parse_secret_value
+
+    targets = resolve_targets(profiles, regions)
+    if targets is not None:
+        return get_fan_out(targets, secret_names, prefix)
+    from . import bundles
+
+    aws = get_aws(snapshot_ok=True)
+    names = list(secret_names)
+    if prefix is not None:
+        names.extend(aws.list_names(prefix))
+    values, errors = bundles.get_many(aws, names)
+    output = {}
+    for name, response in values.items():
+        value = parse_secret_value(response)
+        output[name] = base64.b64encode(value).decode("ascii") if isinstance(value, bytes) else value
+    click.echo(json.dumps(output, indent=2))
+    for name, error in errors.items():
+        click.echo(f"{name}: {error}", err=True)
+    if errors:
+        sys.exit(1)
+
+
+def get_fan_out(targets, secret_names, prefix):
+    from .aws import parse_secret_value
+
+    def fetch(target, aws):
+        names = list(secret_names)
+        if prefix is not None:
+            names.extend(aws.list_names(prefix))
+        values, errors = aws.get_many(names)
+        for name in names:
+            if name in values:
+                value = parse_secret_value(values[name])
+                value = base64.b64encode(value).decode("ascii") if isinstance(value, bytes) else value
+                yield {"Name": name, "ARN": values[name].get("ARN"), "Value": value}
+            elif name in errors:
+                yield {"Name": name, "Error": str(errors[name])}
+
+    target_errors = {}
+    output, failed = [], False
+    for record in fan_out_records(targets, fetch, target_errors):
+        if "Error" in record:
+            failed = True
+            click.echo(f"{record['Name']} ({record['Region']}): {record['Error']}", err=True)
+        else:
+            output.append(record)
+    click.echo(json.dumps(output, indent=2))
+    if failed and not target_errors:
+        sys.exit(1)
+    echo_target_errors(target_errors)
+
+
+def secret_env(values: dict, names, keys=(), key_prefix=""):
+    """
+    Merges the JSON objects of several secrets into environment variables, later
+    secrets overriding earlier ones.
+
+    :param values: The parsed value of each secret, by name.
+    :param names: The secret names, in the order they are merged.
+    :param keys: When given, only these keys are kept, and each must be present.
+    :param key_prefix: Prepended to every variable name.
+    :return: A dict of variable names to string values.
+    """
+    merged = {}
+    for name in names:
+        value = values[name]
+        if not isinstance(value, dict):
+            raise click.UsageError(f"secret {name} is not a json object")
+        merged.update(value)
+    if keys:
+        missing = [key for key in keys if key not in merged]
+        if missing:
+            raise click.UsageError(f"keys not found in the secrets: {', '.join(missing)}")
+        merged = {key: merged[key] for key in keys}
+    return {key_prefix + key: val if isinstance(val, str) else json.dumps(val) for key, val in merged.items()}
+
+
+@cli.command(name="exec", context_settings={"allow_interspersed_args": False})
+@click.option("-n", "--secret-name", "secret_names", multiple=True, required=True, help="may be given many times")
+@click.option("-k", "--key", "keys", multiple=True, help="only export this key, may be given many times")
+@click.option("--key-prefix", "key_prefix", default="", help="prepended to every variable name, e.g. APP_")
+@click.argument("command", nargs=-1, required=True, type=click.UNPROCESSED)
+def exec_(secret_names, keys, key_prefix, command):
+    """run COMMAND with the keys of the secrets added to its environment
+
+    The secrets are fetched concurrently and handed to the command through execve,
+    without writing them to disk, e.g. `smgmt exec -n projects/dev/app -- ./serve`."""
+    from . import bundles
+    from .aws import parse_secret_value
+
+    values, errors = bundles.get_many(get_aws(snapshot_ok=True), secret_names)
+    for name, error in errors.items():
+        click.echo(f"{name}: {error}", err=True)
+    if errors:
+        sys.exit(1)
+    env = dict(os.environ)
+    # values is in the order of secret_names, with each bundle replaced by its projects
+    env.update(secret_env({name: parse_secret_value(values[name]) for name in values}, list(values), keys, key_prefix))
+    sys.stdout.flush()
+    try:
+        os.execvpe(command[0], command, env)
+    except OSError as e:
+        raise click.ClickException(f"couldn't run {command[0]}: {e}")
 
 
 @cli.command()
 @click.option("-n", "--secret-name", "secret_name", required=False, default=None)
-@click.option("-p", "--project-name", "project_name", required=True)
-def transfer(secret_name, project_name):
-    config = ConfigHandler(project_name)
+@click.option("-p", "--project-name", "project_name", required=False, default=None)
+@click.option("--prefix", "prefix", default="projects/dev", show_default=True)
+@click.option("--all", "all_projects", is_flag=True, help="transfer every project under --prefix")
+def transfer(secret_name, project_name, prefix, all_projects):
+    "write secrets into ~/.config/<project>/config"
+    if all_projects:
+        return transfer_all(prefix)
+    if project_name is None:
+        raise click.UsageError("pass --project-name or --all")
+    from . import bundles
+    from .aws import parse_secret_value
+
+    try:
+        config = ConfigHandler(project_name)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--project-name")
     if secret_name is None:
-        secrets_prefix = "projects/dev"
-        secret_name = os.path.join(secrets_prefix, project_name)
-    secret = aws.get_secret(secret_name=secret_name)
-    config.write_config_file_from_dict(config_dict=secret)
+        secret_name = os.path.join(prefix, project_name)
+    values, errors = bundles.get_many(get_aws(snapshot_ok=True), [secret_name])
+    if secret_name in errors:
+        raise errors[secret_name]
+    secret = parse_secret_value(values[secret_name])
+    config.write_config_file_from_dict(config_dict=secret, source=secret_name)
     return config.print_configs()
 
 
+def transfer_all(prefix):
+    from . import bundles
+    from .aws import parse_secret_value
+
+    aws = get_aws(snapshot_ok=True)
+    prefix = prefix.rstrip("/") + "/"
+    names = list(aws.list_names(prefix))
+    values, errors = bundles.get_many(aws, names)
+    updated, unchanged = [], []
+    failed = {name: str(error) for name, error in errors.items()}
+    for name, response in values.items():
+        value = parse_secret_value(response)
+        if not isinstance(value, dict):
+            failed[name] = "secret value is not a json object"
+            continue
+        try:
+            config = ConfigHandler(name[len(prefix) :], verbose=False)
+            changed = config.write_config_file_from_dict(config_dict=value, source=name)
+        except (OSError, ValueError) as e:
+            failed[name] = str(e)
+            continue
+        (updated if changed else unchanged).append(name)
+
+    for name, error in sorted(failed.items()):
+        click.echo(f"failed {name}: {error}", err=True)
+    click.echo(f"updated: {len(updated)}, unchanged: {len(unchanged)}, failed: {len(failed)}")
+    if failed:
+        sys.exit(1)
+
+
+@cli.command()
+@click.option("--prefix", "prefix", required=True, help="rotate every secret whose name starts with this")
+@click.option("--key", "key", required=True, help="the key of the JSON object that holds the password")
+@click.option("--length", "length", type=int, default=32, show_default=True)
+@click.option("--exclude-characters", "exclude_characters", default="")
+@click.option("--exclude-numbers", is_flag=True)
+@click.option("--exclude-punctuation", is_flag=True)
+@click.option("--exclude-uppercase", is_flag=True)
+@click.option("--exclude-lowercase", is_flag=True)
+@click.option("--include-space", is_flag=True)
+@click.option("--require-each-included-type/--no-require-each-included-type", default=True)
+@click.option("--verify", "verify", default=None, help="shell command that checks each pending value read on stdin")
+@click.option("--checkpoint", "checkpoint_path", default=None, help="progress file, resumed when it exists")
+@click.option("--concurrency", "concurrency", type=int, default=8, show_default=True)
+def rotate(prefix, key, verify, checkpoint_path, concurrency, **password_options):
+    """put a new random password into many JSON secrets
+
+    New values are staged as AWSPENDING, checked with --verify, then promoted to
+    AWSCURRENT. Progress is kept in a checkpoint file so that an interrupted run
+    picks up where it stopped when started again with the same options."""
+    from .bundles import is_bundle_name
+    from .rotate import Checkpoint, Rotator, default_checkpoint_path, generate_password
+
+    try:
+        generate_password(**password_options)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    aws = get_aws()
+    checkpoint = Checkpoint(checkpoint_path or default_checkpoint_path(prefix, key))
+    rotator = Rotator(aws, key, password_options, verify=verify, checkpoint=checkpoint, concurrency=concurrency)
+    # bundles hold copies of other secrets, `bundle pack` rebuilds them from the rotated values
+    states = rotator.run(name for name in aws.list_names(prefix) if not is_bundle_name(name))
+    failed = {name: checkpoint.get(name).get("error") for name, state in states.items() if state != "done"}
+    for name, error in sorted(failed.items()):
+        click.echo(f"failed {name}: {error}", err=True)
+    click.echo(f"rotated: {len(states) - len(failed)}, failed: {len(failed)}")
+    if failed:
+        click.echo(f"run the same command again to retry, progress is kept in {checkpoint.path}", err=True)
+        sys.exit(1)
+    checkpoint.remove()
+
+
+@cli.command(name="push-file")
+@click.argument("path", type=click.File("rb"))
+@click.option("-n", "--secret-name", "secret_name", required=True)
+@click.option(
+    "--codec", "codec", type=click.Choice(list(CODECS)), default=None, help="default: zstd if installed, else zlib"
+)
+@click.option("--create", "create", is_flag=True, help="create the secret instead of adding a version")
+def push_file(path, secret_name, codec, create):
+    "store a file, or stdin for -, compressed in a binary secret"
+    from .binary import pack
+
+    try:
+        blob = pack(path, codec)
+    except (ValueError, RuntimeError) as e:
+        raise click.ClickException(str(e))
+    resp = get_aws().upsert(secret_name, blob, create=create)
+    click.echo(f"{secret_name}: {len(blob)} bytes stored, version {resp.get('VersionId')}")
+
+
+@cli.command(name="pull-file")
+@click.option("-n", "--secret-name", "secret_name", required=True)
+@click.option("-o", "--output", "output", default="-", type=click.Path(dir_okay=False, allow_dash=True))
+def pull_file(secret_name, output):
+    "write the file stored in a binary secret to --output, stdout by default"
+    from .binary import CHUNK_SIZE, unpack_to
+
+    value = get_aws().get_secret(secret_name)
+    if not isinstance(value, (bytes, bytearray)):
+        raise click.ClickException(f"{secret_name} is not a binary secret")
+    try:
+        if output == "-":
+            with click.open_file("-", "wb") as stream:
+                unpack_to(value, stream)
+                stream.flush()
+            return
+        # written next to the destination with owner-only permissions, then renamed into place
+        directory = os.path.dirname(os.path.abspath(output))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".smgmt.")
+        try:
+            with os.fdopen(fd, "wb", buffering=CHUNK_SIZE) as f:
+                unpack_to(value, f)
+            os.replace(tmp_path, output)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except (ValueError, RuntimeError) as e:
+        raise click.ClickException(str(e))
+
+
+@cli.command()
+@click.option("--prefix", "prefix", default="projects/dev", show_default=True)
+@click.option("--interval", "interval", type=float, default=30, show_default=True, help="seconds between polls")
+@click.option("--max-interval", "max_interval", type=float, default=300, show_default=True, help="longest backoff")
+@click.option("--hook", "hook", default=None, help="shell command run after a config file changed")
+@click.option("--once", is_flag=True, help="poll once and exit")
+def watch(prefix, interval, max_interval, hook, once):
+    """keep ~/.config/<project>/config up to date with the secrets under --prefix
+
+    Only secrets whose AWSCURRENT version changed are fetched, so a quiet prefix
+    costs one ListSecrets page per poll."""
+    from .watch import Watcher
+
+    def on_change(names):
+        for name in names:
+            click.echo(f"updated {name}")
+
+    watcher = Watcher(get_aws(), prefix, hook=hook, interval=interval, max_interval=max_interval)
+    try:
+        watcher.run(polls=1 if once else None, on_change=on_change)
+    except KeyboardInterrupt:
+        pass
+
+
+@cli.group()
+def bundle():
+    """pack many small project secrets into a few bundle secrets, or back
+
+    get, exec and transfer read projects from the bundles under their prefix when
+    the project has no secret of its own."""
+
+
+@bundle.command(name="pack")
+@click.option("--prefix", "prefix", default="projects/dev", show_default=True)
+@click.option("--delete-sources", is_flag=True, help="schedule the packed secrets for deletion")
+def bundle_pack(prefix, delete_sources):
+    "pack every JSON secret directly under --prefix into bundles"
+    from . import bundles
+
+    try:
+        result = bundles.pack(get_aws(), prefix, delete_sources=delete_sources)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for name, reason in sorted(result["skipped"].items()):
+        click.echo(f"skipped {name}: {reason}", err=True)
+    counts = {key: len(result[key]) for key in ("projects", "bundles", "skipped")}
+    click.echo("packed: {projects}, bundles: {bundles}, skipped: {skipped}".format(**counts))
+
+
+@bundle.command(name="unpack")
+@click.option("--prefix", "prefix", default="projects/dev", show_default=True)
+@click.option("--delete-bundles", is_flag=True, help="schedule the bundles for deletion once every project is written")
+def bundle_unpack(prefix, delete_bundles):
+    "write each project in the bundles under --prefix back to its own secret"
+    from . import bundles
+
+    plan = bundles.unpack(get_aws(), prefix, delete_bundles=delete_bundles)
+    counts = {}
+    for name, action, detail in plan:
+        counts[action] = counts.get(action, 0) + 1
+        if action == "failed":
+            click.echo(f"failed {name} {detail}", err=True)
+    click.echo(", ".join(f"{action}: {count}" for action, count in sorted(counts.items())) or "no bundles found")
+    if counts.get("failed"):
+        sys.exit(1)
+
+
+bundle.add_command(bundle_pack)
+bundle.add_command(bundle_unpack)
+
+
+@cli.group()
+def snapshot():
+    """write the secrets under a prefix to an encrypted file, or back
+
+    The key is read from SMGMT_SNAPSHOT_KEY, or from --key-file. Pass the file to
+    `smgmt --snapshot FILE` to run get, exec and transfer without calling AWS."""
+
+
+@snapshot.command(name="export")
+@click.option("--prefix", "prefix", required=True, help="export every secret whose name starts with this")
+@click.option("-o", "--output", "output", required=True, type=click.Path(dir_okay=False), help="the snapshot file")
+@click.option(
+    "--key-file",
+    "key_file",
+    default=None,
+    envvar="SMGMT_SNAPSHOT_KEY_FILE",
+    help="read the key from this file, creating it with a new key when it doesn't exist",
+)
+def snapshot_export(prefix, output, key_file):
+    "fetch every secret under --prefix in parallel and write them to one snapshot file"
+    from .snapshot import export, load_key
+
+    try:
+        key = load_key(key_file, create=True)
+    except RuntimeError as e:
+        raise click.UsageError(str(e))
+    count, errors = export(get_aws(), prefix, output, key)
+    for name, error in sorted(errors.items()):
+        click.echo(f"failed {name}: {error}", err=True)
+    click.echo(f"exported: {count}, failed: {len(errors)}")
+    if errors:
+        sys.exit(1)
+
+
+@snapshot.command(name="restore")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--prefix", "prefix", default="", help="only restore the secrets whose name starts with this")
+@click.option("--key-file", "key_file", default=None, envvar="SMGMT_SNAPSHOT_KEY_FILE", help="the snapshot key file")
+@click.option("--dry-run", "dry_run", is_flag=True, help="show what would change without writing")
+def snapshot_restore(path, prefix, key_file, dry_run):
+    "create or update the secrets held in the snapshot at PATH"
+    from .snapshot import Snapshot, load_key, plan_restore, restore
+
+    try:
+        reader = Snapshot(path, load_key(key_file))
+    except (OSError, RuntimeError, ValueError) as e:
+        raise click.UsageError(f"can't open snapshot: {e}")
+    aws = get_aws()
+    plan = plan_restore(aws, reader, prefix)
+    if not dry_run:
+        plan = restore(aws, reader, plan)
+    counts = {}
+    for name, action, detail in plan:
+        counts[action] = counts.get(action, 0) + 1
+        if action != "unchanged":
+            click.echo(f"{action} {name} {detail}".rstrip(), err=action == "failed")
+    click.echo(", ".join(f"{action}: {count}" for action, count in sorted(counts.items())) or "nothing to restore")
+    if counts.get("failed"):
+        sys.exit(1)
+
+
+snapshot.add_command(snapshot_export)
+snapshot.add_command(snapshot_restore)
+
+
+@cli.command(name="import")
+@click.argument("root", type=click.Path(exists=True, file_okay=False))
+@click.option("--prefix", "prefix", default="projects/dev", show_default=True)
+@click.option("--skip-key", "skip_key", default=None, help="regex of keys to leave out, e.g. KEY")
+@click.option("--dry-run", "dry_run", is_flag=True, help="show what would change without writing")
+def import_(root, prefix, skip_key, dry_run):
+    "create or update one secret per directory of .env/.envrc files under ROOT"
+    from .envfiles import apply_import, collect, plan_import
+
+    aws = get_aws()
+    secrets = collect(root, prefix, skip_key)
+    plan = plan_import(aws, secrets)
+    if not dry_run:
+        plan = apply_import(aws, secrets, plan)
+    counts = {}
+    for name, action, detail in plan:
+        counts[action] = counts.get(action, 0) + 1
+        if action != "unchanged":
+            click.echo(f"{action} {name} {detail}".rstrip(), err=action == "failed")
+    click.echo(", ".join(f"{action}: {count}" for action, count in sorted(counts.items())) or "no env files found")
+    if counts.get("failed"):
+        sys.exit(1)
+
+
+@cli.group()
+def agent():
+    """keep a warm client and cache in a local process that other commands use
+
+    While an agent for the same --profile and --region is running, reads made by
+    ls, search, read, get and transfer are served over its Unix socket."""
+
+
+@agent.command()
+@click.option(
+    "--ttl", "ttl", type=int, default=300, show_default=True, help="seconds before a cached version is checked"
+)
+@click.option("--socket", "socket_path", default=None, envvar="SMGMT_AGENT_SOCKET", help="the Unix socket to listen on")
+@click.pass_context
+def start(ctx, ttl, socket_path):
+    "run the agent in the foreground until it is stopped"
+    from .agent import Agent
+    from .aws import AwsSecretMgmt
+
+    options = ctx.find_root().obj
+    aws = AwsSecretMgmt(profile=options["profile"], region=options["region"])
+    try:
+        server = Agent(aws, path=socket_path, ttl=ttl).bind()
+    except RuntimeError as e:
+        raise click.UsageError(str(e))
+    click.echo(f"listening on {server.path}", err=True)
+    server.serve_forever()
+
+
+@agent.command()
+@click.option("--socket", "socket_path", default=None, envvar="SMGMT_AGENT_SOCKET")
+def status(socket_path):
+    "print what the running agent serves and its cache statistics"
+    from .agent import AgentClient
+
+    client = AgentClient(socket_path).connect()
+    if client is None:
+        click.echo("no agent is running", err=True)
+        sys.exit(1)
+    click.echo(json.dumps({**client.info, **client.call("stats")}, indent=2))
+
+
+@agent.command()
+@click.option("--socket", "socket_path", default=None, envvar="SMGMT_AGENT_SOCKET")
+def stop(socket_path):
+    "stop the running agent"
+    from .agent import AgentClient
+
+    client = AgentClient(socket_path).connect()
+    if client is None:
+        click.echo("no agent is running", err=True)
+        sys.exit(1)
+    client.call("shutdown")
+
+
+agent.add_command(start)
+agent.add_command(status)
+agent.add_command(stop)
+
 cli.add_command(ls)
 cli.add_command(create)
 cli.add_command(read)
 cli.add_command(update)
 cli.add_command(delete)
 cli.add_command(search)
+cli.add_command(get)
+cli.add_command(exec_)
+cli.add_command(sync)
+cli.add_command(import_)
+cli.add_command(push_file)
+cli.add_command(pull_file)
+cli.add_command(rotate)
 cli.add_command(transfer)
+cli.add_command(watch)
+cli.add_command(agent)
+cli.add_command(bundle)
+cli.add_command(snapshot)
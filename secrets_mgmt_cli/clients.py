@@ -0,0 +1,137 @@
+import os
+import pathlib
+import logging
+import threading
+import configparser
+
+from .instrumentation import recorder, span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGION = "us-west-1"
+RETRY_MODES = ("legacy", "standard", "adaptive")
+
+
+def get_default_region(profile=None) -> str:
+    config_file_path = pathlib.Path.home() / ".aws" / "config"
+    with span("region.lookup"):
+        if os.path.isfile(config_file_path):
+            config = configparser.ConfigParser()
+            config.read(config_file_path)
+            section = "default" if profile in (None, "default") else f"profile {profile}"
+            return config.get(section, "region", fallback=DEFAULT_REGION)
+        else:
+            region = DEFAULT_REGION
+            return region
+
+
+class ClientFactory:
+    """
+    Builds Secrets Manager clients and caches one per (profile, region).
+
+    boto3 clients are thread-safe, so every thread that asks for the same profile
+    and region shares one client and its pool of warm connections. Sessions are
+    not thread-safe, so they are only used under a lock while a client is built.
+    """
+
+    def __init__(
+        self,
+        max_pool_connections=50,
+        connect_timeout=5,
+        read_timeout=30,
+        tcp_keepalive=True,
+        retry_mode="standard",
+        max_attempts=3,
+        credential_cache=None,
+    ):
+        """
+        :param max_pool_connections: The size of each client's HTTP connection pool,
+                                     botocore defaults to 10.
+        :param connect_timeout: Seconds to wait for a connection.
+        :param read_timeout: Seconds to wait for a response.
+        :param tcp_keepalive: Enable TCP keepalive on pooled connections.
+        :param retry_mode: The botocore retry mode, one of `RETRY_MODES`.
+        :param max_attempts: Attempts per request, including the first one.
+        :param credential_cache: An optional `CredentialCache` that keeps assumed-role
+                                 and SSO credentials on disk between invocations.
+        """
+        self.max_pool_connections = max_pool_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.tcp_keepalive = tcp_keepalive
+        self.retry_mode = retry_mode
+        self.max_attempts = max_attempts
+        self.credential_cache = credential_cache
+        self._clients = {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def config(self):
+        from botocore.config import Config
+
+        return Config(
+            max_pool_connections=self.max_pool_connections,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            tcp_keepalive=self.tcp_keepalive,
+            retries={"mode": self.retry_mode, "total_max_attempts": self.max_attempts},
+        )
+
+    def session(self, profile=None):
+        # boto3 is slow to import, so defer it until a client is actually built
+        import boto3
+
+        with self._lock:
+            if profile not in self._sessions:
+                session = boto3.session.Session(profile_name=profile)
+                if self.credential_cache is not None:
+                    self.credential_cache.install(session)
+                self._sessions[profile] = session
+            return self._sessions[profile]
+
+    def get(self, profile=None, region=None):
+        """
+        Returns the shared client for a profile and region, building it on first use.
+
+        :param profile: The AWS profile, None for the default credential chain.
+        :param region: The region, by default the one configured for the profile.
+        :return: A Secrets Manager client.
+        """
+        if region is None:
+            region = get_default_region(profile)
+        key = (profile, region)
+        with self._lock:
+            client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        with span("session.build"):
+            session = self.session(profile)
+        if recorder.enabled:
+            # resolve credentials up front so that the time shows up on its own in traces
+            with span("credentials.resolve"):
+                credentials = session.get_credentials()
+                if credentials is not None:
+                    credentials.get_frozen_credentials()
+        with self._lock, span("client.build", region=region):
+            if key not in self._clients:
+                self._clients[key] = session.client(
+                    service_name="secretsmanager", region_name=region, config=self.config()
+                )
+                logger.info("Built Secrets Manager client for profile %s in %s.", profile or "default", region)
+            return self._clients[key]
+
+
+_factory = None
+
+
+def get_client_factory() -> ClientFactory:
+    global _factory
+    if _factory is None:
+        _factory = ClientFactory()
+    return _factory
+
+
+def set_client_factory(factory: ClientFactory):
+    global _factory
+    _factory = factory
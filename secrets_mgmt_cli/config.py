@@ -1,10 +1,47 @@
+import io
 import os
+import hashlib
 import pathlib
+import tempfile
 import configparser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .instrumentation import span
+
+# written next to a config by `transfer`, holding the name of the secret it came from
+SOURCE_FILE = ".smgmt-source"
+
+
+def read_config_defaults(file_path) -> dict:
+    """
+    Parses the DEFAULT section of a config file.
+
+    Parsed values are not cached: an in-memory cache never outlives one `smgmt` run,
+    and a cache on disk would copy secret values to another place.
+    """
+    file_path = str(file_path)
+    with span("config.read", path=file_path):
+        parser = configparser.ConfigParser()
+        parser.read(file_path)
+        return dict(parser.defaults())
+
+
+def check_project_name(project_name):
+    """
+    Refuses a project name that would not map to a directory directly under
+    ~/.config, such as one taken from a secret named `projects/dev/../../.ssh`.
+
+    :raises ValueError: When the name is empty, holds a path separator or starts with a dot.
+    """
+    separators = ("/", os.sep, os.altsep or "/")
+    if not project_name or project_name.startswith(".") or any(sep in project_name for sep in separators):
+        raise ValueError(f"invalid project name {project_name!r}")
+    return project_name
 
 
 class ConfigHandler:
-    def __init__(self, project_name="tmp"):
+    def __init__(self, project_name="tmp", verbose=True):
+        check_project_name(project_name)
         p = pathlib.Path.home()
         self.home_path = p
         self.config_path = p / ".config" / project_name
@@ -12,9 +49,11 @@ class ConfigHandler:
 
         self.config = configparser.ConfigParser()
         if os.path.isfile(self.config_file_path):
-            self.config.read(self.config_file_path)
-            print("-- config file exists --")
-            print(self.print_configs())
+            with span("config.read", path=str(self.config_file_path)):
+                self.config.read(self.config_file_path)
+            if verbose:
+                print("-- config file exists --")
+                print(self.print_configs())
 
     def export_configs(self):
         # export configs as environment variables
@@ -31,10 +70,25 @@ class ConfigHandler:
             # print(key.upper(),(20-int(len(key)))*' ', val)
             self.formatted_print(key, val)
 
-    def write_config_file(self):
-        # rewrite config file
-        with open(self.config_file_path, "w") as configfile:
-            self.config.write(configfile)
+    def render(self):
+        buffer = io.StringIO()
+        self.config.write(buffer)
+        return buffer.getvalue()
+
+    def write_config_file(self, content=None):
+        # rewrite config file via a temp file and rename, so readers never see a partial file
+        if content is None:
+            content = self.render()
+        with span("config.write", path=str(self.config_file_path)):
+            self.config_path.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.config_path, prefix=".config.")
+            try:
+                with os.fdopen(fd, "w") as configfile:
+                    configfile.write(content)
+                os.replace(tmp_path, self.config_file_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
 
     def create_file_and_dir(self):
         self.config_path.mkdir(parents=True, exist_ok=True)
@@ -49,11 +103,37 @@ class ConfigHandler:
         """
         self.config[section] = config_dict
 
-    def write_config_file_from_dict(self, config_dict: dict):
+    def write_config_file_from_dict(self, config_dict: dict, source=None):
+        # returns False without touching the file when its content would not change
         self.config_file_input(config_dict)
-        self.write_config_file()
+        content = self.render()
+        if source is not None:
+            self.mark_source(source)
+        if self.file_hash() == hashlib.sha256(content.encode("utf8")).hexdigest():
+            return False
+        self.write_config_file(content)
+        return True
+
+    def mark_source(self, secret_name):
+        # record which secret the config was transferred from, for `ls --config --transferred`
+        marker = self.config_path / SOURCE_FILE
+        try:
+            if marker.read_text() == secret_name:
+                return
+        except FileNotFoundError:
+            pass
+        self.config_path.mkdir(parents=True, exist_ok=True)
+        marker.write_text(secret_name)
+
+    def file_hash(self):
+        try:
+            with span("config.hash"), open(self.config_file_path, "rb") as configfile:
+                return hashlib.sha256(configfile.read()).hexdigest()
+        except FileNotFoundError:
+            return None
 
     def put_project(self, project_name):
+        check_project_name(project_name)
         self.project_name = project_name
         self.config_path = self.home_path / ".config" / project_name
         self.config_file_path = self.config_path / "config"
@@ -63,28 +143,40 @@ class ConfigHandler:
             print("-- config file exists --")
             print(self.print_configs())
 
-    def list_config_dirs(self):
-        # list directories
+    def scan_config_dirs(self, transferred_only=False):
+        # one os.scandir pass over ~/.config, yields (dir path, stat of its config file or None)
         p = self.home_path / ".config"
+        with span("config.scan", path=str(p)), os.scandir(p) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+                if transferred_only and not os.path.isfile(os.path.join(entry.path, SOURCE_FILE)):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(entry.path, "config"))
+                except (FileNotFoundError, NotADirectoryError):
+                    stat = None
+                yield entry.path, stat
+
+    def list_config_dirs(self, transferred_only=False, max_workers=4):
+        # list directories, then print the defaults of each config as soon as it is parsed
         active = []
-        other = []
-        for x in p.iterdir():
-            if x.is_dir():
-                tmp = x / "config"
-                if os.path.isfile(tmp):
-                    active.append(tmp.resolve())
-                    resp = "config file exists"
-                else:
-                    other.append(x.resolve())
-                    resp = "no config file"
-                self.formatted_print(x, resp, n=45)
-
-        for file_path in active:
-            print("\n-- ", file_path, " --")
-            tmp = configparser.ConfigParser()
-            tmp.read(file_path)
-            for key, val in tmp.defaults().items():
-                self.formatted_print(key, val)
+        for dir_path, stat in self.scan_config_dirs(transferred_only):
+            if stat is not None:
+                active.append(os.path.join(dir_path, "config"))
+                resp = "config file exists"
+            else:
+                resp = "no config file"
+            self.formatted_print(dir_path, resp, n=45)
+
+        if not active:
+            return
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(read_config_defaults, path): path for path in active}
+            for future in as_completed(futures):
+                print("\n-- ", futures[future], " --")
+                for key, val in future.result().items():
+                    self.formatted_print(key, val)
 
     def formatted_print(self, key, val, n=20):
         key = str(key)
@@ -101,4 +193,14 @@ class ConfigHandler:
         return os.path.isfile(self.config_file_path)
 
 
-config_handler = ConfigHandler()
+_config_handler = None
+
+
+def __getattr__(name):
+    # `config_handler` reads ~/.config/tmp/config, so only do that when it is used
+    global _config_handler
+    if name == "config_handler":
+        if _config_handler is None:
+            _config_handler = ConfigHandler()
+        return _config_handler
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
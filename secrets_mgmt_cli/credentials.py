@@ -0,0 +1,137 @@
+"""
+An on-disk cache of the temporary credentials that botocore gets from STS and SSO.
+
+botocore keeps assumed-role and SSO credentials in a dict that lives as long as the
+session, so every `smgmt` invocation with a `role_arn` or SSO profile starts with a
+round trip to STS or SSO. `CredentialCache` has the same interface as that dict, and
+is put in place of it on the `assume-role`, `assume-role-with-web-identity` and `sso`
+providers of each session built by the `ClientFactory`.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import pathlib
+import datetime
+import tempfile
+import threading
+
+from .cache import _decode, _encode, get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+# the providers of botocore whose `cache` holds fetched temporary credentials
+CACHED_PROVIDERS = ("assume-role", "assume-role-with-web-identity", "sso")
+# botocore refreshes credentials this many seconds before they expire
+EXPIRY_WINDOW = 15 * 60
+
+
+def _expires_at(response):
+    expiration = response["Credentials"]["Expiration"]
+    if isinstance(expiration, str):
+        expiration = datetime.datetime.fromisoformat(expiration.replace("Z", "+00:00"))
+    if expiration.tzinfo is None:
+        expiration = expiration.replace(tzinfo=datetime.timezone.utc)
+    return expiration
+
+
+class CredentialCache:
+    """
+    Stores each credential response in its own 0600 file, named after a hash of the
+    key botocore derives from the role or SSO account, until shortly before the
+    credentials expire.
+
+    Files are written to a temporary name and renamed into place, so processes that
+    run at the same time only ever read whole entries. When two of them miss at once
+    both fetch credentials and the last write wins, which leaves a valid entry.
+    """
+
+    def __init__(self, path=None, expiry_window=EXPIRY_WINDOW):
+        """
+        :param path: The directory of the cache files, by default `credentials` in
+                     the smgmt cache directory.
+        :param expiry_window: Entries that expire within this many seconds are
+                              treated as missing.
+        """
+        self.path = pathlib.Path(path) if path is not None else get_cache_dir() / "credentials"
+        self.expiry_window = expiry_window
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def _file(self, key):
+        digest = hashlib.sha256(key.encode("utf8")).hexdigest()
+        return self.path / f"{digest}.json"
+
+    def _read(self, key):
+        try:
+            with open(self._file(key)) as f:
+                response = json.load(f, object_hook=_decode)
+            expires_at = _expires_at(response)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.warning("Ignoring unreadable credential cache entry %s.", self._file(key).name)
+            return None
+        remaining = (expires_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+        return response if remaining > self.expiry_window else None
+
+    def __contains__(self, key):
+        response = self._read(key)
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response is not None
+
+    def __getitem__(self, key):
+        response = self._read(key)
+        if response is None:
+            raise KeyError(key)
+        return response
+
+    def __setitem__(self, key, response):
+        self.path.mkdir(parents=True, exist_ok=True, mode=0o700)
+        # mkstemp creates the file with 0600 permissions
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=".credentials.")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(response, f, default=_encode)
+            os.replace(tmp_path, self._file(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with self._lock:
+            self.writes += 1
+
+    def __delitem__(self, key):
+        try:
+            self._file(key).unlink()
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def clear(self):
+        for file_path in self.path.glob("*.json"):
+            file_path.unlink()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "writes": self.writes}
+
+    def install(self, session):
+        """
+        Puts this cache in place of the in-memory one of each caching credential
+        provider of a boto3 session. Must be called before the session resolves
+        credentials.
+        """
+        from botocore.exceptions import UnknownCredentialError
+
+        resolver = session._session.get_component("credential_provider")
+        for name in CACHED_PROVIDERS:
+            try:
+                resolver.get_provider(name).cache = self
+            except UnknownCredentialError:
+                continue
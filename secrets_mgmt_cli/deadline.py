@@ -0,0 +1,132 @@
+"""
+Wall-clock budgets for reads, with optional hedging.
+
+botocore bounds each attempt with its connect and read timeouts, but not the whole
+call: with retries, one slow `GetSecretValue` can block for the sum of several of
+them. `Hedger.call` runs a read on a daemon thread and stops waiting for it once the
+budget is spent. With hedging, a duplicate read is sent when the first has not
+answered within the 95th percentile of recent latencies, and whichever answers first
+is used.
+"""
+
+import time
+import queue
+import threading
+from collections import deque
+
+from .instrumentation import percentile
+
+# the hedging delay used until enough latencies have been seen to estimate the p95
+DEFAULT_HEDGE_AFTER = 0.25
+MIN_SAMPLES = 20
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when a read did not finish within its deadline and no stale value was available."""
+
+
+class LatencyTracker:
+    """
+    Keeps the latencies of the most recent requests that reached Secrets Manager.
+    Reads served from a cache are not recorded, they would pull the p95 down.
+    """
+
+    def __init__(self, window=256, initial=DEFAULT_HEDGE_AFTER, min_samples=MIN_SAMPLES):
+        """
+        :param window: The number of latencies kept.
+        :param initial: The p95 assumed, in seconds, while fewer than `min_samples`
+                        latencies have been recorded.
+        :param min_samples: The number of latencies needed before they are used.
+        """
+        self.initial = initial
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self):
+        with self._lock:
+            samples = list(self._samples)
+        if len(samples) < self.min_samples:
+            return self.initial
+        return percentile(samples, 0.95)
+
+
+class Hedger:
+    """Runs reads against a deadline, hedging them after the p95 latency when asked to."""
+
+    def __init__(self, tracker=None):
+        self.tracker = tracker if tracker is not None else LatencyTracker()
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.deadlines_exceeded = 0
+        self._lock = threading.Lock()
+
+    def _count(self, *counters):
+        with self._lock:
+            for counter in counters:
+                setattr(self, counter, getattr(self, counter) + 1)
+
+    def _start(self, fn, results, attempt):
+        def run():
+            try:
+                results.put((attempt, True, fn()))
+            except Exception as e:
+                results.put((attempt, False, e))
+
+        # daemon threads, so that a read left behind by the deadline doesn't keep the process alive
+        threading.Thread(target=run, daemon=True, name=f"smgmt-read-{attempt}").start()
+
+    def call(self, fn, deadline, hedge=False):
+        """
+        Calls `fn` and waits at most `deadline` seconds for it, retries included.
+
+        :param fn: The read, called with no arguments. It may be called twice at once.
+        :param deadline: The budget in seconds.
+        :param hedge: Send a second read when the first has not answered within the p95.
+        :return: What the first successful call of `fn` returned.
+        :raises DeadlineExceededError: When no call answered in time.
+        :raises Exception: What `fn` raised, when every call made failed.
+        """
+        expires = time.monotonic() + deadline
+        results = queue.Queue()
+        self._start(fn, results, 0)
+        running = 1
+        hedge_at = time.monotonic() + self.tracker.p95() if hedge else None
+        error = None
+        while running:
+            now = time.monotonic()
+            wait_until = min(expires, hedge_at) if hedge_at is not None else expires
+            try:
+                attempt, ok, value = results.get(timeout=max(0.0, wait_until - now))
+            except queue.Empty:
+                if hedge_at is not None and time.monotonic() < expires:
+                    hedge_at = None
+                    self._count("hedged")
+                    self._start(fn, results, 1)
+                    running += 1
+                    continue
+                self._count("deadlines_exceeded")
+                raise DeadlineExceededError(f"no answer within {deadline:g} seconds")
+            running -= 1
+            if ok:
+                if attempt == 1:
+                    self._count("hedge_wins")
+                return value
+            error = value
+            if hedge_at is not None:
+                # the first read failed before the hedge was sent, don't send it
+                break
+        raise error
+
+    def stats(self):
+        with self._lock:
+            return {
+                "p95_ms": round(self.tracker.p95() * 1000, 1),
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "deadlines_exceeded": self.deadlines_exceeded,
+            }
@@ -0,0 +1,142 @@
+import os
+import re
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+ENV_FILE_NAMES = (".env", ".envrc")
+SKIP_DIRS = {".git", ".hg", ".tox", ".venv", "venv", "node_modules", "__pycache__"}
+ASSIGNMENT = re.compile(r"^\s*(?:export\s+)?([A-Za-z_][A-Za-z0-9_]*)\s*=\s*(.*?)\s*$")
+
+
+def find_env_files(root, names=ENV_FILE_NAMES):
+    """
+    Walks a directory tree with one `os.scandir` per directory.
+
+    :param root: The directory to start from.
+    :param names: The file names to look for. Earlier names sort first within a
+                  directory, so later files override them when merged.
+    :return: Yields the paths of env files, grouped by directory.
+    """
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError:
+            logger.warning("Couldn't read directory %s.", path)
+            continue
+        files = sorted((e for e in entries if e.name in names and e.is_file()), key=lambda e: names.index(e.name))
+        for entry in files:
+            yield entry.path
+        dirs = [e.path for e in entries if e.is_dir(follow_symlinks=False) and e.name not in SKIP_DIRS]
+        stack.extend(sorted(dirs, reverse=True))
+
+
+def parse_env_file(path) -> dict:
+    """
+    Reads `KEY=value` assignments from a dotenv or direnv file.
+
+    `export` prefixes, comments, blank lines, surrounding quotes and unquoted
+    trailing comments are handled; lines that are not assignments, such as direnv
+    `source_up` or `layout` calls, are skipped.
+    """
+    values = {}
+    with open(path, "r") as file:
+        for line in file:
+            match = ASSIGNMENT.match(line)
+            if match is None:
+                continue
+            key, value = match.groups()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+                value = value[1:-1]
+            else:
+                value = value.split(" #", 1)[0].rstrip()
+            values[key] = value
+    return values
+
+
+def secret_name_for(root, file_path, prefix):
+    rel = os.path.relpath(os.path.dirname(file_path), root)
+    project = os.path.basename(os.path.abspath(root)) if rel == "." else rel.replace(os.sep, "/")
+    return f"{prefix.rstrip('/')}/{project}"
+
+
+def collect(root, prefix, skip_key=None):
+    """
+    Maps each directory with env files under `root` to one secret.
+
+    :param root: The directory tree to scan.
+    :param prefix: The secret name prefix, the relative directory path is appended.
+    :param skip_key: An optional regex; matching keys are left out.
+    :return: A dict of secret name to the merged key/values of its env files.
+    """
+    skip = re.compile(skip_key) if skip_key else None
+    secrets = {}
+    for file_path in find_env_files(root):
+        values = parse_env_file(file_path)
+        if skip is not None:
+            values = {k: v for k, v in values.items() if not skip.search(k)}
+        secrets.setdefault(secret_name_for(root, file_path, prefix), {}).update(values)
+    return secrets
+
+
+def diff_keys(current: dict, desired: dict) -> str:
+    # key names only, values are never printed
+    added = [f"+{k}" for k in desired if k not in current]
+    removed = [f"-{k}" for k in current if k not in desired]
+    changed = [f"~{k}" for k in desired if k in current and current[k] != desired[k]]
+    return " ".join(added + changed + removed)
+
+
+def plan_import(aws, secrets: dict):
+    """
+    Compares local secrets against their current values in Secrets Manager.
+
+    :return: A list of `(name, action, detail)` tuples where action is one of
+             `create`, `update`, `unchanged` or `failed`.
+    """
+    from .aws import parse_secret_value
+
+    values, errors = aws.get_many(list(secrets))
+    plan = []
+    for name, desired in secrets.items():
+        if name in values:
+            current = parse_secret_value(values[name])
+            if not isinstance(current, dict):
+                current = {}
+            if json.dumps(current, sort_keys=True) == json.dumps(desired, sort_keys=True):
+                plan.append((name, "unchanged", ""))
+            else:
+                plan.append((name, "update", diff_keys(current, desired)))
+        elif errors[name].response["Error"]["Code"] == "ResourceNotFoundException":
+            plan.append((name, "create", diff_keys({}, desired)))
+        else:
+            plan.append((name, "failed", str(errors[name])))
+    return plan
+
+
+def apply_import(aws, secrets: dict, plan):
+    """
+    Creates or updates the secrets that `plan_import` found to differ, on a thread
+    pool bounded by `aws.max_workers`.
+
+    :return: The plan, with failed writes changed to the `failed` action.
+    """
+    from botocore.exceptions import ClientError
+
+    def apply(step):
+        name, action, detail = step
+        if action not in ("create", "update"):
+            return step
+        try:
+            aws.upsert(name, json.dumps(secrets[name]), create=action == "create")
+        except ClientError as e:
+            return (name, "failed", str(e))
+        return step
+
+    with ThreadPoolExecutor(max_workers=aws.max_workers) as pool:
+        return list(pool.map(apply, plan))
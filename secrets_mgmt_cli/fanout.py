@@ -0,0 +1,130 @@
+import queue
+import logging
+import threading
+from collections import namedtuple
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from .aws import AwsSecretMgmt
+from .clients import get_client_factory, get_default_region
+
+logger = logging.getLogger(__name__)
+
+ALL = "all"
+# Secrets Manager quotas apply per account and region, so each target gets its own
+# AwsSecretMgmt and rate controller, on the shared pooled client for that target
+Target = namedtuple("Target", ["profile", "region"])
+
+_DONE = object()
+
+
+def split_values(values):
+    # "a,b" and repeated options are both accepted
+    return [value.strip() for value in ",".join(values).split(",") if value.strip()]
+
+
+def enabled_regions(session, profile=None):
+    """
+    Lists the regions Secrets Manager is in that the account of a profile can use.
+
+    `get_available_regions` also returns opt-in regions, which answer accounts that
+    have not enabled them with `UnrecognizedClientException`. EC2 `DescribeRegions`
+    only returns the enabled ones. When it can't be called, every region is used.
+    """
+    available = session.get_available_regions("secretsmanager")
+    try:
+        ec2 = session.client("ec2", region_name=get_default_region(profile))
+        enabled = {region["RegionName"] for region in ec2.describe_regions()["Regions"]}
+    except (ClientError, BotoCoreError) as e:
+        logger.warning("Couldn't list the enabled regions, querying all of them: %s", e)
+        return available
+    return [region for region in available if region in enabled]
+
+
+def resolve_targets(profiles=(), regions=(), default_profile=None, default_region=None):
+    """
+    Expands `--profiles` and `--regions` into the list of targets to query.
+
+    :param profiles: Profile names, or `all` for every profile in the AWS config.
+    :param regions: Region names, or `all` for every region Secrets Manager is in
+                    that is enabled for the account.
+    :param default_profile: The profile used when `profiles` is empty.
+    :param default_region: The region used when `regions` is empty, None for the
+                           region configured for each profile.
+    :return: A list of `Target`s, without duplicates.
+    """
+    factory = get_client_factory()
+    profiles = split_values(profiles) or [default_profile]
+    if ALL in profiles:
+        profiles = factory.session(default_profile).available_profiles
+    regions = split_values(regions)
+    targets = []
+    for profile in profiles:
+        if ALL in regions:
+            profile_regions = enabled_regions(factory.session(profile), profile)
+        else:
+            profile_regions = regions or [default_region]
+        for region in profile_regions:
+            if Target(profile, region) not in targets:
+                targets.append(Target(profile, region))
+    return targets
+
+
+def account_from_arn(arn):
+    # arn:aws:secretsmanager:<region>:<account>:secret:<name>
+    parts = (arn or "").split(":")
+    return parts[4] if len(parts) > 5 else None
+
+
+def tag(record, target, aws):
+    """Returns a copy of a record that names the region, account and profile it came from."""
+    tagged = dict(record)
+    tagged["Region"] = aws.client.meta.region_name
+    tagged["Account"] = account_from_arn(record.get("ARN"))
+    if target.profile is not None:
+        tagged["Profile"] = target.profile
+    return tagged
+
+
+def fan_out(targets, fn, errors=None, max_buffered=1000):
+    """
+    Runs `fn` against every target at the same time and yields what they produce,
+    in the order it arrives, so the total time is close to that of the slowest
+    target rather than the sum of all of them.
+
+    :param targets: The `Target`s to query.
+    :param fn: Called with the `Target` and its `AwsSecretMgmt`, returns an iterable.
+    :param errors: An optional dict that collects the exception of each target that
+                   failed; the other targets are not affected.
+    :param max_buffered: Items held before the slowest consumer blocks the producers.
+    :return: Yields `(target, aws, item)` tuples.
+    """
+    results = queue.Queue(maxsize=max_buffered)
+
+    def work(target):
+        aws = AwsSecretMgmt(profile=target.profile, region=target.region)
+        try:
+            for item in fn(target, aws):
+                results.put((target, aws, item))
+        except (ClientError, BotoCoreError) as e:
+            logger.error("Couldn't query %s in %s: %s", target.profile or "default", target.region, e)
+            if errors is not None:
+                errors[target] = e
+        except Exception as e:
+            # a bug or an unexpected error still fails this target, and only this one
+            logger.exception("Couldn't query %s in %s", target.profile or "default", target.region)
+            if errors is not None:
+                errors[target] = e
+        finally:
+            results.put(_DONE)
+
+    threads = [threading.Thread(target=work, args=(target,), daemon=True) for target in targets]
+    for thread in threads:
+        thread.start()
+    running = len(threads)
+    while running:
+        item = results.get()
+        if item is _DONE:
+            running -= 1
+        else:
+            yield item
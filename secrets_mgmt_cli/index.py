@@ -0,0 +1,176 @@
+import re
+import json
+import time
+import sqlite3
+import logging
+import datetime
+
+from .cache import get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS secrets (
+    name TEXT PRIMARY KEY,
+    arn TEXT,
+    description TEXT,
+    tags TEXT,
+    last_changed REAL,
+    versions TEXT,
+    record TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _regexp(pattern, value):
+    return value is not None and re.search(pattern, value) is not None
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+def _timestamp(value):
+    return value.timestamp() if isinstance(value, datetime.datetime) else None
+
+
+class SecretIndex:
+    """
+    Local SQLite index of `ListSecrets` metadata.
+
+    The first sync reads every secret. Later syncs list secrets sorted by
+    `LastChangedDate`, newest first, and stop at the newest change seen by the
+    previous sync, so only secrets that changed since then are downloaded.
+
+    Each profile and region has its own index file, so that `--offline` answers and
+    the sync high-water mark never mix secrets from different accounts or regions.
+    """
+
+    def __init__(self, path=None, scope=None):
+        """
+        :param path: The database file, by default one named after `scope` in the
+                     user cache dir.
+        :param scope: The profile and region the index holds, such as `prod@eu-west-1`.
+                      When given, `sync` refuses an `AwsSecretMgmt` for another one.
+        """
+        if path is None:
+            get_cache_dir().mkdir(parents=True, exist_ok=True, mode=0o700)
+            safe_scope = re.sub(r"[^A-Za-z0-9@._-]", "_", scope or "default")
+            path = get_cache_dir() / f"index-{safe_scope}.sqlite3"
+        self.path = path
+        self.scope = scope
+        self.conn = sqlite3.connect(str(path), timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.create_function("REGEXP", 2, _regexp)
+        self.conn.executescript(SCHEMA)
+
+    def _get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row is not None else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _upsert(self, secret):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO secrets (name, arn, description, tags, last_changed, versions, record) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                secret["Name"],
+                secret.get("ARN"),
+                secret.get("Description"),
+                json.dumps(secret.get("Tags", [])),
+                _timestamp(secret.get("LastChangedDate")),
+                json.dumps(secret.get("SecretVersionsToStages", {})),
+                json.dumps(secret, default=_isoformat),
+            ),
+        )
+
+    @property
+    def last_sync(self):
+        """The time of the last sync in seconds since the epoch, or None."""
+        value = self._get_meta("last_sync")
+        return float(value) if value is not None else None
+
+    def age(self):
+        """Seconds since the last sync, or None when the index was never synced."""
+        return time.time() - self.last_sync if self.last_sync is not None else None
+
+    def sync(self, aws, full=False):
+        """
+        Brings the index up to date with Secrets Manager.
+
+        :param aws: The `AwsSecretMgmt` to list secrets with.
+        :param full: Re-read every secret, which also drops secrets that were deleted
+                     without a recovery window. An index that was never synced, or a
+                     botocore without `SortBy` support, always syncs fully.
+        :return: The number of secrets written to the index.
+        :raises ValueError: When `aws` reads another profile or region than the index holds.
+        """
+        if self.scope is not None and aws.cache_scope() != self.scope:
+            raise ValueError(f"this index holds {self.scope}, not {aws.cache_scope()}")
+        high_water = self._get_meta("high_water")
+        high_water = float(high_water) if high_water is not None else None
+        full = full or high_water is None or not aws.can_sort_list()
+        started = time.time()
+        count = 0
+        newest = high_water
+        with self.conn:
+            if full:
+                self.conn.execute("DELETE FROM secrets")
+                secrets = aws.list()
+            else:
+                secrets = aws.list(SortBy="last-changed-date", SortOrder="desc", IncludePlannedDeletion=True)
+            for secret in secrets:
+                changed = _timestamp(secret.get("LastChangedDate"))
+                if not full and changed is not None and changed < high_water:
+                    break
+                if newest is None or (changed is not None and changed > newest):
+                    newest = changed
+                if secret.get("DeletedDate") is not None:
+                    self.conn.execute("DELETE FROM secrets WHERE name = ?", (secret["Name"],))
+                else:
+                    self._upsert(secret)
+                count += 1
+            if newest is not None:
+                self._set_meta("high_water", str(newest))
+            self._set_meta("last_sync", str(started))
+        logger.info("Synced %d secrets into %s (%s).", count, self.path, "full" if full else "incremental")
+        return count
+
+    def search(self, name=(), tag_key=(), tag_value=(), description=(), pattern=None):
+        """
+        Searches the index without any request to Secrets Manager.
+
+        Each argument holds case-insensitive substrings for one field; a secret must
+        match every field that is given and any one of its values. `pattern` is a
+        regular expression searched for in the name and in every tag key and value.
+
+        :return: Yields `ListSecrets` records one at a time, sorted by name.
+        """
+        clauses, params = [], []
+        for values, sql in (
+            (name, "name LIKE ?"),
+            (description, "description LIKE ?"),
+            (tag_key, "EXISTS (SELECT 1 FROM json_each(tags) WHERE json_extract(value, '$.Key') LIKE ?)"),
+            (tag_value, "EXISTS (SELECT 1 FROM json_each(tags) WHERE json_extract(value, '$.Value') LIKE ?)"),
+        ):
+            if values:
+                clauses.append("(" + " OR ".join([sql] * len(values)) + ")")
+                params.extend(f"%{value}%" for value in values)
+        if pattern is not None:
+            clauses.append(
+                "(name REGEXP ? OR EXISTS (SELECT 1 FROM json_each(tags) "
+                "WHERE json_extract(value, '$.Key') REGEXP ? OR json_extract(value, '$.Value') REGEXP ?))"
+            )
+            params.extend([pattern] * 3)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        for row in self.conn.execute(f"SELECT record FROM secrets{where} ORDER BY name", params):
+            yield json.loads(row["record"])
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class OperationStats:
+    def __init__(self):
+        self.latencies_ms = []
+        self.errors = 0
+        self.retries = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def histogram(self):
+        counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        for latency in self.latencies_ms:
+            counts[next((i for i, b in enumerate(LATENCY_BUCKETS_MS) if latency <= b), len(LATENCY_BUCKETS_MS))] += 1
+        labels = [f"<={b}ms" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {label: count for label, count in zip(labels, counts) if count}
+
+
+class Recorder:
+    """
+    Collects timings for one process: spans around local work such as config file
+    I/O, and per-operation latency, retries and bytes for every Secrets Manager call,
+    taken from botocore's event system. Disabled until `enable` is called, in which
+    case `span` and `attach` cost next to nothing.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self.operations = {}
+        self._attached = set()
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+
+    def _ts(self, t):
+        return int((t - self._origin) * 1e6)
+
+    def _add_span(self, name, cat, start, end, args=None):
+        with self._lock:
+            self.spans.append(
+                {
+                    "name": name,
+                    "cat": cat,
+                    "ph": "X",
+                    "ts": self._ts(start),
+                    "dur": self._ts(end) - self._ts(start),
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": args or {},
+                }
+            )
+
+    @contextmanager
+    def span(self, name, cat="smgmt", **args):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add_span(name, cat, start, time.perf_counter(), args)
+
+    def _operation(self, name):
+        if name not in self.operations:
+            self.operations[name] = OperationStats()
+        return self.operations[name]
+
+    def attach(self, client):
+        """Registers botocore event handlers on a client, once per client."""
+        if not self.enabled or id(client) in self._attached:
+            return
+        self._attached.add(id(client))
+        events = client.meta.events
+        events.register("before-call.secrets-manager", self._before_call)
+        events.register("after-call.secrets-manager", self._after_call)
+        events.register("after-call-error.secrets-manager", self._after_call_error)
+        events.register("before-send.secrets-manager", self._before_send)
+
+    def _before_call(self, context=None, **kwargs):
+        if context is not None:
+            context["smgmt_started"] = time.perf_counter()
+
+    def _after_call(self, http_response=None, parsed=None, model=None, context=None, **kwargs):
+        started = (context or {}).pop("smgmt_started", None)
+        if started is None:
+            return
+        end = time.perf_counter()
+        parsed = parsed or {}
+        error = parsed.get("Error", {}).get("Code")
+        retries = parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        try:
+            size = len(http_response.content)
+        except Exception:
+            size = 0
+        with self._lock:
+            stats = self._operation(model.name)
+            stats.latencies_ms.append((end - started) * 1000)
+            stats.retries += retries
+            stats.bytes_in += size
+            if error:
+                stats.errors += 1
+        self._add_span(model.name, "aws", started, end, {"retries": retries, "error": error, "bytes": size})
+
+    def _after_call_error(self, exception=None, context=None, **kwargs):
+        started = (context or {}).pop("smgmt_started", None)
+        if started is None:
+            return
+        self._add_span("error", "aws", started, time.perf_counter(), {"exception": repr(exception)})
+
+    def _before_send(self, request=None, **kwargs):
+        target = request.headers.get("X-Amz-Target", b"")
+        target = target.decode() if isinstance(target, bytes) else target
+        with self._lock:
+            self._operation(target.split(".")[-1]).bytes_out += len(request.body or b"")
+
+    def summary(self):
+        """A plain text table of API operations and local spans."""
+        lines = [
+            f"{'operation':<28}{'calls':>7}{'errors':>8}{'retries':>9}"
+            f"{'p50ms':>9}{'p95ms':>9}{'maxms':>9}{'bytes_in':>11}{'bytes_out':>11}"
+        ]
+        with self._lock:
+            for name, stats in sorted(self.operations.items()):
+                latencies = stats.latencies_ms
+                lines.append(
+                    f"{name:<28}{len(latencies):>7}{stats.errors:>8}{stats.retries:>9}"
+                    f"{percentile(latencies, 0.5):>9.1f}{percentile(latencies, 0.95):>9.1f}"
+                    f"{max(latencies, default=0):>9.1f}{stats.bytes_in:>11}{stats.bytes_out:>11}"
+                )
+            local = {}
+            for span in self.spans:
+                if span["cat"] != "aws":
+                    count, total = local.get(span["name"], (0, 0))
+                    local[span["name"]] = (count + 1, total + span["dur"])
+        for name, (count, total) in sorted(local.items()):
+            lines.append(f"{name:<28}{count:>7}{'':>26}{total / 1000:>9.1f}ms total")
+        return "\n".join(lines)
+
+    def histograms(self):
+        with self._lock:
+            return {name: stats.histogram() for name, stats in self.operations.items()}
+
+    def write_trace(self, path):
+        """Writes the spans in Chrome trace event format, viewable in chrome://tracing or Perfetto."""
+        with self._lock:
+            events = list(self.spans)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms", "histograms": self.histograms()}, f)
+
+
+recorder = Recorder()
+
+
+def span(name, cat="smgmt", **args):
+    return recorder.span(name, cat, **args)
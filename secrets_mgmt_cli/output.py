@@ -0,0 +1,73 @@
+import sys
+import csv
+import json
+import datetime
+
+FORMATS = ("table", "ndjson", "json", "csv")
+CSV_FIELDS = ("Name", "ARN", "Description", "LastChangedDate")
+
+
+class DateTimeEncoder(json.JSONEncoder):
+    def default(self, z):
+        if isinstance(z, datetime.datetime):
+            return str(z)
+        else:
+            return super().default(z)
+
+
+def project(record: dict, fields=None) -> dict:
+    if not fields:
+        return record
+    return {field: record.get(field) for field in fields}
+
+
+def format_table_record(record: dict, name=None) -> str:
+    lines = [f"\n-- {name if name is not None else record.get('Name')} --"]
+    for key, val in record.items():
+        lines.append(f"{key[:18]+'..' if len(key)>17 else key}{(20-int(len(key)))*'.'}{val}")
+    return "\n".join(lines) + "\n"
+
+
+def write_records(records, fmt="table", fields=None, stream=None):
+    """
+    Writes records to a stream as they are produced, without collecting them first.
+
+    Each record is rendered to one string and written with a single call, leaving
+    the buffering of the stream to coalesce writes into large chunks.
+
+    :param records: An iterable of dicts, such as `ListSecrets` entries.
+    :param fmt: One of `table`, `ndjson`, `json` or `csv`.
+    :param fields: The keys to keep from each record, in order. All keys when None,
+                   except for csv, which defaults to `CSV_FIELDS`.
+    :param stream: The text stream to write to, stdout by default.
+    :return: The number of records written.
+    """
+    stream = stream if stream is not None else sys.stdout
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(stream, fieldnames=list(fields or CSV_FIELDS), extrasaction="ignore")
+        writer.writeheader()
+    elif fmt == "json":
+        stream.write("[")
+    for record in records:
+        projected = project(record, fields)
+        if fmt == "table":
+            stream.write(format_table_record(projected, record.get("Name")))
+        elif fmt == "ndjson":
+            stream.write(json.dumps(projected, cls=DateTimeEncoder) + "\n")
+        elif fmt == "json":
+            stream.write(("," if count else "") + "\n  " + json.dumps(projected, cls=DateTimeEncoder))
+        elif fmt == "csv":
+            writer.writerow(
+                {
+                    key: json.dumps(val, cls=DateTimeEncoder) if isinstance(val, (dict, list)) else val
+                    for key, val in projected.items()
+                }
+            )
+        else:
+            raise ValueError(f"unknown output format {fmt!r}")
+        count += 1
+    if fmt == "json":
+        stream.write("\n]\n" if count else "]\n")
+    stream.flush()
+    return count
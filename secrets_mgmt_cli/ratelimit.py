@@ -0,0 +1,195 @@
+import time
+import random
+import logging
+import threading
+
+from botocore import xform_name
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+THROTTLING_ERRORS = ("ThrottlingException", "Throttling", "TooManyRequestsException", "RequestLimitExceeded")
+
+# default Secrets Manager request rate quotas, per second, per account and region
+DEFAULT_RATES = {
+    "get_secret_value": 10000.0,
+    "describe_secret": 10000.0,
+    "batch_get_secret_value": 100.0,
+    "list_secrets": 100.0,
+    "create_secret": 50.0,
+    "put_secret_value": 50.0,
+    "update_secret_version_stage": 50.0,
+    "delete_secret": 50.0,
+    "get_random_password": 50.0,
+}
+DEFAULT_RATE = 50.0
+
+# the RateController whose `call` is running on this thread, for the botocore hook
+_calling = threading.local()
+
+
+def _needs_retry(response=None, operation=None, **kwargs):
+    # registered once per client, however many controllers share that client
+    limiter = getattr(_calling, "limiter", None)
+    if limiter is not None and response is not None:
+        if response[1].get("Error", {}).get("Code") in THROTTLING_ERRORS:
+            limiter.on_throttle(xform_name(operation.name))
+
+
+class TokenBucket:
+    """Blocks callers so that on average no more than `rate` calls per second go out."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateController:
+    """
+    Paces Secrets Manager calls and adapts to throttling.
+
+    Each API operation has a token bucket that starts at the default quota for that
+    operation. On top of that, the number of calls in flight is capped by a limit
+    shared by all operations. Both follow AIMD: a throttle halves the rate of the
+    operation and the concurrency limit, while successes add to them again. Calls
+    that are throttled are retried with full jitter backoff.
+    """
+
+    def __init__(
+        self,
+        concurrency=8,
+        max_concurrency=64,
+        max_attempts=6,
+        base_delay=0.05,
+        max_delay=5.0,
+        rates=None,
+        min_rate=1.0,
+    ):
+        """
+        :param concurrency: The initial number of calls allowed in flight.
+        :param max_concurrency: The ceiling the concurrency limit grows back to.
+        :param max_attempts: Attempts per call before a throttle is raised.
+        :param base_delay: The first backoff ceiling in seconds, doubled per attempt.
+        :param max_delay: The largest backoff ceiling in seconds.
+        :param rates: Per-operation starting rates overriding `DEFAULT_RATES`.
+        :param min_rate: The lowest rate an operation is backed off to.
+        """
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_rate = min_rate
+        self.max_rates = dict(DEFAULT_RATES, **(rates or {}))
+        self.throttles = 0
+        self.calls = 0
+        self.observing = False
+        self._buckets = {}
+        self._active = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def _bucket(self, operation):
+        with self._cond:
+            if operation not in self._buckets:
+                self._buckets[operation] = TokenBucket(self.max_rates.get(operation, DEFAULT_RATE))
+            return self._buckets[operation]
+
+    def _enter(self):
+        with self._cond:
+            while self._active >= self.concurrency:
+                self._cond.wait()
+            self._active += 1
+
+    def _exit(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+    def on_success(self, operation):
+        bucket = self._bucket(operation)
+        with self._cond:
+            self.calls += 1
+            self._successes += 1
+            if self._successes >= self.concurrency and self.concurrency < self.max_concurrency:
+                self._successes = 0
+                self.concurrency += 1
+                self._cond.notify()
+            ceiling = self.max_rates.get(operation, DEFAULT_RATE)
+        with bucket.lock:
+            bucket.rate = min(ceiling, bucket.rate + 1.0)
+
+    def on_throttle(self, operation):
+        bucket = self._bucket(operation)
+        with self._cond:
+            self.throttles += 1
+            self._successes = 0
+            self.concurrency = max(1, self.concurrency // 2)
+        with bucket.lock:
+            bucket.rate = max(self.min_rate, bucket.rate / 2)
+            bucket.tokens = min(bucket.tokens, 1.0)
+        logger.info("Throttled on %s, backing off to %.1f/s.", operation, bucket.rate)
+
+    def call(self, operation, fn, *args, **kwargs):
+        """
+        Calls `fn` once a token for `operation` and a concurrency slot are free,
+        retrying with jitter while the call is throttled.
+
+        :param operation: The client method name, such as `get_secret_value`.
+        :param fn: The function that makes the request.
+        :return: What `fn` returns.
+        """
+        for attempt in range(self.max_attempts):
+            self._bucket(operation).acquire()
+            self._enter()
+            outer, _calling.limiter = getattr(_calling, "limiter", None), self
+            try:
+                result = fn(*args, **kwargs)
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in THROTTLING_ERRORS or attempt == self.max_attempts - 1:
+                    raise
+                if not self.observing:
+                    self.on_throttle(operation)
+            else:
+                self.on_success(operation)
+                return result
+            finally:
+                _calling.limiter = outer
+                self._exit()
+            time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt)))
+
+    def observe(self, client):
+        """
+        Counts throttles that botocore retries on its own, so the controller backs off
+        before botocore gives up and raises.
+
+        Clients are shared through the `ClientFactory`, so the hook is registered once
+        per client and each throttle is counted only by the controller that made the
+        call. Calls made on the client directly, outside any `call`, are not counted.
+        """
+        client.meta.events.register("needs-retry.secrets-manager", _needs_retry, unique_id=__name__)
+        self.observing = True
+
+    def stats(self):
+        with self._cond:
+            return {
+                "calls": self.calls,
+                "throttles": self.throttles,
+                "concurrency": self.concurrency,
+                "rates": {operation: round(bucket.rate, 1) for operation, bucket in self._buckets.items()},
+            }
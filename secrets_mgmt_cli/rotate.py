@@ -0,0 +1,224 @@
+import os
+import json
+import string
+import hashlib
+import logging
+import secrets
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from .aws import parse_secret_value
+from .cache import CURRENT_STAGE, get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+PENDING_STAGE = "AWSPENDING"
+# the character classes of GetRandomPassword
+PUNCTUATION = string.punctuation
+
+
+def generate_password(
+    length=32,
+    exclude_characters="",
+    exclude_numbers=False,
+    exclude_punctuation=False,
+    exclude_uppercase=False,
+    exclude_lowercase=False,
+    include_space=False,
+    require_each_included_type=True,
+) -> str:
+    """
+    Generates a password locally with the `secrets` CSPRNG, taking the same options
+    as `GetRandomPassword` so that it can replace that round trip.
+
+    :return: The password.
+    """
+    classes = [
+        ("" if exclude_lowercase else string.ascii_lowercase),
+        ("" if exclude_uppercase else string.ascii_uppercase),
+        ("" if exclude_numbers else string.digits),
+        ("" if exclude_punctuation else PUNCTUATION),
+        (" " if include_space else ""),
+    ]
+    classes = ["".join(c for c in chars if c not in exclude_characters) for chars in classes]
+    classes = [chars for chars in classes if chars]
+    if not classes:
+        raise ValueError("the options exclude every character")
+    if require_each_included_type and length < len(classes):
+        raise ValueError(f"a password that includes each character type needs at least {len(classes)} characters")
+    alphabet = "".join(classes)
+    chars = [secrets.choice(chars) for chars in classes] if require_each_included_type else []
+    chars.extend(secrets.choice(alphabet) for _ in range(length - len(chars)))
+    # shuffle so that the required characters are not always in front
+    for i in range(len(chars) - 1, 0, -1):
+        j = secrets.randbelow(i + 1)
+        chars[i], chars[j] = chars[j], chars[i]
+    return "".join(chars)
+
+
+def default_checkpoint_path(prefix, key):
+    digest = hashlib.sha256(f"{prefix}\0{key}".encode("utf8")).hexdigest()[:16]
+    return get_cache_dir() / f"rotate-{digest}.jsonl"
+
+
+class Checkpoint:
+    """
+    Records the progress of each secret in a rotation, as a log with one JSON line
+    per change that is replayed when the rotation resumes. Appending keeps the cost
+    of each change constant however many secrets are rotated. Only names, version
+    IDs and states are stored, never values.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if path is not None and os.path.isfile(path):
+            with open(path, "rb+") as f:
+                data = f.read()
+                complete = data.rfind(b"\n") + 1
+                if complete < len(data):
+                    # a run killed while writing leaves a partial last line, drop it so
+                    # that the next change doesn't get appended to it
+                    logger.warning("Dropping a partial line from checkpoint %s.", path)
+                    f.truncate(complete)
+            for line in data[:complete].decode("utf8").splitlines():
+                change = json.loads(line)
+                self.entries.setdefault(change.pop("name"), {}).update(change)
+
+    def get(self, name):
+        with self._lock:
+            return dict(self.entries.get(name, {}))
+
+    def update(self, name, **fields):
+        with self._lock:
+            self.entries.setdefault(name, {}).update(fields)
+            if self.path is None:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(dict(fields, name=name)) + "\n")
+
+    def remove(self):
+        if self.path is not None and os.path.isfile(self.path):
+            os.unlink(self.path)
+
+
+class Rotator:
+    """
+    Rotates one key of many JSON secrets in three phases, each run concurrently on a
+    bounded pool through the `RateController` of the `AwsSecretMgmt`:
+
+    1. stage: put a copy of the current value with a new password as AWSPENDING,
+    2. verify: run an optional hook, which gets the pending value on stdin,
+    3. promote: move AWSCURRENT to the pending version and drop its AWSPENDING label.
+
+    A secret that fails a phase is left out of the later ones; the others carry on.
+    With a checkpoint, a run that was interrupted resumes each secret at the phase it
+    had reached.
+    """
+
+    def __init__(self, aws, key, password_options=None, verify=None, checkpoint=None, concurrency=8):
+        """
+        :param aws: The `AwsSecretMgmt` to use.
+        :param key: The key of the JSON object that holds the password.
+        :param password_options: Keyword arguments for `generate_password`.
+        :param verify: An optional shell command run for each staged secret. It gets
+                       the pending JSON value on stdin and `SMGMT_SECRET_NAME` and
+                       `SMGMT_VERSION_ID` in its environment, and must exit with 0.
+        :param checkpoint: A `Checkpoint`, by default one that is not persisted.
+        :param concurrency: The number of secrets handled at the same time.
+        """
+        self.aws = aws
+        self.key = key
+        self.password_options = password_options or {}
+        self.verify_command = verify
+        self.checkpoint = checkpoint if checkpoint is not None else Checkpoint()
+        self.concurrency = concurrency
+
+    def _fail(self, name, error):
+        logger.error("Couldn't rotate secret %s: %s", name, error)
+        self.checkpoint.update(name, state="failed", error=str(error))
+
+    def stage(self, name):
+        try:
+            response = self.aws._call("get_secret_value", SecretId=name)
+            value = parse_secret_value(response)
+            if not isinstance(value, dict):
+                raise ValueError("secret value is not a json object")
+            value[self.key] = generate_password(**self.password_options)
+            pending = self.aws._call(
+                "put_secret_value", SecretId=name, SecretString=json.dumps(value), VersionStages=[PENDING_STAGE]
+            )
+        except (ClientError, ValueError) as e:
+            return self._fail(name, e)
+        self.checkpoint.update(
+            name, state="staged", previous=response["VersionId"], version=pending["VersionId"], error=None
+        )
+
+    def verify(self, name):
+        entry = self.checkpoint.get(name)
+        try:
+            response = self.aws._call("get_secret_value", SecretId=name, VersionId=entry["version"])
+        except ClientError as e:
+            return self._fail(name, e)
+        env = dict(os.environ, SMGMT_SECRET_NAME=name, SMGMT_VERSION_ID=entry["version"])
+        result = subprocess.run(
+            self.verify_command, shell=True, input=response["SecretString"], text=True, env=env, capture_output=True
+        )
+        if result.returncode != 0:
+            return self._fail(name, f"verify hook exited with {result.returncode}: {result.stderr.strip()}")
+        self.checkpoint.update(name, state="verified")
+
+    def promote(self, name):
+        entry = self.checkpoint.get(name)
+        try:
+            if entry["state"] != "promoted":
+                # naming the version that was current when staging makes this fail if it changed since
+                self.aws._call(
+                    "update_secret_version_stage",
+                    SecretId=name,
+                    VersionStage=CURRENT_STAGE,
+                    RemoveFromVersionId=entry["previous"],
+                    MoveToVersionId=entry["version"],
+                )
+                self.checkpoint.update(name, state="promoted")
+            self.aws._call(
+                "update_secret_version_stage",
+                SecretId=name,
+                VersionStage=PENDING_STAGE,
+                RemoveFromVersionId=entry["version"],
+            )
+        except ClientError as e:
+            return self._fail(name, e)
+        finally:
+            self.aws._invalidate(name)
+        self.checkpoint.update(name, state="done")
+
+    def _each(self, fn, items):
+        if not items:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(items))) as pool:
+            list(pool.map(fn, items))
+
+    def _in_state(self, names, *states):
+        return [name for name in names if self.checkpoint.get(name).get("state") in states]
+
+    def run(self, names):
+        """
+        Rotates the key in each secret.
+
+        :param names: The names of the secrets to rotate.
+        :return: A dict of secret name to its final state, `done` or `failed`.
+        """
+        names = list(dict.fromkeys(names))
+        self._each(self.stage, self._in_state(names, None, "failed"))
+        if self.verify_command is not None:
+            self._each(self.verify, self._in_state(names, "staged"))
+            self._each(self.promote, self._in_state(names, "verified", "promoted"))
+        else:
+            self._each(self.promote, self._in_state(names, "staged", "verified", "promoted"))
+        return {name: self.checkpoint.get(name).get("state") for name in names}
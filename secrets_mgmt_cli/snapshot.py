@@ -0,0 +1,313 @@
+"""
+Encrypted snapshots of many secrets in one file, for CI jobs and disaster recovery.
+
+A snapshot is laid out so that one secret can be read without decrypting any of
+the others:
+
+    b"SMGMTSNAP1\\n" | entry token | entry token | ... | index token | index offset (8 bytes)
+
+Each entry is a Fernet token of one secret's `ListSecrets` metadata and its
+`GetSecretValue` response. The index, itself a Fernet token so that the file
+does not reveal which secrets it holds, maps each name to the offset and length
+of its entry. The trailing 8 bytes give the offset of the index, big-endian.
+"""
+
+import os
+import json
+import struct
+import logging
+import pathlib
+import tempfile
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from .aws import BATCH_SIZE
+from .cache import _decode, _encode
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SMGMTSNAP1\n"
+TRAILER = struct.Struct(">Q")
+
+
+def _fernet_class():
+    try:
+        from cryptography.fernet import Fernet
+    except ImportError as e:
+        raise RuntimeError(
+            "snapshots need the cryptography package, install it with `pip install 'secrets-mgmt-cli[cache]'`"
+        ) from e
+    return Fernet
+
+
+def load_key(key_file=None, create=False) -> bytes:
+    """
+    Finds the key of a snapshot, from the `SMGMT_SNAPSHOT_KEY` environment variable
+    or else from a key file.
+
+    :param key_file: The path of the key file.
+    :param create: Write a new key, with 0600 permissions, when the file doesn't exist.
+    :return: The Fernet key.
+    :raises RuntimeError: When there is no key to use.
+    """
+    Fernet = _fernet_class()
+    key = os.environ.get("SMGMT_SNAPSHOT_KEY")
+    if key:
+        return key.encode("ascii")
+    if key_file is None:
+        raise RuntimeError("set SMGMT_SNAPSHOT_KEY or pass a key file")
+    if not create:
+        return pathlib.Path(key_file).read_bytes().strip()
+    try:
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return pathlib.Path(key_file).read_bytes().strip()
+    key = Fernet.generate_key()
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    logger.info("Wrote a new snapshot key to %s.", key_file)
+    return key
+
+
+def _strip(response):
+    return {key: value for key, value in response.items() if key != "ResponseMetadata"}
+
+
+class SnapshotWriter:
+    """
+    Writes entries to a temporary file as they arrive, then the index, and moves
+    the file into place only when it is complete.
+    """
+
+    def __init__(self, path, key):
+        self.path = pathlib.Path(path)
+        self.fernet = _fernet_class()(key)
+        self.index = {}
+        self._file = None
+        self._tmp_path = None
+        self._offset = 0
+
+    def __enter__(self):
+        directory = self.path.resolve().parent
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot.")
+        self._file = os.fdopen(fd, "wb")
+        self._file.write(MAGIC)
+        self._offset = len(MAGIC)
+        return self
+
+    def add(self, name, metadata, value):
+        token = self.fernet.encrypt(
+            json.dumps({"metadata": _strip(metadata), "value": _strip(value)}, default=_encode).encode("utf8")
+        )
+        self._file.write(token)
+        self.index[name] = [self._offset, len(token)]
+        self._offset += len(token)
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                created = datetime.datetime.now(datetime.timezone.utc).isoformat()
+                index = {"created": created, "entries": self.index}
+                self._file.write(self.fernet.encrypt(json.dumps(index).encode("utf8")))
+                self._file.write(TRAILER.pack(self._offset))
+            self._file.close()
+            if exc_type is None:
+                os.replace(self._tmp_path, self.path)
+        finally:
+            if os.path.exists(self._tmp_path):
+                os.unlink(self._tmp_path)
+
+
+def export(aws, prefix, path, key):
+    """
+    Writes every secret whose name starts with a prefix into a snapshot.
+
+    Values are fetched with `AwsSecretMgmt.get_many`, enough names at a time to keep
+    its thread pool busy, and each batch is encrypted and written before the next
+    one is fetched, so memory use does not grow with the number of secrets.
+
+    :param aws: The `AwsSecretMgmt` to read from.
+    :param prefix: The name prefix.
+    :param path: The snapshot file to write.
+    :param key: The Fernet key, see `load_key`.
+    :return: A tuple of the number of secrets written and a dict of the `ClientError`
+             for each secret that could not be read.
+    """
+    listed = {}
+    for secret in aws.list(filters=[{"Key": "name", "Values": [prefix]}]):
+        if secret["Name"].startswith(prefix):
+            listed[secret["Name"]] = secret
+    names = sorted(listed)
+    step = BATCH_SIZE * aws.max_workers
+    failed = {}
+    with SnapshotWriter(path, key) as writer:
+        for start in range(0, len(names), step):
+            chunk = names[start : start + step]
+            values, errors = aws.get_many(chunk)
+            failed.update(errors)
+            for name in chunk:
+                if name in values:
+                    writer.add(name, listed[name], values[name])
+    logger.info("Wrote %d secrets to snapshot %s, %d failed.", len(writer.index), path, len(failed))
+    return len(writer.index), failed
+
+
+class Snapshot:
+    """
+    Reads a snapshot. Only the index is decrypted on opening; each entry is read
+    from its offset and decrypted when it is asked for.
+
+    It answers the reads that `get`, `exec` and `transfer` make of an `AwsSecretMgmt`,
+    so that it can stand in for one, with `ResourceNotFoundException` errors for
+    names that are not in the snapshot.
+    """
+
+    def __init__(self, path, key):
+        """
+        :param path: The snapshot file.
+        :param key: The Fernet key, see `load_key`.
+        :raises ValueError: When the file is not a snapshot, or the key doesn't match.
+        """
+        from cryptography.fernet import InvalidToken
+
+        self.path = pathlib.Path(path)
+        self.fernet = _fernet_class()(key)
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an smgmt snapshot")
+            f.seek(-TRAILER.size, os.SEEK_END)
+            end = f.tell()
+            (offset,) = TRAILER.unpack(f.read(TRAILER.size))
+            f.seek(offset)
+            token = f.read(end - offset)
+        try:
+            index = json.loads(self.fernet.decrypt(token))
+        except InvalidToken as e:
+            raise ValueError(f"{path} can't be decrypted with this key") from e
+        self.created = index["created"]
+        self.index = index["entries"]
+
+    def names(self):
+        return list(self.index)
+
+    def entry(self, name) -> dict:
+        """:return: A dict with the `metadata` and the `value` response of one secret."""
+        offset, length = self.index[name]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            token = f.read(length)
+        return json.loads(self.fernet.decrypt(token), object_hook=_decode)
+
+    def _not_found(self, name):
+        error = {"Code": "ResourceNotFoundException", "Message": f"{name} is not in snapshot {self.path}"}
+        return ClientError({"Error": error}, "GetSecretValue")
+
+    # -- the reads of AwsSecretMgmt ---------------------------------------------
+
+    def _get_secret_value(self, name, stage=None):
+        if name not in self.index:
+            raise self._not_found(name)
+        value = self.entry(name)["value"]
+        if stage is not None and stage not in value.get("VersionStages", []):
+            raise self._not_found(name)
+        return value
+
+    def get_secret(self, secret_name):
+        value = self._get_secret_value(secret_name)
+        if "SecretString" in value:
+            return json.loads(value["SecretString"])
+        return value["SecretBinary"]
+
+    def list(self, max_results=None, filters=None, **kwargs):
+        prefixes = [value for f in filters or () if f["Key"] == "name" for value in f["Values"]]
+        count = 0
+        for name in self.index:
+            if prefixes and not any(name.startswith(prefix) for prefix in prefixes):
+                continue
+            if max_results is not None and count >= max_results:
+                return
+            count += 1
+            yield self.entry(name)["metadata"]
+
+    def list_names(self, prefix):
+        return (name for name in self.index if name.startswith(prefix))
+
+    def get_many(self, names):
+        values, errors = {}, {}
+        for name in dict.fromkeys(names):
+            if name in self.index:
+                values[name] = self.entry(name)["value"]
+            else:
+                errors[name] = self._not_found(name)
+        return values, errors
+
+
+def plan_restore(aws, snapshot, prefix=""):
+    """
+    Compares the secrets of a snapshot against their current values.
+
+    :param aws: The `AwsSecretMgmt` to compare with.
+    :param snapshot: A `Snapshot`.
+    :param prefix: Only plan the secrets whose name starts with this.
+    :return: A list of `(name, action, detail)` tuples where action is one of
+             `create`, `update`, `restore`, `unchanged` or `failed`. `restore` is
+             for secrets that are scheduled for deletion.
+    """
+    names = list(snapshot.list_names(prefix))
+    if not names:
+        return []
+    filters = [{"Key": "name", "Values": [prefix]}] if prefix else None
+    wanted = set(names)
+    deleted = {
+        secret["Name"]
+        for secret in aws.list(filters=filters, IncludePlannedDeletion=True)
+        if secret.get("DeletedDate") and secret["Name"] in wanted
+    }
+    current, errors = aws.get_many([name for name in names if name not in deleted])
+    plan = []
+    for name in names:
+        if name in deleted:
+            plan.append((name, "restore", "scheduled for deletion"))
+        elif name in current:
+            value = snapshot.entry(name)["value"]
+            same = all(current[name].get(field) == value.get(field) for field in ("SecretString", "SecretBinary"))
+            plan.append((name, "unchanged" if same else "update", ""))
+        elif errors[name].response["Error"]["Code"] == "ResourceNotFoundException":
+            plan.append((name, "create", ""))
+        else:
+            plan.append((name, "failed", str(errors[name])))
+    return plan
+
+
+def restore(aws, snapshot, plan):
+    """
+    Writes the secrets that `plan_restore` found to differ back to Secrets Manager,
+    concurrently on a thread pool bounded by `aws.max_workers`. Missing secrets are
+    created with the description and tags they had when the snapshot was taken.
+
+    :return: The plan, with failed writes changed to the `failed` action.
+    """
+
+    def apply(step):
+        name, action, detail = step
+        if action not in ("create", "update", "restore"):
+            return step
+        entry = snapshot.entry(name)
+        value = entry["value"]
+        secret_value = value["SecretString"] if "SecretString" in value else value["SecretBinary"]
+        extra = {}
+        if action == "create":
+            extra = {key: entry["metadata"][key] for key in ("Description", "Tags") if entry["metadata"].get(key)}
+        try:
+            if action == "restore":
+                aws._call("restore_secret", SecretId=name)
+            aws.upsert(name, secret_value, create=action == "create", **extra)
+        except ClientError as e:
+            return (name, "failed", str(e))
+        return step
+
+    with ThreadPoolExecutor(max_workers=aws.max_workers) as pool:
+        return list(pool.map(apply, plan))
@@ -0,0 +1,151 @@
+import os
+import time
+import random
+import logging
+import subprocess
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from . import bundles
+from .aws import parse_secret_value
+from .cache import CURRENT_STAGE, version_for_stage
+from .config import ConfigHandler
+
+logger = logging.getLogger(__name__)
+
+
+class Watcher:
+    """
+    Keeps `~/.config/<project>/config` files in step with the secrets under a prefix.
+
+    Each poll lists the secrets sorted by `LastChangedDate`, newest first, and stops
+    reading pages at the newest change seen by the previous poll, so a quiet prefix
+    costs one `ListSecrets` page. Values are only fetched for secrets whose AWSCURRENT
+    version differs from the last poll, and each config file is rewritten atomically
+    only when its content changes.
+    """
+
+    def __init__(self, aws, prefix, hook=None, interval=30, max_interval=300, sleep=time.sleep):
+        """
+        :param aws: The `AwsSecretMgmt` to use.
+        :param prefix: The secret name prefix, the rest of each name is the project.
+        :param hook: An optional shell command run after a config file changed, with
+                     `SMGMT_SECRET_NAME`, `SMGMT_PROJECT` and `SMGMT_CONFIG_FILE` set.
+        :param interval: Seconds between polls.
+        :param max_interval: The longest wait when polls keep failing.
+        :param sleep: The function used to wait, replaced in tests.
+        """
+        self.aws = aws
+        self.prefix = prefix.rstrip("/") + "/"
+        self.hook = hook
+        self.interval = interval
+        self.max_interval = max_interval
+        self.sleep = sleep
+        self.versions = {}
+        self.high_water = None
+
+    def changed_secrets(self):
+        """
+        Lists the names whose AWSCURRENT version changed since the last poll. With a
+        botocore that can't sort `ListSecrets`, every poll reads the whole prefix.
+        """
+        changed = []
+        newest = self.high_water
+        filters = [{"Key": "name", "Values": [self.prefix]}]
+        sortable = self.aws.can_sort_list()
+        if sortable:
+            # planned deletions are listed too, so that their configs stop being tracked
+            secrets = self.aws.list(
+                filters=filters, SortBy="last-changed-date", SortOrder="desc", IncludePlannedDeletion=True
+            )
+        else:
+            secrets = self.aws.list(filters=filters)
+        for secret in secrets:
+            last_changed = secret.get("LastChangedDate")
+            if sortable and self.high_water is not None and last_changed is not None and last_changed < self.high_water:
+                # everything further down changed before the previous poll
+                break
+            if newest is None or (last_changed is not None and last_changed > newest):
+                newest = last_changed
+            name = secret["Name"]
+            if not name.startswith(self.prefix):
+                continue
+            if secret.get("DeletedDate"):
+                self.versions.pop(name, None)
+                continue
+            current = version_for_stage(secret.get("SecretVersionsToStages"), CURRENT_STAGE)
+            if current != self.versions.get(name):
+                changed.append((name, current))
+        return changed, newest
+
+    def poll(self):
+        """
+        Runs one poll.
+
+        :return: The names of the secrets whose config file was rewritten.
+        """
+        changed, newest = self.changed_secrets()
+        if not changed:
+            self.high_water = newest
+            return []
+        values, errors = bundles.get_many(self.aws, [name for name, _ in changed])
+        for name, error in errors.items():
+            logger.error("Couldn't get value for secret %s: %s", name, error)
+        rewritten = []
+        for name, response in values.items():
+            value = parse_secret_value(response)
+            if not isinstance(value, dict):
+                logger.warning("Secret %s is not a json object, skipped.", name)
+                continue
+            try:
+                config = ConfigHandler(name[len(self.prefix) :], verbose=False)
+            except ValueError as e:
+                logger.error("Secret %s skipped: %s", name, e)
+                continue
+            if config.write_config_file_from_dict(config_dict=value, source=name):
+                rewritten.append(name)
+                self.run_hook(name, config)
+        for name, current in changed:
+            if name not in errors:
+                self.versions[name] = current
+        if not errors:
+            # a failed fetch is retried on the next poll, so don't move past it
+            self.high_water = newest
+        return rewritten
+
+    def run_hook(self, name, config):
+        if self.hook is None:
+            return
+        env = dict(
+            os.environ,
+            SMGMT_SECRET_NAME=name,
+            SMGMT_PROJECT=name[len(self.prefix) :],
+            SMGMT_CONFIG_FILE=str(config.config_file_path),
+        )
+        result = subprocess.run(self.hook, shell=True, env=env)
+        if result.returncode != 0:
+            logger.error("Hook for secret %s exited with %d.", name, result.returncode)
+
+    def run(self, polls=None, on_change=None):
+        """
+        Polls until interrupted, or `polls` times. Failed polls are retried with
+        exponential backoff and jitter, up to `max_interval` seconds apart.
+
+        :param polls: The number of polls to run, forever when None.
+        :param on_change: Called with the list of rewritten secret names after each poll.
+        """
+        delay = self.interval
+        count = 0
+        while polls is None or count < polls:
+            count += 1
+            try:
+                rewritten = self.poll()
+            except (ClientError, BotoCoreError) as e:
+                delay = min(self.max_interval, delay * 2)
+                logger.warning("Poll failed, retrying in about %.0f seconds: %s", delay, e)
+            else:
+                delay = self.interval
+                if rewritten and on_change is not None:
+                    on_change(rewritten)
+            if polls is None or count < polls:
+                self.sleep(delay * random.uniform(0.8, 1.2))
@@ -32,6 +32,6 @@ setup(
         smgmt=secrets_mgmt_cli.cli:cli
     """,
     install_requires=["click", "boto3"],
-    extras_require={"test": ["pytest"]},
+    extras_require={"test": ["pytest"], "cache": ["cryptography"], "zstd": ["zstandard"]},
     python_requires=">=3.7",
 )
@@ -0,0 +1,90 @@
+import os
+import stat
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from botocore.exceptions import ClientError
+from click.testing import CliRunner
+
+from benchmarks.fake_secretsmanager import FakeSecretsManager, make_client
+from secrets_mgmt_cli import aws as aws_module
+from secrets_mgmt_cli.agent import Agent, AgentClient
+from secrets_mgmt_cli.aws import AwsSecretMgmt
+from secrets_mgmt_cli.cli import cli
+
+NAME = "projects/dev/project-000000"
+
+
+@pytest.fixture
+def running_agent(monkeypatch):
+    fake = FakeSecretsManager(latency=0.1)
+    fake.seed(2)
+    # Unix socket paths are limited to about 100 bytes, so keep it out of tmp_path
+    path = os.path.join(tempfile.mkdtemp(), "agent.sock")
+    monkeypatch.setenv("SMGMT_AGENT_SOCKET", path)
+    server = Agent(AwsSecretMgmt(client=make_client(fake)), path=path).bind()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    fake.reset_calls()
+    yield fake, path
+    AgentClient(path).connect().call("shutdown")
+    thread.join(5)
+
+
+def test_socket_is_private(running_agent):
+    fake, path = running_agent
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode) == 0o700
+
+
+def test_bind_leaves_shared_directories_alone():
+    shared = tempfile.mkdtemp()
+    os.chmod(shared, 0o755)
+    with pytest.raises(RuntimeError, match="closed to other users"):
+        Agent(AwsSecretMgmt(client=make_client(FakeSecretsManager())), path=os.path.join(shared, "agent.sock")).bind()
+    assert stat.S_IMODE(os.stat(shared).st_mode) == 0o755
+    assert os.listdir(shared) == []
+
+
+def test_identical_concurrent_requests_are_coalesced(running_agent):
+    fake, path = running_agent
+    clients = [AgentClient(path).connect() for _ in range(6)]
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        responses = list(pool.map(lambda client: client.call("get", name=NAME), clients))
+    assert {response["VersionId"] for response in responses} == {responses[0]["VersionId"]}
+    assert fake.calls["GetSecretValue"] == 1
+
+    with pytest.raises(ClientError) as e:
+        clients[0].call("get", name="missing")
+    assert e.value.response["Error"]["Code"] == "ResourceNotFoundException"
+
+
+def test_cli_reads_through_the_running_agent(running_agent, monkeypatch):
+    fake, path = running_agent
+    monkeypatch.setattr(aws_module, "_aws", AwsSecretMgmt())
+
+    def no_direct_client(self, profile=None, region=None):
+        raise AssertionError("the CLI should not build its own client while the agent runs")
+
+    monkeypatch.setattr("secrets_mgmt_cli.clients.ClientFactory.get", no_direct_client)
+    result = CliRunner().invoke(cli, ["get", "--prefix", "projects/dev/"])
+    assert result.exit_code == 0, result.output
+    assert '"KEY_0": "value-1-0"' in result.output
+    assert fake.calls["ListSecrets"] == 1
+
+    result = CliRunner().invoke(cli, ["--no-agent", "get", "-n", NAME])
+    assert isinstance(result.exception, AssertionError)
+
+
+def test_listing_through_the_agent_reads_only_the_pages_needed(running_agent):
+    fake, path = running_agent
+    aws = AwsSecretMgmt(client=make_client(FakeSecretsManager()))
+    aws.agent = AgentClient(path).connect()
+
+    assert [s["Name"] for s in aws.list(max_results=1)] == [NAME]
+    assert fake.calls["ListSecrets"] == 1
+    assert next(iter(aws.list()))["Name"] == NAME
+    assert fake.calls["ListSecrets"] == 2
+    assert len(list(aws.list(filters=[{"Key": "name", "Values": ["projects/dev/"]}]))) == 2
@@ -0,0 +1,65 @@
+import json
+import asyncio
+
+from benchmarks.fake_secretsmanager import FakeSecretsManager, make_client
+from secrets_mgmt_cli.aio import AsyncSecretMgmt
+
+
+def test_concurrent_reads_of_one_secret_share_a_request():
+    fake = FakeSecretsManager(latency=0.05)
+    fake.seed(10, keys=1)
+
+    async def main():
+        async with AsyncSecretMgmt(client=make_client(fake)) as secrets:
+            names = [f"projects/dev/project-{i % 10:06d}" for i in range(500)]
+            responses = await asyncio.gather(*(secrets.get(name) for name in names))
+            return secrets.coalescer.coalesced, responses
+
+    coalesced, responses = asyncio.run(main())
+    assert coalesced == 490
+    assert fake.calls["GetSecretValue"] == 10
+    assert json.loads(responses[13]["SecretString"]) == {"KEY_0": "value-3-0"}
+
+
+def test_reads_do_not_block_the_event_loop():
+    fake = FakeSecretsManager(latency=0.3)
+    fake.seed(1)
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        async with AsyncSecretMgmt(client=make_client(fake)) as secrets:
+            await secrets.describe("projects/dev/project-000000")
+        ticker.cancel()
+        return ticks
+
+    assert asyncio.run(main()) >= 10
+
+
+def test_list_put_and_get_many():
+    fake = FakeSecretsManager()
+    fake.seed(250, keys=1)
+
+    async def main():
+        async with AsyncSecretMgmt(client=make_client(fake)) as secrets:
+            listed = secrets.list(filters=[{"Key": "name", "Values": ["projects/"]}])
+            names = [secret["Name"] async for secret in listed]
+            await secrets.put(names[0], json.dumps({"KEY_0": "new"}))
+            values, errors = await secrets.get_many([names[0], "projects/dev/missing"])
+            await secrets.describe(names[0])
+            await secrets.get(names[1])
+            return names, values, errors, secrets._aws.limiter.stats()
+
+    names, values, errors, limiter = asyncio.run(main())
+    assert len(names) == 250
+    assert fake.calls["ListSecrets"] == 3
+    assert {"list_secrets", "describe_secret", "get_secret_value", "put_secret_value"} <= set(limiter["rates"])
+    assert json.loads(values[names[0]]["SecretString"]) == {"KEY_0": "new"}
+    assert errors["projects/dev/missing"].response["Error"]["Code"] == "ResourceNotFoundException"
@@ -0,0 +1,17 @@
+import queue
+
+from benchmarks.run import compare, run_scenario
+from secrets_mgmt_cli import aws as aws_module
+
+
+def test_scenario_reports_metrics(monkeypatch):
+    # run_scenario installs its own shared instance, restore ours afterwards
+    monkeypatch.setattr(aws_module, "_aws", None)
+    results = queue.Queue()
+    run_scenario("api.get_many", 45, 0.0, 0.0, results)
+    result = results.get_nowait()
+    assert result["items"] == 45
+    assert result["calls_by_operation"] == {"BatchGetSecretValue": 3}
+    assert compare({"api.get_many": result}, {"results": {"api.get_many": dict(result, api_calls=2)}}, 1.25) == [
+        "api.get_many api_calls: 2 -> 3"
+    ]
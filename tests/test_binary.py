@@ -0,0 +1,56 @@
+import io
+import os
+import stat
+
+import pytest
+from click.testing import CliRunner
+
+from benchmarks.fake_secretsmanager import FakeSecretsManager, make_client
+from secrets_mgmt_cli import aws as aws_module
+from secrets_mgmt_cli.aws import AwsSecretMgmt
+from secrets_mgmt_cli.binary import MAGIC, pack, unpack_to
+from secrets_mgmt_cli.cli import cli
+
+
+def test_pack_round_trip_and_limits():
+    data = b"-----BEGIN CERTIFICATE-----\n" + b"MIIB" * 40000
+    packed = pack(io.BytesIO(data), "zlib")
+    assert packed.startswith(MAGIC) and len(packed) < len(data) // 10
+    out = io.BytesIO()
+    assert unpack_to(packed, out) == len(data)
+    assert out.getvalue() == data
+
+    # incompressible input is stored as it is
+    noise = os.urandom(1000)
+    assert pack(io.BytesIO(noise), "zlib") == MAGIC + bytes([1, 0]) + noise
+    # bytes without the header are passed through
+    out = io.BytesIO()
+    unpack_to(noise, out)
+    assert out.getvalue() == noise
+
+    with pytest.raises(ValueError):
+        pack(io.BytesIO(os.urandom(70000)), "zlib")
+
+
+def test_push_and_pull_file(monkeypatch, tmp_path):
+    fake = FakeSecretsManager()
+    monkeypatch.setattr(aws_module, "_aws", AwsSecretMgmt(client=make_client(fake)))
+    monkeypatch.setenv("SMGMT_NO_AGENT", "1")
+    source = tmp_path / "kubeconfig"
+    source.write_bytes(b"apiVersion: v1\n" * 5000)
+
+    result = CliRunner().invoke(cli, ["push-file", str(source), "-n", "files/kubeconfig", "--create"])
+    assert result.exit_code == 0, result.output
+    [version] = fake._secrets["files/kubeconfig"]["versions"].values()
+    assert len(version["SecretBinary"]) < 2000
+
+    target = tmp_path / "out" / "kubeconfig"
+    target.parent.mkdir()
+    result = CliRunner().invoke(cli, ["pull-file", "-n", "files/kubeconfig", "-o", str(target)])
+    assert result.exit_code == 0, result.output
+    assert target.read_bytes() == source.read_bytes()
+    assert stat.S_IMODE(target.stat().st_mode) == 0o600
+    assert os.listdir(target.parent) == ["kubeconfig"]
+
+    result = CliRunner().invoke(cli, ["pull-file", "-n", "files/kubeconfig"])
+    assert result.stdout_bytes == source.read_bytes()
@@ -9,12 +9,14 @@ import datetime
 from pathlib import Path
 from dateutil.tz import tzlocal
 
+import boto3
 import botocore.session
 from botocore.stub import Stubber
 from click.testing import CliRunner
 
 from secrets_mgmt_cli.cli import cli
-from secrets_mgmt_cli.aws import aws
+from secrets_mgmt_cli import aws as aws_module
+from secrets_mgmt_cli.aws import aws, AwsSecretMgmt
 
 
 smgmt_ls_resp = {
@@ -54,17 +56,34 @@ def test_stubber():
     assert service_response == response
 
 
-# def test_stubber_with_cli():
-#     stubber = Stubber(aws.client)
-#     response = smgmt_ls_resp
-#     stubber.add_response('list_secrets', response)
-#     stubber.activate()
+def test_stubber_with_cli(monkeypatch):
+    client = boto3.session.Session().client("secretsmanager", region_name="us-west-1")
+    monkeypatch.setattr(aws_module, "_aws", AwsSecretMgmt(client=client))
+    stubber = Stubber(client)
+    stubber.add_response("list_secrets", smgmt_ls_resp)
 
-#     # service_response = aws.get_secrets_list()
-#     # assert service_response == response
-#     runner = CliRunner()
-#     service_response = runner.invoke(cli, ["ls"])
-#     # assert result.exit_code == 0
-#     # assert result.output.startswith("cli, version ")
-#     print(response,service_response)
-#     assert service_response == response
+    runner = CliRunner()
+    with stubber:
+        result = runner.invoke(cli, ["ls", "--format", "ndjson", "--fields", "Name,LastChangedDate"])
+    assert result.exit_code == 0, result.output
+    (record,) = [json.loads(line) for line in result.output.splitlines()]
+    assert record["Name"] == "test/test_secret"
+    assert record["LastChangedDate"].startswith("2022-06-13 23:04:00.566000")
+
+
+def test_search_pushes_filters_down_and_reads_every_page():
+    client = boto3.session.Session().client("secretsmanager", region_name="us-west-1")
+    stubber = Stubber(client)
+    filters = [{"Key": "name", "Values": ["projects"]}, {"Key": "tag-key", "Values": ["team"]}]
+    stubber.add_response(
+        "list_secrets",
+        {"SecretList": [{"Name": "projects/dev/a"}, {"Name": "projects/prod/b"}], "NextToken": "page-2"},
+        {"Filters": filters},
+    )
+    stubber.add_response(
+        "list_secrets", {"SecretList": [{"Name": "projects/dev/c"}]}, {"Filters": filters, "NextToken": "page-2"}
+    )
+    with stubber:
+        secrets = AwsSecretMgmt(client=client).search(name=["projects"], tag_key=["team"], pattern="/dev/")
+        assert [secret["Name"] for secret in secrets] == ["projects/dev/a", "projects/dev/c"]
+        stubber.assert_no_pending_responses()
@@ -0,0 +1,85 @@
+import json
+
+from click.testing import CliRunner
+
+from benchmarks.fake_secretsmanager import FakeError, FakeSecretsManager, make_client
+from secrets_mgmt_cli import aws as aws_module
+from secrets_mgmt_cli.aws import AwsSecretMgmt
+from secrets_mgmt_cli.bundles import Bundle, encode_bundle, plan_bundles
+from secrets_mgmt_cli.cli import cli
+
+
+def test_bundle_reads_one_project_by_offset():
+    text = encode_bundle({"app": {"DB_HOST": "db"}, "worker": {"QUEUE": "jobs", "NOTE": "hé"}})
+    bundle = Bundle(text)
+    assert bundle.names() == ["app", "worker"]
+    assert bundle.raw("app") == '{"DB_HOST":"db"}'
+    assert bundle.get("worker") == {"QUEUE": "jobs", "NOTE": "hé"}
+
+
+def test_plan_bundles_respects_the_size_limit():
+    projects = {f"p{i:03d}": {"KEY": "x" * 100} for i in range(50)}
+    groups = plan_bundles(projects, max_bytes=1000)
+    assert sum(len(group) for group in groups) == 50
+    assert all(len(encode_bundle(group)) <= 1000 for group in groups)
+
+
+def test_pack_read_and_unpack(monkeypatch, tmp_path):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("SMGMT_NO_AGENT", "1")
+    fake = FakeSecretsManager()
+    fake.seed(30, keys=2)
+    monkeypatch.setattr(aws_module, "_aws", AwsSecretMgmt(client=make_client(fake)))
+    runner = CliRunner()
+
+    result = runner.invoke(cli, ["bundle", "pack", "--delete-sources"])
+    assert result.exit_code == 0, result.output
+    assert "packed: 30, bundles: 1, skipped: 0" in result.output
+    live = [name for name, secret in fake._secrets.items() if not secret.get("DeletedDate")]
+    assert live == ["projects/dev/.bundle-0000"]
+
+    fake.reset_calls()
+    result = runner.invoke(cli, ["get", "-n", "projects/dev/project-000007"])
+    assert json.loads(result.output) == {"projects/dev/project-000007": {"KEY_0": "value-7-0", "KEY_1": "value-7-1"}}
+    result = runner.invoke(cli, ["get", "--prefix", "projects/dev/"])
+    assert len(json.loads(result.output)) == 30
+    result = runner.invoke(cli, ["transfer", "--all"])
+    assert result.exit_code == 0, result.output
+    assert "updated: 30" in result.output
+    assert (tmp_path / ".config" / "project-000029" / "config").read_text() == (
+        "[DEFAULT]\nkey_0 = value-29-0\nkey_1 = value-29-1\n\n"
+    )
+
+    result = runner.invoke(cli, ["bundle", "unpack", "--delete-bundles"])
+    assert result.exit_code == 0, result.output
+    assert "unchanged: 30" in result.output
+    value = json.loads(fake.op_GetSecretValue({"SecretId": "projects/dev/project-000003"})["SecretString"])
+    assert value == {"KEY_0": "value-3-0", "KEY_1": "value-3-1"}
+    assert fake._secrets["projects/dev/.bundle-0000"].get("DeletedDate")
+
+
+def test_pack_reuses_deleted_bundle_names_and_reports_failed_writes(monkeypatch):
+    from secrets_mgmt_cli import bundles
+
+    fake = FakeSecretsManager()
+    fake.seed(3, keys=1)
+    aws = AwsSecretMgmt(client=make_client(fake))
+    bundles.pack(aws, "projects/dev")
+    bundles.unpack(aws, "projects/dev", delete_bundles=True)
+    assert fake._secrets["projects/dev/.bundle-0000"].get("DeletedDate")
+
+    result = bundles.pack(aws, "projects/dev")
+    assert result["bundles"] == ["projects/dev/.bundle-0000"] and result["skipped"] == {}
+    assert not fake._secrets["projects/dev/.bundle-0000"].get("DeletedDate")
+
+    def denied(body):
+        raise FakeError("AccessDeniedException", "not authorized")
+
+    fake.op_PutSecretValue = denied
+    monkeypatch.setenv("SMGMT_NO_AGENT", "1")
+    monkeypatch.setattr(aws_module, "_aws", aws)
+    result = CliRunner().invoke(cli, ["bundle", "pack", "--delete-sources"])
+    assert result.exit_code == 0, result.output
+    assert "packed: 0, bundles: 0, skipped: 1" in result.stdout
+    assert "skipped projects/dev/.bundle-0000: not written" in result.stderr
+    assert not any(secret.get("DeletedDate") for secret in fake._secrets.values())
@@ -0,0 +1,99 @@
+import stat
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from secrets_mgmt_cli.aws import AwsSecretMgmt
+from secrets_mgmt_cli.cache import DiskStore, SecretCache
+
+
+V1 = "11111111-1111-1111-1111-111111111111"
+V2 = "22222222-2222-2222-2222-222222222222"
+ARN = "arn:aws:secretsmanager:us-west-1:123456789012:secret:test/secret-AbCdEf"
+
+
+def make_aws(cache):
+    client = boto3.session.Session().client("secretsmanager", region_name="us-west-1")
+    return AwsSecretMgmt(client=client, cache=cache), Stubber(client)
+
+
+def value_resp(version_id, value='{"a": "1"}'):
+    return {"ARN": ARN, "Name": "test/secret", "VersionId": version_id, "SecretString": value}
+
+
+def describe_resp(version_id):
+    return {"ARN": ARN, "Name": "test/secret", "VersionIdsToStages": {version_id: ["AWSCURRENT"]}}
+
+
+def test_cache_hit_within_ttl():
+    cache = SecretCache(ttl=60)
+    aws, stubber = make_aws(cache)
+    stubber.add_response("get_secret_value", value_resp(V1), {"SecretId": "test/secret"})
+    with stubber:
+        assert aws.get_secret("test/secret") == {"a": "1"}
+        assert aws.get_secret("test/secret") == {"a": "1"}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_revalidates_version_after_ttl():
+    cache = SecretCache(ttl=0)
+    aws, stubber = make_aws(cache)
+    stubber.add_response("get_secret_value", value_resp(V1), {"SecretId": "test/secret"})
+    stubber.add_response("describe_secret", describe_resp(V1), {"SecretId": "test/secret"})
+    stubber.add_response("describe_secret", describe_resp(V2), {"SecretId": "test/secret"})
+    stubber.add_response("get_secret_value", value_resp(V2, '{"a": "2"}'), {"SecretId": "test/secret"})
+    with stubber:
+        assert aws.get_secret("test/secret") == {"a": "1"}
+        assert aws.get_secret("test/secret") == {"a": "1"}
+        assert aws.get_secret("test/secret") == {"a": "2"}
+        stubber.assert_no_pending_responses()
+    assert cache.stats() == {"hits": 1, "misses": 2, "revalidations": 1, "stale": 0, "entries": 1}
+
+
+def test_cache_evicts_least_recently_used():
+    cache = SecretCache(max_entries=2)
+    for name in ("a", "b", "a", "c"):
+        cache.get(name, None, fetch=lambda: {"VersionId": name}, current_version=lambda: name)
+    assert [key[0] for key in cache._entries] == ["a", "c"]
+
+
+def test_disk_store_round_trip(tmp_path):
+    pytest.importorskip("cryptography")
+    store = DiskStore(tmp_path)
+    entry = {"fetched_at": 1.0, "response": {"Name": "test/secret", "SecretBinary": b"\x00\x01"}}
+    store.put(("test/secret", "AWSCURRENT"), entry)
+    assert b"test/secret" not in next(tmp_path.glob("*.bin")).read_bytes()
+    assert DiskStore(tmp_path).get(("test/secret", "AWSCURRENT")) == entry
+
+
+def test_disk_store_writes_from_many_threads(tmp_path):
+    pytest.importorskip("cryptography")
+    stores = [DiskStore(tmp_path) for _ in range(4)]
+    assert len({store.fernet._signing_key for store in stores}) == 1
+    assert stat.S_IMODE((tmp_path / "key").stat().st_mode) == 0o600
+
+    def write(i):
+        stores[i % 4].put(("test/secret", "AWSCURRENT"), {"fetched_at": float(i), "response": {}})
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(write, range(200)))
+    assert [p.name for p in tmp_path.iterdir() if p.name.startswith(".")] == []
+    assert stores[0].get(("test/secret", "AWSCURRENT"))["response"] == {}
+
+
+def test_cache_keeps_regions_apart():
+    cache = SecretCache(ttl=60)
+    east, east_stubber = make_aws(cache)
+    west_client = boto3.session.Session().client("secretsmanager", region_name="eu-west-1")
+    west, west_stubber = AwsSecretMgmt(client=west_client, cache=cache), Stubber(west_client)
+    east_stubber.add_response("get_secret_value", value_resp(V1), {"SecretId": "test/secret"})
+    west_stubber.add_response("get_secret_value", value_resp(V2, '{"a": "2"}'), {"SecretId": "test/secret"})
+    with east_stubber, west_stubber:
+        assert east.get_secret("test/secret") == {"a": "1"}
+        assert west.get_secret("test/secret") == {"a": "2"}
+        assert east.get_secret("test/secret") == {"a": "1"}
+        west_stubber.assert_no_pending_responses()
+    assert cache.stats()["misses"] == 2
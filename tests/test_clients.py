@@ -0,0 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from secrets_mgmt_cli.clients import ClientFactory
+
+
+def test_factory_shares_one_client_per_region_across_threads():
+    factory = ClientFactory(max_pool_connections=64, read_timeout=7, retry_mode="adaptive")
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        clients = list(pool.map(lambda _: factory.get(region="us-east-1"), range(16)))
+    assert len({id(client) for client in clients}) == 1
+    assert factory.get(region="eu-west-1") is not clients[0]
+
+    config = clients[0].meta.config
+    assert config.max_pool_connections == 64
+    assert config.read_timeout == 7
+    assert config.retries["mode"] == "adaptive"
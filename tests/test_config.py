@@ -0,0 +1,42 @@
+from click.testing import CliRunner
+
+from secrets_mgmt_cli.cli import cli
+from secrets_mgmt_cli.config import SOURCE_FILE, ConfigHandler, read_config_defaults
+
+
+def _home(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    base = tmp_path / ".config"
+    ConfigHandler("alpha", verbose=False).write_config_file_from_dict({"A": "1"}, source="projects/dev/alpha")
+    ConfigHandler("beta", verbose=False).write_config_file_from_dict({"B": "2"})
+    (base / "gamma").mkdir()
+    (base / "not-a-dir").write_text("")
+    return base
+
+
+def test_ls_config_lists_dirs_and_values(tmp_path, monkeypatch):
+    base = _home(tmp_path, monkeypatch)
+    result = CliRunner().invoke(cli, ["ls", "--config"])
+    assert result.exit_code == 0, result.output
+    assert f"{base / 'alpha'} " in result.output
+    assert f"{base / 'gamma'} " in result.output and "no config file" in result.output
+    assert "not-a-dir" not in result.output
+    assert "a ................... 1" in result.output
+    assert "b ................... 2" in result.output
+
+
+def test_ls_config_transferred_only(tmp_path, monkeypatch):
+    base = _home(tmp_path, monkeypatch)
+    assert (base / "alpha" / SOURCE_FILE).read_text() == "projects/dev/alpha"
+    result = CliRunner().invoke(cli, ["ls", "--config", "--transferred"])
+    assert result.exit_code == 0, result.output
+    assert "alpha" in result.output
+    assert "beta" not in result.output and "gamma" not in result.output
+
+
+def test_read_config_defaults_sees_every_change(tmp_path, monkeypatch):
+    base = _home(tmp_path, monkeypatch)
+    path = base / "alpha" / "config"
+    assert read_config_defaults(path) == {"a": "1"}
+    path.write_text("[DEFAULT]\na = 22\n")
+    assert read_config_defaults(path) == {"a": "22"}
@@ -0,0 +1,70 @@
+import datetime
+
+import boto3
+from botocore.credentials import AssumeRoleCredentialFetcher, Credentials
+from botocore.stub import Stubber
+
+from secrets_mgmt_cli.clients import ClientFactory
+from secrets_mgmt_cli.credentials import CredentialCache
+
+ROLE_ARN = "arn:aws:iam::123456789012:role/dev"
+
+
+def assume_role_response(expires_in):
+    expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=expires_in)
+    return {
+        "Credentials": {
+            "AccessKeyId": "ASIAEXAMPLEEXAMPLE",
+            "SecretAccessKey": "secret",
+            "SessionToken": "token",
+            "Expiration": expiration,
+        },
+        "AssumedRoleUser": {"AssumedRoleId": "AROAEXAMPLEEXAMPLE:smgmt", "Arn": ROLE_ARN + "/smgmt"},
+    }
+
+
+def fetch(cache, responses):
+    session = boto3.session.Session(aws_access_key_id="a", aws_secret_access_key="b", region_name="us-east-1")
+    sts = session.client("sts")
+    stubber = Stubber(sts)
+    for response in responses:
+        stubber.add_response("assume_role", response)
+    with stubber:
+        fetcher = AssumeRoleCredentialFetcher(
+            lambda *args, **kwargs: sts, Credentials("a", "b"), ROLE_ARN, cache=cache
+        )
+        credentials = fetcher.fetch_credentials()
+        stubber.assert_no_pending_responses()
+    return credentials
+
+
+def test_assumed_role_credentials_are_shared_across_processes(tmp_path):
+    first = CredentialCache(tmp_path)
+    assert fetch(first, [assume_role_response(3600)])["access_key"] == "ASIAEXAMPLEEXAMPLE"
+    assert first.stats() == {"hits": 0, "misses": 1, "writes": 1}
+    (entry,) = tmp_path.glob("*.json")
+    assert entry.stat().st_mode & 0o777 == 0o600
+
+    # a new cache on the same directory stands in for the next invocation, it must not call STS
+    second = CredentialCache(tmp_path)
+    assert fetch(second, [])["token"] == "token"
+    assert second.stats() == {"hits": 1, "misses": 0, "writes": 0}
+
+
+def test_credentials_close_to_expiry_are_fetched_again(tmp_path):
+    cache = CredentialCache(tmp_path)
+    fetch(cache, [assume_role_response(600)])
+    fetch(cache, [assume_role_response(3600)])
+    assert cache.stats() == {"hits": 0, "misses": 2, "writes": 2}
+    assert len(list(tmp_path.glob("*.json"))) == 1
+
+
+def test_factory_installs_the_cache_on_role_providers(tmp_path, monkeypatch):
+    config = tmp_path / "config"
+    config.write_text(f"[profile dev]\nrole_arn = {ROLE_ARN}\nsource_profile = base\n[profile base]\n")
+    monkeypatch.setenv("AWS_CONFIG_FILE", str(config))
+    cache = CredentialCache(tmp_path / "credentials")
+    session = ClientFactory(credential_cache=cache).session("dev")
+    resolver = session._session.get_component("credential_provider")
+    assert resolver.get_provider("assume-role").cache is cache
+    assert resolver.get_provider("sso").cache is cache
@@ -0,0 +1,93 @@
+import time
+import threading
+
+import pytest
+from click.testing import CliRunner
+
+from benchmarks.fake_secretsmanager import FakeSecretsManager, make_client
+from secrets_mgmt_cli import aws as aws_module
+from secrets_mgmt_cli.aws import AwsSecretMgmt
+from secrets_mgmt_cli.cache import SecretCache
+from secrets_mgmt_cli.cli import cli
+from secrets_mgmt_cli.deadline import DeadlineExceededError, Hedger, LatencyTracker
+
+
+def test_hedge_answers_when_the_first_read_stalls():
+    calls = []
+    lock = threading.Lock()
+
+    def read():
+        with lock:
+            calls.append(time.monotonic())
+            first = len(calls) == 1
+        if first:
+            time.sleep(1)
+            return "slow"
+        return "fast"
+
+    hedger = Hedger(LatencyTracker(initial=0.05))
+    started = time.monotonic()
+    assert hedger.call(read, deadline=0.5, hedge=True) == "fast"
+    assert time.monotonic() - started < 0.4
+    assert hedger.stats()["hedged"] == 1
+    assert hedger.stats()["hedge_wins"] == 1
+
+
+def test_errors_before_the_hedge_are_not_retried():
+    hedger = Hedger(LatencyTracker(initial=0.5))
+    calls = []
+
+    def read():
+        calls.append(1)
+        raise KeyError("missing")
+
+    with pytest.raises(KeyError):
+        hedger.call(read, deadline=1, hedge=True)
+    assert len(calls) == 1
+
+
+def test_tracker_uses_recent_latencies_once_it_has_enough():
+    tracker = LatencyTracker(initial=1.0, min_samples=10)
+    assert tracker.p95() == 1.0
+    for i in range(100):
+        tracker.record(i / 1000)
+    assert tracker.p95() == pytest.approx(0.095)
+
+
+def test_deadline_falls_back_to_a_stale_value():
+    fake = FakeSecretsManager()
+    fake.seed(2)
+    cache = SecretCache(ttl=0)
+    aws = AwsSecretMgmt(client=make_client(fake), cache=cache)
+    aws.describe("projects/dev/project-000000")
+    fresh = aws.get_value()
+
+    fake.latency = 0.5
+    started = time.monotonic()
+    stale = aws._get_secret_value("projects/dev/project-000000", deadline=0.1)
+    assert time.monotonic() - started < 0.4
+    assert stale["SecretString"] == fresh["SecretString"]
+    assert cache.stats()["stale"] == 1
+
+    with pytest.raises(DeadlineExceededError):
+        aws.get_secret("projects/dev/project-000001", deadline=0.1)
+
+    values, errors = aws.get_many(["projects/dev/project-000000", "projects/dev/project-000001"], deadline=0.1)
+    assert list(values) == ["projects/dev/project-000000"]
+    assert errors["projects/dev/project-000001"].response["Error"]["Code"] == "DeadlineExceeded"
+
+
+def test_cli_reports_a_missed_deadline_without_a_traceback(monkeypatch, tmp_path):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("SMGMT_NO_AGENT", "1")
+    fake = FakeSecretsManager(latency=0.5)
+    fake.seed(1)
+    monkeypatch.setattr(aws_module, "_aws", AwsSecretMgmt(client=make_client(fake)))
+    args = ["--deadline", "0.1", "--cache-ttl", "60", "--stats", "--cache-stats"]
+    result = CliRunner().invoke(cli, args + ["pull-file", "-n", "projects/dev/project-000000"])
+
+    assert result.exit_code == 1
+    assert "Error: no answer for secret projects/dev/project-000000 within 0.1 seconds" in result.stderr
+    assert "Traceback" not in result.output
+    # --cache-stats adds nothing that --stats doesn't already print
+    assert result.stderr.count("cache: ") == 1
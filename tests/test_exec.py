@@ -0,0 +1,68 @@
+from click.testing import CliRunner
+
+from benchmarks.fake_secretsmanager import FakeSecretsManager, make_client
+from secrets_mgmt_cli import aws as aws_module
+from secrets_mgmt_cli.aws import AwsSecretMgmt
+from secrets_mgmt_cli.cli import cli
+
+
+def _run(monkeypatch, args):
+    fake = FakeSecretsManager()
+    fake.seed(2, keys=2)
+    fake.op_CreateSecret({"Name": "projects/dev/extra", "SecretString": '{"KEY_1": "override", "PORT": 8080}'})
+    monkeypatch.setattr(aws_module, "_aws", AwsSecretMgmt(client=make_client(fake)))
+    monkeypatch.setenv("SMGMT_NO_AGENT", "1")
+    calls = []
+    monkeypatch.setattr("os.execvpe", lambda file, args, env: calls.append((file, args, env)))
+    result = CliRunner().invoke(cli, ["exec", *args])
+    return result, calls
+
+
+def test_exec_merges_secrets_into_the_child_environment(monkeypatch):
+    monkeypatch.setenv("HOME_MARKER", "kept")
+    result, calls = _run(
+        monkeypatch, ["-n", "projects/dev/project-000000", "-n", "projects/dev/extra", "--", "env", "-0"]
+    )
+    assert result.exit_code == 0, result.output
+    [(file, args, env)] = calls
+    assert (file, args) == ("env", ("env", "-0"))
+    assert env["KEY_0"] == "value-0-0"
+    assert env["KEY_1"] == "override"
+    assert env["PORT"] == "8080"
+    assert env["HOME_MARKER"] == "kept"
+
+
+def test_exec_selects_and_prefixes_keys(monkeypatch):
+    result, calls = _run(
+        monkeypatch, ["-n", "projects/dev/extra", "-k", "PORT", "--key-prefix", "APP_", "printenv", "APP_PORT"]
+    )
+    assert result.exit_code == 0, result.output
+    [(file, args, env)] = calls
+    assert args == ("printenv", "APP_PORT")
+    assert env["APP_PORT"] == "8080" and "APP_KEY_1" not in env and "PORT" not in env
+
+
+def test_exec_fails_without_running_the_command(monkeypatch):
+    result, calls = _run(monkeypatch, ["-n", "projects/dev/missing", "true"])
+    assert result.exit_code == 1
+    assert "ResourceNotFoundException" in result.output
+    assert calls == []
+
+
+def test_exec_expands_a_bundle_into_its_projects(monkeypatch):
+    from secrets_mgmt_cli import bundles
+
+    fake = FakeSecretsManager()
+    fake.seed(2, keys=2)
+    aws = AwsSecretMgmt(client=make_client(fake))
+    bundles.pack(aws, "projects/dev", delete_sources=True)
+    monkeypatch.setattr(aws_module, "_aws", aws)
+    monkeypatch.setenv("SMGMT_NO_AGENT", "1")
+    calls = []
+    monkeypatch.setattr("os.execvpe", lambda file, args, env: calls.append((file, args, env)))
+
+    result = CliRunner().invoke(cli, ["exec", "-n", "projects/dev/.bundle-0000", "true"])
+    assert result.exit_code == 0, result.output
+    [(file, args, env)] = calls
+    # the later project overrides the earlier one, as with repeated -n
+    assert env["KEY_0"] == "value-1-0"
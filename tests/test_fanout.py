@@ -0,0 +1,96 @@
+import json
+import time
+
+import boto3
+from botocore.stub import Stubber
+from click.testing import CliRunner
+
+from benchmarks.fake_secretsmanager import FakeError, FakeSecretsManager, make_client
+from secrets_mgmt_cli.cli import cli
+from secrets_mgmt_cli.fanout import Target, resolve_targets
+
+REGIONS = ("us-east-1", "eu-west-1", "ap-southeast-2")
+
+
+def _fakes(monkeypatch, latency=0.0):
+    fakes = {}
+    for i, region in enumerate(REGIONS):
+        fakes[region] = FakeSecretsManager(latency=latency, region=region)
+        fakes[region].seed(i + 1, prefix=f"projects/{region}/")
+
+    # built up front, so that the timings below only measure the requests
+    clients = {region: make_client(fake, region=region) for region, fake in fakes.items()}
+
+    def build(self, profile=None, region=None):
+        return clients[region]
+
+    monkeypatch.setattr("secrets_mgmt_cli.clients.ClientFactory.get", build)
+    return fakes
+
+
+def test_resolve_targets():
+    assert resolve_targets((), ("us-east-1,eu-west-1", "us-east-1"), "dev") == [
+        Target("dev", "us-east-1"),
+        Target("dev", "eu-west-1"),
+    ]
+    assert resolve_targets(("a", "b"), ()) == [Target("a", None), Target("b", None)]
+
+
+def test_regions_all_skips_regions_the_account_has_not_enabled(monkeypatch, tmp_path):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    session = boto3.session.Session(aws_access_key_id="a", aws_secret_access_key="b", region_name="us-east-1")
+    ec2 = session.client("ec2")
+    stubber = Stubber(ec2)
+    stubber.add_response("describe_regions", {"Regions": [{"RegionName": "us-east-1"}, {"RegionName": "eu-west-1"}]})
+    monkeypatch.setattr(session, "client", lambda *args, **kwargs: ec2)
+    monkeypatch.setattr("secrets_mgmt_cli.clients.ClientFactory.session", lambda self, profile=None: session)
+    assert "af-south-1" in session.get_available_regions("secretsmanager")
+    with stubber:
+        assert resolve_targets((), ("all",)) == [Target(None, "eu-west-1"), Target(None, "us-east-1")]
+
+
+def test_ls_fans_out_concurrently_and_tags_records(monkeypatch):
+    _fakes(monkeypatch, latency=0.5)
+    started = time.perf_counter()
+    result = CliRunner().invoke(cli, ["ls", "--regions", ",".join(REGIONS), "--format", "ndjson"])
+    elapsed = time.perf_counter() - started
+
+    assert result.exit_code == 0, result.output
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert sorted((r["Region"], r["Account"]) for r in records) == sorted(
+        [("us-east-1", "123456789012")] + [("eu-west-1", "123456789012")] * 2 + [("ap-southeast-2", "123456789012")] * 3
+    )
+    assert all(r["Name"].startswith(f"projects/{r['Region']}/") for r in records)
+    # one ListSecrets call per region, made at the same time
+    assert elapsed < 0.5 * (len(REGIONS) - 1)
+
+
+def test_get_fan_out_reports_failed_targets(monkeypatch):
+    fakes = _fakes(monkeypatch)
+
+    def denied(body):
+        raise FakeError("AccessDeniedException", "not authorized")
+
+    fakes["eu-west-1"].op_ListSecrets = denied
+    result = CliRunner().invoke(cli, ["get", "--prefix", "projects/", "--regions", "us-east-1,eu-west-1"])
+
+    assert result.exit_code == 1
+    output = json.loads(result.stdout)
+    assert [(r["Region"], r["Name"], r["Value"]["KEY_0"]) for r in output] == [
+        ("us-east-1", "projects/us-east-1/project-000000", "value-0-0")
+    ]
+    assert "eu-west-1" in result.stderr and "AccessDeniedException" in result.stderr
+
+
+def test_unexpected_errors_fail_their_target(monkeypatch):
+    fakes = _fakes(monkeypatch)
+
+    def broken(body):
+        raise RuntimeError("bug")
+
+    fakes["eu-west-1"].op_ListSecrets = broken
+    result = CliRunner().invoke(cli, ["ls", "--regions", "us-east-1,eu-west-1", "--format", "ndjson"])
+
+    assert result.exit_code == 1
+    assert [json.loads(line)["Region"] for line in result.stdout.splitlines()] == ["us-east-1"]
+    assert "eu-west-1" in result.stderr and "bug" in result.stderr
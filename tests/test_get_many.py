@@ -0,0 +1,93 @@
+import json
+
+import boto3
+from botocore.stub import Stubber
+from click.testing import CliRunner
+
+from secrets_mgmt_cli import aws as aws_module
+from secrets_mgmt_cli.aws import AwsSecretMgmt
+from secrets_mgmt_cli.cli import cli
+
+
+def arn(name):
+    return f"arn:aws:secretsmanager:us-west-1:123456789012:secret:{name}-AbCdEf"
+
+
+def value(name, secret_string):
+    return {"ARN": arn(name), "Name": name, "SecretString": secret_string}
+
+
+def make_aws():
+    client = boto3.session.Session().client("secretsmanager", region_name="us-west-1")
+    return AwsSecretMgmt(client=client), Stubber(client)
+
+
+def test_get_many_batches_in_chunks_of_20():
+    aws, stubber = make_aws()
+    names = [f"projects/dev/p{i:02}" for i in range(25)]
+    # the last name of the first chunk fails on its own
+    missing = {"SecretId": names[19], "ErrorCode": "ResourceNotFoundException", "Message": "not found"}
+    stubber.add_response(
+        "batch_get_secret_value",
+        {"SecretValues": [value(name, "{}") for name in names[:19]], "Errors": [missing]},
+        {"SecretIdList": names[:20]},
+    )
+    stubber.add_response(
+        "batch_get_secret_value",
+        {"SecretValues": [value(name, "{}") for name in names[20:]], "Errors": []},
+        {"SecretIdList": names[20:]},
+    )
+    aws.max_workers = 1
+    with stubber:
+        values, errors = aws.get_many(names)
+    assert sorted(values) == names[:19] + names[20:]
+    assert errors[names[19]].response["Error"]["Code"] == "ResourceNotFoundException"
+
+
+def test_get_many_falls_back_to_get_secret_value():
+    aws, stubber = make_aws()
+    stubber.add_client_error("batch_get_secret_value", "AccessDeniedException")
+    stubber.add_response("get_secret_value", value("a", '{"k": "v"}'), {"SecretId": "a"})
+    aws.max_workers = 1
+    with stubber:
+        values, errors = aws.get_many(["a"])
+    assert aws_module.parse_secret_value(values["a"]) == {"k": "v"}
+    assert errors == {}
+    assert not aws._batch_supported
+
+
+def test_get_command_with_prefix(monkeypatch):
+    aws, stubber = make_aws()
+    monkeypatch.setattr(aws_module, "_aws", aws)
+    stubber.add_response(
+        "list_secrets",
+        {"SecretList": [{"Name": "projects/dev/a"}, {"Name": "projects/Dev/b"}]},
+        {"Filters": [{"Key": "name", "Values": ["projects/dev/"]}]},
+    )
+    stubber.add_response(
+        "batch_get_secret_value",
+        {"SecretValues": [value("projects/dev/a", '{"k": "v"}')], "Errors": []},
+        {"SecretIdList": ["projects/dev/a"]},
+    )
+    with stubber:
+        result = CliRunner().invoke(cli, ["get", "--prefix", "projects/dev/"])
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.output) == {"projects/dev/a": {"k": "v"}}
+
+
+def test_get_many_keeps_other_chunks_when_one_cannot_connect(monkeypatch):
+    from botocore.exceptions import EndpointConnectionError
+
+    aws, _ = make_aws()
+    names = [f"projects/dev/p{i:02}" for i in range(30)]
+
+    def batch_get(chunk):
+        if names[0] in chunk:
+            raise EndpointConnectionError(endpoint_url="https://secretsmanager.us-west-1.amazonaws.com")
+        return {name: value(name, "{}") for name in chunk}, {}
+
+    monkeypatch.setattr(aws, "_batch_get", batch_get)
+    values, errors = aws.get_many(names)
+    assert sorted(values) == names[20:]
+    assert sorted(errors) == names[:20]
+    assert errors[names[0]].response["Error"]["Code"] == "EndpointConnectionError"
@@ -0,0 +1,56 @@
+import json
+
+import boto3
+from botocore.stub import Stubber
+from click.testing import CliRunner
+
+from secrets_mgmt_cli import aws as aws_module
+from secrets_mgmt_cli.aws import AwsSecretMgmt
+from secrets_mgmt_cli.cli import cli
+from secrets_mgmt_cli.envfiles import collect
+
+ARN = "arn:aws:secretsmanager:us-west-1:123456789012:secret:projects/dev/api-AbCdEf"
+
+
+def make_tree(root):
+    (root / "api").mkdir()
+    (root / "api" / ".env").write_text("A=1\nB='two words'\n")
+    (root / "api" / ".envrc").write_text("# comment\nexport B=2 # inline\nsource_up\nAWS_KEY=x\n")
+    (root / "web" / "node_modules" / "pkg").mkdir(parents=True)
+    (root / "web" / ".envrc").write_text('export URL="http://localhost"\n')
+    (root / "web" / "node_modules" / "pkg" / ".env").write_text("IGNORED=1\n")
+
+
+def test_collect_merges_env_files_per_directory(tmp_path):
+    make_tree(tmp_path)
+    assert collect(str(tmp_path), "projects/dev", skip_key="KEY") == {
+        "projects/dev/api": {"A": "1", "B": "2"},
+        "projects/dev/web": {"URL": "http://localhost"},
+    }
+
+
+def test_import_creates_missing_and_skips_unchanged(monkeypatch, tmp_path):
+    make_tree(tmp_path)
+    client = boto3.session.Session().client("secretsmanager", region_name="us-west-1")
+    aws = AwsSecretMgmt(client=client)
+    aws.max_workers = 1
+    monkeypatch.setattr(aws_module, "_aws", aws)
+    stubber = Stubber(client)
+    names = ["projects/dev/api", "projects/dev/web"]
+    batch = {
+        "SecretValues": [{"Name": names[0], "ARN": ARN, "SecretString": json.dumps({"B": "2", "A": "1"})}],
+        "Errors": [{"SecretId": names[1], "ErrorCode": "ResourceNotFoundException", "Message": "missing"}],
+    }
+    stubber.add_response("batch_get_secret_value", batch, {"SecretIdList": names})
+    stubber.add_response("batch_get_secret_value", batch, {"SecretIdList": names})
+    stubber.add_response(
+        "create_secret", {"Name": names[1]}, {"Name": names[1], "SecretString": '{"URL": "http://localhost"}'}
+    )
+
+    runner = CliRunner()
+    with stubber:
+        dry_run = runner.invoke(cli, ["import", str(tmp_path), "--skip-key", "KEY", "--dry-run"])
+        result = runner.invoke(cli, ["import", str(tmp_path), "--skip-key", "KEY"])
+        stubber.assert_no_pending_responses()
+    assert dry_run.output.splitlines() == ["create projects/dev/web +URL", "create: 1, unchanged: 1"]
+    assert result.exit_code == 0, result.output
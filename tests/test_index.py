@@ -0,0 +1,60 @@
+import datetime
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from secrets_mgmt_cli.aws import AwsSecretMgmt
+from secrets_mgmt_cli.index import SecretIndex
+
+
+def secret(name, day, tags=()):
+    return {
+        "Name": name,
+        "LastChangedDate": datetime.datetime(2022, 6, day, tzinfo=datetime.timezone.utc),
+        "Tags": [{"Key": key, "Value": value} for key, value in tags],
+    }
+
+
+def test_incremental_sync_and_search(tmp_path):
+    client = boto3.session.Session().client("secretsmanager", region_name="us-west-1")
+    stubber = Stubber(client)
+    stubber.add_response(
+        "list_secrets",
+        {"SecretList": [secret("projects/dev/a", 1, [("team", "data")]), secret("projects/dev/b", 2)]},
+        {},
+    )
+    incremental = {"SortBy": "last-changed-date", "SortOrder": "desc", "IncludePlannedDeletion": True}
+    stubber.add_response(
+        "list_secrets",
+        {
+            "SecretList": [
+                secret("projects/dev/c", 5),
+                dict(secret("projects/dev/a", 4), DeletedDate=datetime.datetime(2022, 6, 4)),
+                secret("projects/dev/b", 2),
+                secret("projects/dev/old", 1),
+            ]
+        },
+        incremental,
+    )
+    index = SecretIndex(tmp_path / "index.sqlite3")
+    with stubber:
+        aws = AwsSecretMgmt(client=client)
+        assert index.sync(aws) == 2
+        assert [s["Name"] for s in index.search(tag_key=["TEAM"])] == ["projects/dev/a"]
+        assert index.sync(aws) == 3
+        stubber.assert_no_pending_responses()
+    assert [s["Name"] for s in index.search()] == ["projects/dev/b", "projects/dev/c"]
+    assert [s["Name"] for s in index.search(pattern=r"/c$")] == ["projects/dev/c"]
+    assert index.age() < 60
+
+
+def test_each_profile_and_region_has_its_own_index(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    west = SecretIndex(scope="default@us-west-1")
+    europe = SecretIndex(scope="default@eu-west-1")
+    assert west.path != europe.path
+
+    client = boto3.session.Session().client("secretsmanager", region_name="eu-west-1")
+    with pytest.raises(ValueError, match="default@us-west-1"):
+        west.sync(AwsSecretMgmt(client=client))
@@ -0,0 +1,32 @@
+import json
+
+from click.testing import CliRunner
+
+from benchmarks.fake_secretsmanager import FakeSecretsManager, make_client
+from secrets_mgmt_cli import aws as aws_module
+from secrets_mgmt_cli.cli import cli
+from secrets_mgmt_cli.instrumentation import recorder
+
+
+def test_stats_and_trace(monkeypatch, tmp_path):
+    monkeypatch.setattr(recorder, "enabled", False)
+    monkeypatch.setattr(recorder, "spans", [])
+    monkeypatch.setattr(recorder, "operations", {})
+    monkeypatch.setenv("HOME", str(tmp_path))
+    fake = FakeSecretsManager(throttle_rate=0.5, seed=1)
+    fake.seed(3)
+    monkeypatch.setattr(aws_module, "_aws", None)
+
+    def build(profile=None, region=None):
+        return make_client(fake, retries={"mode": "standard", "max_attempts": 10})
+
+    monkeypatch.setattr("secrets_mgmt_cli.clients.ClientFactory.get", lambda self, *args: build(*args))
+    trace = tmp_path / "trace.json"
+    result = CliRunner().invoke(cli, ["--stats", "--trace", str(trace), "transfer", "--all"])
+
+    assert result.exit_code == 0, result.output
+    assert "BatchGetSecretValue" in result.output and "config.write" in result.output
+    events = json.loads(trace.read_text())["traceEvents"]
+    names = {event["name"] for event in events}
+    assert {"transfer", "ListSecrets", "BatchGetSecretValue", "config.write"} <= names
+    assert sum(event["args"].get("retries", 0) for event in events) == fake.throttled
@@ -0,0 +1,23 @@
+import io
+import json
+
+from secrets_mgmt_cli.output import write_records
+
+
+def records():
+    yield {"Name": "a", "Tags": [{"Key": "k", "Value": "v"}]}
+    yield {"Name": "b"}
+
+
+def test_write_records_formats():
+    stream = io.StringIO()
+    assert write_records(records(), "json", ["Name"], stream) == 2
+    assert json.loads(stream.getvalue()) == [{"Name": "a"}, {"Name": "b"}]
+
+    stream = io.StringIO()
+    write_records(records(), "csv", ["Name", "Tags"], stream)
+    assert stream.getvalue().splitlines() == ["Name,Tags", 'a,"[{""Key"": ""k"", ""Value"": ""v""}]"', "b,"]
+
+    stream = io.StringIO()
+    write_records(iter(()), "json", None, stream)
+    assert json.loads(stream.getvalue()) == []
@@ -0,0 +1,64 @@
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from benchmarks.fake_secretsmanager import FakeError, FakeSecretsManager, make_client
+from secrets_mgmt_cli.aws import AwsSecretMgmt
+from secrets_mgmt_cli.ratelimit import RateController, TokenBucket
+
+
+def test_throttles_back_off_and_retry():
+    controller = RateController(concurrency=8, base_delay=0.001)
+    outcomes = ["ThrottlingException", "ThrottlingException", None]
+
+    def flaky():
+        code = outcomes.pop(0)
+        if code is not None:
+            raise ClientError({"Error": {"Code": code, "Message": "slow down"}}, "PutSecretValue")
+        return "ok"
+
+    assert controller.call("put_secret_value", flaky) == "ok"
+    stats = controller.stats()
+    assert stats["throttles"] == 2
+    assert stats["concurrency"] == 2
+    assert stats["rates"]["put_secret_value"] == 50 / 4 + 1
+
+
+def test_other_errors_are_not_retried():
+    controller = RateController()
+    calls = []
+
+    def missing():
+        calls.append(1)
+        raise ClientError({"Error": {"Code": "ResourceNotFoundException", "Message": ""}}, "GetSecretValue")
+
+    with pytest.raises(ClientError):
+        controller.call("get_secret_value", missing)
+    assert len(calls) == 1
+
+
+def test_token_bucket_paces_calls():
+    bucket = TokenBucket(rate=100, burst=1)
+    started = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.monotonic() - started >= 0.045
+
+
+def test_a_shared_client_reports_each_throttle_to_the_calling_controller_once():
+    fake = FakeSecretsManager()
+    fake.seed(1)
+    client = make_client(fake, retries={"mode": "standard", "max_attempts": 3})
+    first, second, third = (AwsSecretMgmt(client=client) for _ in range(3))
+    describe = fake.op_DescribeSecret
+    outcomes = [FakeError("ThrottlingException", "Rate exceeded")]
+
+    def throttle_once(body):
+        if outcomes:
+            raise outcomes.pop()
+        return describe(body)
+
+    fake.op_DescribeSecret = throttle_once
+    first._call("describe_secret", SecretId="projects/dev/project-000000")
+    assert [aws.limiter.throttles for aws in (first, second, third)] == [1, 0, 0]
@@ -0,0 +1,78 @@
+import json
+import string
+
+import pytest
+from click.testing import CliRunner
+
+from benchmarks.fake_secretsmanager import FakeSecretsManager, make_client
+from secrets_mgmt_cli import aws as aws_module
+from secrets_mgmt_cli.aws import AwsSecretMgmt
+from secrets_mgmt_cli.cli import cli
+from secrets_mgmt_cli.rotate import Checkpoint, generate_password
+
+
+def test_generate_password_follows_character_class_options():
+    password = generate_password(length=40, exclude_punctuation=True, exclude_characters="abc")
+    assert len(password) == 40
+    assert not set(password) & set(string.punctuation + "abc")
+    assert set(password) & set(string.digits) and set(password) & set(string.ascii_uppercase)
+
+    digits_only = generate_password(length=4, exclude_lowercase=True, exclude_uppercase=True, exclude_punctuation=True)
+    assert set(digits_only) <= set(string.digits)
+    with pytest.raises(ValueError):
+        generate_password(length=3, include_space=True)
+
+
+def test_rotate_stages_verifies_promotes_and_resumes(monkeypatch, tmp_path):
+    fake = FakeSecretsManager()
+    fake.seed(3, keys=1)
+    monkeypatch.setattr(aws_module, "_aws", AwsSecretMgmt(client=make_client(fake)))
+    monkeypatch.setenv("SMGMT_NO_AGENT", "1")
+    fake.op_CreateSecret({"Name": "projects/dev/.bundle-0000", "SecretString": "SMGMT-BUNDLE 1"})
+    checkpoint = tmp_path / "rotate.jsonl"
+    args = ["rotate", "--prefix", "projects/dev/", "--key", "KEY_0", "--checkpoint", str(checkpoint)]
+    refuse_one = 'grep -q KEY_0 && test "$SMGMT_SECRET_NAME" != projects/dev/project-000001'
+
+    result = CliRunner().invoke(cli, args + ["--verify", refuse_one])
+    assert result.exit_code == 1
+    assert "rotated: 2, failed: 1" in result.output
+    states = {name: entry["state"] for name, entry in Checkpoint(checkpoint).entries.items()}
+    assert states == {
+        "projects/dev/project-000000": "done",
+        "projects/dev/project-000001": "failed",
+        "projects/dev/project-000002": "done",
+    }
+
+    fake.reset_calls()
+    result = CliRunner().invoke(cli, args + ["--verify", "true"])
+    assert result.exit_code == 0, result.output
+    assert "rotated: 3, failed: 0" in result.output
+    assert fake.calls["PutSecretValue"] == 1
+    assert not checkpoint.exists()
+
+    for i in range(3):
+        name = f"projects/dev/project-{i:06d}"
+        value = json.loads(fake.op_GetSecretValue({"SecretId": name})["SecretString"])
+        assert value["KEY_0"] != f"value-{i}-0" and len(value["KEY_0"]) == 32
+        stages = fake.op_DescribeSecret({"SecretId": name})["VersionIdsToStages"]
+        assert sorted(label for labels in stages.values() for label in labels) == ["AWSCURRENT", "AWSPREVIOUS"]
+
+
+def test_checkpoint_appends_changes_and_skips_a_cut_line(tmp_path):
+    path = tmp_path / "rotate.jsonl"
+    checkpoint = Checkpoint(path)
+    checkpoint.update("a", state="staged", version="v1")
+    checkpoint.update("b", state="failed", error="denied")
+    checkpoint.update("a", state="done")
+    assert len(path.read_text().splitlines()) == 3
+
+    with open(path, "a") as f:
+        f.write('{"name": "b", "sta')
+    resumed = Checkpoint(path)
+    assert resumed.entries == {
+        "a": {"state": "done", "version": "v1"},
+        "b": {"state": "failed", "error": "denied"},
+    }
+
+    resumed.update("b", state="promoted")
+    assert Checkpoint(path).get("b") == {"state": "promoted", "error": "denied"}
@@ -1,3 +1,6 @@
+import sys
+import subprocess
+
 from click.testing import CliRunner
 from secrets_mgmt_cli.cli import cli
 
@@ -8,3 +11,17 @@ def test_version():
         result = runner.invoke(cli, ["--version"])
         assert result.exit_code == 0
         assert result.output.startswith("cli, version ")
+
+
+def test_help_does_not_import_boto3():
+    # run in a fresh interpreter, other tests in this session have already imported boto3
+    code = (
+        "import sys\n"
+        "from click.testing import CliRunner\n"
+        "from secrets_mgmt_cli.cli import cli\n"
+        "for args in (['--help'], ['--version'], ['ls', '--help'], ['read']):\n"
+        "    CliRunner().invoke(cli, args)\n"
+        "assert 'boto3' not in sys.modules, 'boto3 imported at startup'\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
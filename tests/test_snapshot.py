@@ -0,0 +1,91 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from benchmarks.fake_secretsmanager import FakeSecretsManager, make_client
+from secrets_mgmt_cli import aws as aws_module
+from secrets_mgmt_cli.aws import AwsSecretMgmt
+from secrets_mgmt_cli.cli import cli
+
+pytest.importorskip("cryptography")
+
+
+@pytest.fixture
+def fake(monkeypatch, tmp_path):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("SMGMT_NO_AGENT", "1")
+    monkeypatch.delenv("SMGMT_SNAPSHOT_KEY", raising=False)
+    fake = FakeSecretsManager()
+    fake.seed(50, keys=2)
+    monkeypatch.setattr(aws_module, "_aws", AwsSecretMgmt(client=make_client(fake)))
+    return fake
+
+
+def test_export_then_read_without_calling_aws(fake, tmp_path):
+    from secrets_mgmt_cli.snapshot import Snapshot
+
+    path, key_file = tmp_path / "dev.snap", tmp_path / "dev.key"
+    runner = CliRunner()
+    result = runner.invoke(cli, ["snapshot", "export", "--prefix", "projects/dev/", "-o", path, "--key-file", key_file])
+    assert result.exit_code == 0, result.output
+    assert "exported: 50, failed: 0" in result.output
+    assert key_file.stat().st_mode & 0o777 == 0o600
+    assert b"project-000007" not in path.read_bytes()
+
+    snapshot = Snapshot(path, key_file.read_bytes())
+    assert len(snapshot.names()) == 50
+    assert snapshot.entry("projects/dev/project-000007")["metadata"]["Name"] == "projects/dev/project-000007"
+
+    fake.reset_calls()
+    offline = ["--snapshot", str(path), "--snapshot-key-file", str(key_file)]
+    result = runner.invoke(cli, offline + ["get", "-n", "projects/dev/project-000007", "-n", "projects/dev/nope"])
+    assert result.exit_code == 1
+    assert json.loads(result.stdout) == {"projects/dev/project-000007": {"KEY_0": "value-7-0", "KEY_1": "value-7-1"}}
+    assert "projects/dev/nope" in result.stderr
+    result = runner.invoke(cli, offline + ["transfer", "--all"])
+    assert result.exit_code == 0, result.output
+    assert "updated: 50" in result.output
+    assert sum(fake.calls.values()) == 0
+
+    result = runner.invoke(cli, offline + ["ls"])
+    assert result.exit_code == 2
+    assert "--snapshot only serves" in result.output
+
+
+def test_wrong_key_is_refused(fake, tmp_path):
+    from cryptography.fernet import Fernet
+
+    from secrets_mgmt_cli.snapshot import Snapshot, export
+
+    path = tmp_path / "dev.snap"
+    export(aws_module._aws, "projects/dev/", path, Fernet.generate_key())
+    with pytest.raises(ValueError, match="can't be decrypted"):
+        Snapshot(path, Fernet.generate_key())
+
+
+def test_restore_writes_only_what_differs(fake, tmp_path, monkeypatch):
+    from cryptography.fernet import Fernet
+
+    key = Fernet.generate_key().decode("ascii")
+    monkeypatch.setenv("SMGMT_SNAPSHOT_KEY", key)
+    path = tmp_path / "dev.snap"
+    runner = CliRunner()
+    result = runner.invoke(cli, ["snapshot", "export", "--prefix", "projects/dev/", "-o", path])
+    assert result.exit_code == 0, result.output
+
+    fake.op_PutSecretValue({"SecretId": "projects/dev/project-000001", "SecretString": "{}"})
+    fake.op_DeleteSecret({"SecretId": "projects/dev/project-000002", "ForceDeleteWithoutRecovery": True})
+    fake.op_DeleteSecret({"SecretId": "projects/dev/project-000003"})
+
+    result = runner.invoke(cli, ["snapshot", "restore", str(path), "--dry-run"])
+    assert "create: 1, restore: 1, unchanged: 47, update: 1" in result.output
+    assert "projects/dev/project-000002" not in fake._secrets
+
+    result = runner.invoke(cli, ["snapshot", "restore", str(path)])
+    assert result.exit_code == 0, result.output
+    for number in (1, 2, 3):
+        value = fake.op_GetSecretValue({"SecretId": f"projects/dev/project-{number:06d}"})["SecretString"]
+        assert json.loads(value) == {"KEY_0": f"value-{number}-0", "KEY_1": f"value-{number}-1"}
+    result = runner.invoke(cli, ["snapshot", "restore", str(path)])
+    assert "unchanged: 50" in result.output
@@ -0,0 +1,66 @@
+import boto3
+from botocore.stub import Stubber
+from click.testing import CliRunner
+
+from secrets_mgmt_cli import aws as aws_module
+from secrets_mgmt_cli.aws import AwsSecretMgmt
+from secrets_mgmt_cli.cli import cli
+from secrets_mgmt_cli.config import SOURCE_FILE
+
+
+def arn(name):
+    return f"arn:aws:secretsmanager:us-west-1:123456789012:secret:{name}-AbCdEf"
+
+
+def add_project_responses(stubber, values):
+    names = sorted(values)
+    stubber.add_response(
+        "list_secrets",
+        {"SecretList": [{"Name": name} for name in names]},
+        {"Filters": [{"Key": "name", "Values": ["projects/dev/"]}]},
+    )
+    stubber.add_response(
+        "batch_get_secret_value",
+        {"SecretValues": [{"Name": n, "ARN": arn(n), "SecretString": values[n]} for n in names], "Errors": []},
+        {"SecretIdList": names},
+    )
+
+
+def test_transfer_all_rewrites_only_changed_projects(monkeypatch, tmp_path):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    client = boto3.session.Session().client("secretsmanager", region_name="us-west-1")
+    monkeypatch.setattr(aws_module, "_aws", AwsSecretMgmt(client=client))
+    stubber = Stubber(client)
+    add_project_responses(stubber, {"projects/dev/a": '{"key": "1"}', "projects/dev/b": '"not a dict"'})
+    add_project_responses(stubber, {"projects/dev/a": '{"key": "1"}', "projects/dev/c": '{"key": "2"}'})
+
+    runner = CliRunner()
+    with stubber:
+        first = runner.invoke(cli, ["transfer", "--all"])
+        mtime = (tmp_path / ".config" / "a" / "config").stat().st_mtime_ns
+        second = runner.invoke(cli, ["transfer", "--all"])
+
+    assert first.exit_code == 1
+    assert "updated: 1, unchanged: 0, failed: 1" in first.output
+    assert second.exit_code == 0, second.output
+    assert "updated: 1, unchanged: 1, failed: 0" in second.output
+    assert (tmp_path / ".config" / "a" / "config").stat().st_mtime_ns == mtime
+    assert (tmp_path / ".config" / "c" / "config").read_text() == "[DEFAULT]\nkey = 2\n\n"
+    assert sorted(p.name for p in (tmp_path / ".config" / "c").iterdir()) == [SOURCE_FILE, "config"]
+
+
+def test_transfer_all_refuses_names_that_leave_the_config_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    client = boto3.session.Session().client("secretsmanager", region_name="us-west-1")
+    monkeypatch.setattr(aws_module, "_aws", AwsSecretMgmt(client=client))
+    stubber = Stubber(client)
+    add_project_responses(stubber, {"projects/dev/../../.ssh": '{"key": "1"}', "projects/dev/a": '{"key": "2"}'})
+
+    with stubber:
+        result = CliRunner().invoke(cli, ["transfer", "--all"])
+
+    assert result.exit_code == 1
+    assert "updated: 1, unchanged: 0, failed: 1" in result.output
+    assert "invalid project name '../../.ssh'" in result.output
+    assert not (tmp_path / ".ssh").exists()
+    assert sorted(p.name for p in (tmp_path / ".config").iterdir()) == ["a"]
@@ -0,0 +1,61 @@
+import json
+
+from click.testing import CliRunner
+
+from benchmarks.fake_secretsmanager import FakeSecretsManager, make_client
+from secrets_mgmt_cli import aws as aws_module
+from secrets_mgmt_cli.aws import AwsSecretMgmt
+from secrets_mgmt_cli.cli import cli
+
+NAME = "projects/dev/project-000000"
+
+
+def _fake(monkeypatch):
+    fake = FakeSecretsManager()
+    fake.seed(1, keys=2)
+    monkeypatch.setattr(aws_module, "_aws", AwsSecretMgmt(client=make_client(fake)))
+    monkeypatch.setenv("SMGMT_NO_AGENT", "1")
+    fake.reset_calls()
+    return fake
+
+
+def _current(fake):
+    return json.loads(fake.op_GetSecretValue({"SecretId": NAME})["SecretString"])
+
+
+def test_update_sets_and_unsets_keys(monkeypatch):
+    fake = _fake(monkeypatch)
+    result = CliRunner().invoke(
+        cli, ["update", "-n", NAME, "--set", "KEY_0=new", "--set", "URL=a=b", "--unset", "KEY_1"]
+    )
+    assert result.exit_code == 0, result.output
+    assert _current(fake) == {"KEY_0": "new", "URL": "a=b"}
+    stages = fake.op_DescribeSecret({"SecretId": NAME})["VersionIdsToStages"]
+    assert sorted(map(sorted, stages.values())) == [["AWSCURRENT", "SMGMT_UPDATE"], ["AWSPREVIOUS"]]
+
+
+def test_update_skips_unchanged_values(monkeypatch):
+    fake = _fake(monkeypatch)
+    result = CliRunner().invoke(cli, ["update", "-n", NAME, "--set", "KEY_0=value-0-0", "--unset", "MISSING"])
+    assert result.exit_code == 0, result.output
+    assert "unchanged" in result.output
+    reordered = json.dumps({"KEY_1": "value-0-1", "KEY_0": "value-0-0"}, indent=2)
+    result = CliRunner().invoke(cli, ["update", "-n", NAME, "-s", reordered])
+    assert "unchanged" in result.output
+    assert fake.calls == {"GetSecretValue": 2}
+
+
+def test_update_detects_concurrent_writers(monkeypatch):
+    fake = _fake(monkeypatch)
+    put = fake.op_PutSecretValue
+
+    def racing_put(body):
+        # another writer makes a new current version between our read and our write
+        put({"SecretId": NAME, "SecretString": '{"KEY_0": "theirs"}'})
+        return put(body)
+
+    monkeypatch.setattr(fake, "op_PutSecretValue", racing_put)
+    result = CliRunner().invoke(cli, ["update", "-n", NAME, "--set", "KEY_0=ours"])
+    assert result.exit_code == 1
+    assert "changed since version" in result.output
+    assert _current(fake) == {"KEY_0": "theirs"}
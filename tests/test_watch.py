@@ -0,0 +1,68 @@
+from benchmarks.fake_secretsmanager import FakeSecretsManager, make_client
+from secrets_mgmt_cli.aws import AwsSecretMgmt
+from secrets_mgmt_cli.watch import Watcher
+
+
+def test_watch_fetches_only_changed_secrets(monkeypatch, tmp_path):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    fake = FakeSecretsManager()
+    fake.seed(3, keys=1)
+    hooked = tmp_path / "hooked"
+    watcher = Watcher(
+        AwsSecretMgmt(client=make_client(fake)), "projects/dev", hook=f'echo "$SMGMT_PROJECT" >> {hooked}'
+    )
+
+    assert len(watcher.poll()) == 3
+    assert (tmp_path / ".config" / "project-000001" / "config").read_text() == "[DEFAULT]\nkey_0 = value-1-0\n\n"
+
+    fake.reset_calls()
+    assert watcher.poll() == []
+    assert dict(fake.calls) == {"ListSecrets": 1}
+
+    fake.op_PutSecretValue({"SecretId": "projects/dev/project-000001", "SecretString": '{"KEY_0": "new"}'})
+    fake.reset_calls()
+    assert watcher.poll() == ["projects/dev/project-000001"]
+    assert fake.calls["ListSecrets"] == 1
+    assert fake.calls["BatchGetSecretValue"] == 1
+    assert (tmp_path / ".config" / "project-000001" / "config").read_text() == "[DEFAULT]\nkey_0 = new\n\n"
+    hooked_projects = hooked.read_text().split()
+    assert sorted(hooked_projects[:3]) == ["project-000000", "project-000001", "project-000002"]
+    assert hooked_projects[3:] == ["project-000001"]
+
+
+def test_watch_backs_off_while_polls_fail(monkeypatch, tmp_path):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    fake = FakeSecretsManager(throttle_rate=1.0)
+    delays = []
+    client = make_client(fake, retries={"mode": "standard", "total_max_attempts": 1})
+    watcher = Watcher(AwsSecretMgmt(client=client), "projects/dev", interval=10, max_interval=60, sleep=delays.append)
+    watcher.run(polls=5)
+    assert [round(delay / d) for delay, d in zip(delays, (20, 40, 60, 60))] == [1, 1, 1, 1]
+
+
+def test_watch_forgets_deleted_secrets_and_skips_unsafe_names(monkeypatch, tmp_path):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    fake = FakeSecretsManager()
+    fake.seed(2, keys=1)
+    fake.op_CreateSecret({"Name": "projects/dev/../../.ssh", "SecretString": '{"KEY_0": "x"}'})
+    watcher = Watcher(AwsSecretMgmt(client=make_client(fake)), "projects/dev")
+
+    assert sorted(watcher.poll()) == ["projects/dev/project-000000", "projects/dev/project-000001"]
+    assert not (tmp_path / ".ssh").exists()
+
+    fake.op_DeleteSecret({"SecretId": "projects/dev/project-000000"})
+    watcher.poll()
+    assert "projects/dev/project-000000" not in watcher.versions
+
+
+def test_watch_reads_the_whole_prefix_without_sort_support(monkeypatch, tmp_path):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    fake = FakeSecretsManager()
+    fake.seed(3, keys=1)
+    aws = AwsSecretMgmt(client=make_client(fake))
+    monkeypatch.setattr(aws, "can_sort_list", lambda: False)
+    watcher = Watcher(aws, "projects/dev")
+    assert len(watcher.poll()) == 3
+
+    fake.op_PutSecretValue({"SecretId": "projects/dev/project-000002", "SecretString": '{"KEY_0": "new"}'})
+    assert watcher.poll() == ["projects/dev/project-000002"]